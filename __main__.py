@@ -1,42 +1,107 @@
-from src.vocabulary_scraper import VocabularyScraper
-from src.grammar_scraper import GrammarScraper
+"""
+Command line entry point, `python . [command] [options]`
 
-from src.vocabulary_deck_generator import VocabularyDeckGenerator
-from src.grammar_deck_generator import GrammarDeckGenerator
+Only argparse is imported to read the command line. Each command imports what it runs once it is chosen, so `--help`
+starts straight away and a deck-only run never loads the scrapers or the network stack. Without a command, the
+options are those of `run`, as they were before there were commands.
+"""
+from typing import List, Optional
+import argparse
+import importlib
+import sys
 
 
-def scraper():
-    LEVELS_TO_SCRAP = [
-        'n5',
-        'n4',
-        # 'n3',
-        # 'n2',
-        # 'n1'
-    ]
+LEVELS = ['n5', 'n4', 'n3', 'n2', 'n1']
+DEFAULT_LEVELS = ['n5', 'n4']
+LESSON_TYPES = ['vocabulary', 'grammar']
+STAGES = ['scrape', 'decks']
 
-    for level in LEVELS_TO_SCRAP:
-        # VocabularyScraper(level).scrape()
-        GrammarScraper(level).scrape()
+# commands handed to another module's command line, with everything after the command name
+FORWARDED_COMMANDS = {
+    'index': ('src.corpus_index', "search the scraped lists"),
+    'diff': ('src.snapshot_diff', "show what changed between two snapshots of the lists"),
+    'queue': ('src.work_queue', "scrape through a work queue shared by worker processes"),
+}
+COMMANDS = ['run', 'scrape', 'decks', *FORWARDED_COMMANDS]
 
-    print("JLPT Sensei scraping complete.")
 
+def job_options() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--levels', nargs='+', choices=LEVELS, default=DEFAULT_LEVELS, help="JLPT levels to process (default: n5 n4)")
+    parser.add_argument('--types', nargs='+', choices=LESSON_TYPES, default=LESSON_TYPES, help="lesson types to process (default: both)")
+    parser.add_argument('--jobs', type=int, default=None, help="(level, type) jobs to run at once (default: all of them)")
+    parser.add_argument('--report', default=None, help="where to write the JSON run report (default: data/reports/run-<utc time>.json)")
+    parser.add_argument('--profile', default=None, help="profile the run with cProfile and save the stats to this file")
+    return parser
 
-def deck_generator():
-    LEVELS_TO_GENERATE = [
-        'n5',
-        'n4',
-        # 'n3',
-        # 'n2',
-        # 'n1'
-    ]
 
-    for level in LEVELS_TO_GENERATE:
-        # VocabularyDeckGenerator(level).main()
-        GrammarDeckGenerator(level).main()
-    
-    print("Finished generating anki decks.")
+def scrape_options() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent requests shared by all scrape jobs")
+    parser.add_argument('--rate', type=float, default=10.0, help="maximum requests per second to the site")
+    parser.add_argument('--retries', type=int, default=4, help="times a failed or throttled request is retried, with backoff")
+    parser.add_argument('--base-url', default=None, help="site to scrape, e.g. a local mirror (default: https://jlptsensei.com)")
+    parser.add_argument('--offline', action='store_true', help="serve scrapes only from the HTTP cache")
+    return parser
+
+
+def deck_options() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--combined', action='store_true', help="build one .apkg with a subdeck per level and type instead of one per job")
+    parser.add_argument('--image-size', type=int, nargs=2, default=[600, 600], metavar=('WIDTH', 'HEIGHT'), help="largest size of packaged flashcard images")
+    parser.add_argument('--image-quality', type=int, default=80, help="JPEG quality of packaged flashcard images")
+    parser.add_argument('--sentence-rotation', type=int, default=0, help="show each vocabulary card's next stored example sentence this many times over")
+    parser.add_argument('--original-images', action='store_true', help="package flashcard images as downloaded instead of re-encoded")
+    return parser
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Scrape JLPT Sensei grammar and vocabulary lists and build Anki decks from them.",
+        epilog="Without a command, runs `run` with the options given. `python . COMMAND --help` lists a command's options.",
+    )
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    jobs, scrape, decks = job_options(), scrape_options(), deck_options()
+    run = commands.add_parser('run', parents=[jobs, scrape, decks], help="scrape lists and build decks, stage by stage (default)")
+    run.add_argument('--stages', nargs='+', choices=STAGES, default=['decks'], help="stages to run for each job (default: decks)")
+    run.add_argument('--stream', action='store_true', help="build each deck while its level is scraped, rather than from the saved list afterwards")
+    run.add_argument('--queue-size', type=int, default=32, help="rows let in flight between streaming stages")
+
+    commands.add_parser('scrape', parents=[jobs, scrape], help="scrape lists only").set_defaults(stages=['scrape'])
+    commands.add_parser('decks', parents=[jobs, decks], help="build decks from the scraped lists only").set_defaults(stages=['decks'])
+
+    for command, (_, help_text) in FORWARDED_COMMANDS.items():
+        commands.add_parser(command, help=help_text, add_help=False)
+
+    return parser
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = build_parser()
+    if not argv or argv[0] not in ['-h', '--help', *COMMANDS]:
+        argv = ['run', *argv]
+    args = parser.parse_args(argv)
+
+    # scrape and decks leave the other stage's options at the defaults of run
+    defaults = parser.parse_args(['run'])
+    args = argparse.Namespace(**{**vars(defaults), **vars(args)})
+
+    if args.stream and (args.combined or set(args.stages) != set(STAGES)):
+        parser.error("--stream needs both stages, --stages scrape decks, and can't be combined")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    command_line = sys.argv[1:] if argv is None else argv
+
+    if command_line and command_line[0] in FORWARDED_COMMANDS:
+        module_name, _ = FORWARDED_COMMANDS[command_line[0]]
+        return importlib.import_module(module_name).main(command_line[1:])
+
+    args = parse_args(command_line)
+    return importlib.import_module('src.pipeline').run(args, argv)
 
 
 if __name__ == '__main__':
-    # scraper()
-    deck_generator()
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+End to end benchmark: scrape and build decks for whole levels against a local mock site, with nothing from the network
+
+Serves the snapshot recorded by benchmarks/record_fixtures.py if there is one, otherwise generated pages, with the
+given latency and error rate. Then runs the pipeline (`python . --stages scrape decks`) in a fresh process from a
+scratch directory twice: cold, with empty caches and lists, and warm, rerunning over what the cold run left behind.
+
+For each run it reports request throughput, p50 and p99 request latency, the peak RSS of the pipeline process and the
+time spent building decks, read from the run's JSON report. Results are appended to benchmarks/results/end_to_end.jsonl
+with the commit and settings they came from, and compared with the last result for the same settings.
+
+Run from the repository root with `python -m benchmarks.bench_end_to_end --help`
+"""
+from pathlib import Path
+from typing import List, Optional
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.mock_site import MockSite
+from benchmarks.record_fixtures import REPO_DIR, SNAPSHOT_DIR, scratch_workdir
+
+
+RESULTS_PATH = os.path.join(REPO_DIR, 'benchmarks', 'results', 'end_to_end.jsonl')
+RUNS = ['cold', 'warm']
+# result fields compared with the previous result, and whether a lower value is better
+COMPARED = {
+    'requests_per_second': False,
+    'p50_seconds': True,
+    'p99_seconds': True,
+    'peak_rss_mb': True,
+    'deck_build_seconds': True,
+    'wall_seconds': True,
+}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_pipeline(workdir: str, base_url: str, levels: List[str], rate: float, stream: bool, report_path: str) -> dict:
+    """
+    Run the pipeline in a child process, returning its exit code, wall time and peak RSS
+    """
+    command = [
+        sys.executable, os.path.join(REPO_DIR, '__main__.py'),
+        '--levels', *levels, '--stages', 'scrape', 'decks', '--base-url', base_url, '--rate', str(rate), '--report', report_path,
+    ]
+    if stream:
+        command.append('--stream')
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=workdir, stdout=subprocess.DEVNULL)
+    # wait4 gives the resource usage of this child alone
+    _, status, usage = os.wait4(process.pid, 0)
+    wall_seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    # ru_maxrss is in kilobytes on linux and bytes on macos
+    peak_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return {'exit_code': process.returncode, 'wall_seconds': wall_seconds, 'peak_rss_mb': peak_rss_mb}
+
+
+def summarise(run: dict, report_path: str) -> dict:
+    with open(report_path, encoding='utf-8') as f:
+        report = json.load(f)
+
+    requests = report['requests']
+    stages = [span for span in report['spans'] if span['name'] == 'stage']
+    # scrape jobs run side by side, so the longest one is how long scraping took,
+    # and a streamed job scrapes and builds its deck at once
+    scrape_seconds = max((span['seconds'] for span in stages if span['labels']['stage'] in ('scrape', 'stream')), default=0.0)
+
+    return {
+        **run,
+        'requests': requests['requests'],
+        'retries': requests['retries'],
+        'failed_requests': requests['failed'],
+        'requests_per_second': requests['requests'] / scrape_seconds if scrape_seconds else 0.0,
+        'p50_seconds': requests['p50_seconds'],
+        'p99_seconds': requests['p99_seconds'],
+        'scrape_seconds': scrape_seconds,
+        # a streamed deck is built as rows arrive, so only its model and package writing come after the scrape
+        'deck_build_seconds': sum(span['seconds'] for span in report['spans'] if span['name'] in ('model_build', 'deck_build', 'package_write')),
+        'failed_jobs': report['failed'],
+    }
+
+
+def previous_result(results_path: str, settings: dict) -> Optional[dict]:
+    previous = None
+    try:
+        with open(results_path, encoding='utf-8') as f:
+            for line in f:
+                result = json.loads(line)
+                if result['settings'] == settings:
+                    previous = result
+    except FileNotFoundError:
+        pass
+    return previous
+
+
+def print_results(result: dict, previous: Optional[dict]) -> None:
+    header = f"{'run':<5} {'requests':>8} {'req/s':>7} {'p50 s':>7} {'p99 s':>7} {'rss MB':>7} {'decks s':>8} {'wall s':>7} {'failed':>6}"
+    print(header)
+    for name, run in result['runs'].items():
+        print(
+            f"{name:<5} {run['requests']:>8} {run['requests_per_second']:>7.1f} {run['p50_seconds']:>7.3f} {run['p99_seconds']:>7.3f} "
+            f"{run['peak_rss_mb']:>7.1f} {run['deck_build_seconds']:>8.2f} {run['wall_seconds']:>7.2f} {run['failed_requests']:>6}"
+        )
+
+    if previous is None:
+        return
+    print(f"\nchange since {previous['commit'] or 'unknown commit'} at {previous['timestamp']}:")
+    for name, run in result['runs'].items():
+        before = previous['runs'].get(name)
+        if before is None:
+            continue
+        changes = []
+        for field, lower_is_better in COMPARED.items():
+            if before.get(field):
+                change = (run[field] - before[field]) / before[field]
+                better = (change < 0) == lower_is_better
+                changes.append(f"{field} {change:+.0%}{'' if abs(change) < 0.05 else (' better' if better else ' worse')}")
+        print(f"  {name}: {', '.join(changes)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Scrape and build decks end to end against a local mock site.")
+    parser.add_argument('--levels', nargs='+', default=['n5', 'n4'])
+    parser.add_argument('--snapshot', default=SNAPSHOT_DIR, help="snapshot recorded by benchmarks.record_fixtures (default: used if recorded)")
+    parser.add_argument('--generated', action='store_true', help="serve generated pages even if a snapshot was recorded")
+    parser.add_argument('--pages', type=int, default=10, help="list pages per level for generated pages")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds the mock site adds to every response")
+    parser.add_argument('--error-rate', type=float, default=0.02, help="fraction of requests the mock site answers with a 503")
+    parser.add_argument('--rate', type=float, default=50.0, help="requests per second the pipeline is allowed")
+    parser.add_argument('--stream', action='store_true', help="build each deck while its level is scraped")
+    parser.add_argument('--results', default=RESULTS_PATH)
+    parser.add_argument('--no-save', action='store_true', help="print the results without storing them")
+    args = parser.parse_args()
+
+    snapshot_dir = None if args.generated or not os.path.exists(os.path.join(args.snapshot, 'index.json')) else args.snapshot
+    site = MockSite(
+        port=0, pages={level: args.pages for level in args.levels}, latency=args.latency,
+        error_rate=args.error_rate, seed=1, snapshot_dir=snapshot_dir,
+    ).start()
+
+    settings = {
+        'levels': args.levels,
+        'site': 'snapshot' if snapshot_dir else f'generated, {args.pages} pages per level',
+        'latency': args.latency,
+        'error_rate': args.error_rate,
+        'rate': args.rate,
+        'stream': args.stream,
+    }
+    print(f"{settings['site']} at {site.base_url}, {args.latency}s latency, {args.error_rate:.0%} errors, levels {' '.join(args.levels)}\n")
+
+    runs = {}
+    with scratch_workdir() as workdir:
+        for name in RUNS:
+            report_path = os.path.join(workdir, f'report-{name}.json')
+            run = run_pipeline(workdir, site.base_url, args.levels, args.rate, args.stream, report_path)
+            runs[name] = summarise(run, report_path)
+    site.stop()
+
+    result = {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'settings': settings,
+        'runs': runs,
+    }
+    print_results(result, previous_result(args.results, settings))
+
+    if not args.no_save:
+        Path(os.path.dirname(args.results)).mkdir(parents=True, exist_ok=True)
+        with open(args.results, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+        print(f"\nResult appended to {args.results}")
+
+
+if __name__ == '__main__':
+    main()
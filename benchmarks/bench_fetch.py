@@ -0,0 +1,82 @@
+"""
+Fetch benchmark: the fetch engine against a mock site that injects latency, errors, dropped connections and 429s
+
+Fetches every vocabulary page of a generated level with retries off, with retries on a fixed number of workers, and
+with retries and adaptive concurrency, and reports how many pages came back, how long it took and what the site saw.
+
+Run from the repository root with `python -m benchmarks.bench_fetch [pages] [rate]`
+"""
+from urllib.error import HTTPError, URLError
+import sys
+import time
+
+from benchmarks.mock_site import MockSite, ROWS_PER_PAGE
+from src.fetch_engine import FetchEngine
+
+
+SCENARIOS = {
+    'no retries': dict(max_retries=0, adaptive=False),
+    'retries': dict(max_retries=4, adaptive=False),
+    'retries + aimd': dict(max_retries=4, adaptive=True),
+}
+
+
+def fetch_or_none(fetch_engine: FetchEngine, url: str):
+    try:
+        return fetch_engine.fetch(url)
+    except (HTTPError, URLError):
+        return None
+
+
+def run_scenario(options: dict, pages: int, rate: float) -> dict:
+    site = MockSite(
+        port=0, pages={'n5': pages}, latency=0.02, slow_rate=0.02, slow_latency=1.0,
+        error_rate=0.05, drop_rate=0.02, rate_limit=rate * 0.6, seed=1,
+    ).start()
+    fetch_engine = FetchEngine(max_workers=16, max_requests_per_second=rate, timeout=10.0, backoff_seconds=0.2, **options)
+
+    # only words with a page under their bare form, so every miss is an injected fault
+    urls = [
+        f'{site.base_url}/learn-japanese-vocabulary/{site.word("n5", n)}'
+        for n in range(1, pages * ROWS_PER_PAGE + 1) if n % 7 and n % 13
+    ]
+
+    start = time.perf_counter()
+    bodies = fetch_engine.map(lambda url: fetch_or_none(fetch_engine, url), urls)
+    wall_seconds = time.perf_counter() - start
+
+    summary = fetch_engine.metrics.summary()
+    result = {
+        'pages': len(urls),
+        'fetched': sum(body is not None for body in bodies),
+        'wall_seconds': wall_seconds,
+        'retries': summary['retries'],
+        'p95_seconds': summary['p95_seconds'],
+        'limit': fetch_engine.concurrency.limit,
+        'throttled': site.stats['throttle'],
+        'faults': site.stats['error'] + site.stats['drop'] + site.stats['slow'],
+    }
+
+    fetch_engine.close()
+    site.stop()
+    return result
+
+
+def main(pages: int = 30, rate: float = 50.0) -> None:
+    print(f"site allows {rate * 0.6:.0f} requests/s, engine capped at {rate:.0f}/s with 16 workers\n")
+    print(f"{'scenario':<16} {'fetched':>9} {'wall s':>8} {'pages/s':>8} {'retries':>8} {'p95 s':>7} {'429s':>6} {'faults':>7} {'limit':>6}")
+
+    for name, options in SCENARIOS.items():
+        result = run_scenario(options, pages, rate)
+        print(
+            f"{name:<16} {result['fetched']:>4}/{result['pages']:<4} {result['wall_seconds']:>8.2f} "
+            f"{result['fetched'] / result['wall_seconds']:>8.1f} {result['retries']:>8} {result['p95_seconds']:>7.2f} "
+            f"{result['throttled']:>6} {result['faults']:>7} {result['limit']:>6.1f}"
+        )
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 30,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 50.0,
+    )
@@ -0,0 +1,151 @@
+"""
+List loading benchmark: CSV files vs the SQLite list store in src/list_store.py
+
+Loads every level's grammar and vocabulary list with csv.reader as the deck generators do, pandas.read_csv and the
+list store, both level by level and with a query per lesson type, plus a store query for two columns of one level
+like the corpus index's.
+Reports the time per full load and the peak RSS growth of loading once in a fresh process, and checks the store
+gives back the same rows as the CSV files.
+
+Run from the repository root with `python -m benchmarks.bench_list_store [data_dir] [iterations]`
+"""
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from src.list_store import ListStore
+
+
+DATA_DIR = 'data'
+LEVELS = ['n5', 'n4', 'n3', 'n2', 'n1']
+LESSON_TYPES = ['vocabulary', 'grammar']
+
+
+def csv_path(data_dir: str, level: str, lesson_type: str) -> str:
+    return os.path.join(data_dir, lesson_type, f'{level}_{lesson_type}_list.csv')
+
+
+def load_csv(data_dir: str, db_path: str):
+    lists = {}
+    for lesson_type in LESSON_TYPES:
+        for level in LEVELS:
+            with open(csv_path(data_dir, level, lesson_type), encoding='utf8') as f:
+                csv_reader = csv.reader(f)
+                next(csv_reader)
+                lists[(level, lesson_type)] = list(csv_reader)
+    return lists
+
+
+def load_pandas(data_dir: str, db_path: str):
+    import pandas as pd
+
+    return {
+        (level, lesson_type): pd.read_csv(csv_path(data_dir, level, lesson_type), dtype=str, keep_default_na=False)
+        for lesson_type in LESSON_TYPES for level in LEVELS
+    }
+
+
+def load_store(data_dir: str, db_path: str):
+    list_store = ListStore(db_path)
+    return {
+        (level, lesson_type): list_store.read(lesson_type, [level])
+        for lesson_type in LESSON_TYPES for level in LEVELS
+    }
+
+
+def load_store_by_type(data_dir: str, db_path: str):
+    # one query per lesson type for every level at once
+    list_store = ListStore(db_path)
+    return {lesson_type: list_store.read(lesson_type) for lesson_type in LESSON_TYPES}
+
+
+def load_store_columns(data_dir: str, db_path: str):
+    # what a query for one level's words needs, without the sentence columns
+    return ListStore(db_path).read('vocabulary', ['n5'], ['Vocabulary', 'Reading'])
+
+
+APPROACHES = {
+    'csv': load_csv,
+    'pandas': load_pandas,
+    'store': load_store,
+    'store by type': load_store_by_type,
+    'store n5 2 cols': load_store_columns,
+}
+
+
+def build_store(data_dir: str, db_path: str) -> None:
+    list_store = ListStore(db_path)
+    for lesson_type in LESSON_TYPES:
+        for level in LEVELS:
+            list_store.import_csv(level, lesson_type, csv_path(data_dir, level, lesson_type))
+
+
+def seconds_per_load(func, data_dir: str, db_path: str, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(data_dir, db_path)
+    return (time.perf_counter() - start) / iterations
+
+
+def peak_rss_growth_kb(approach: str, data_dir: str, db_path: str) -> int:
+    """
+    Load once in a fresh interpreter and report how far its peak RSS rose above the pre-load baseline (Linux only)
+    """
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_list_store', '--measure-memory', approach, data_dir, db_path],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return int(output.strip())
+
+
+def measure_memory(approach: str, data_dir: str, db_path: str) -> None:
+    if approach == 'pandas':
+        import pandas  # noqa: F401, import cost isn't part of loading
+
+    # reset the kernel's peak RSS mark so import-time allocations don't hide the load
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    baseline_kb = proc_status_kb('VmRSS')
+    lists = APPROACHES[approach](data_dir, db_path)
+    print(proc_status_kb('VmHWM') - baseline_kb)
+    del lists
+
+
+def proc_status_kb(field: str) -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def main(data_dir: str = DATA_DIR, iterations: int = 20) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'lists.sqlite3')
+        build_store(data_dir, db_path)
+
+        store_lists = {key: [list(row) for row in rows] for key, rows in load_store(data_dir, db_path).items()}
+        if load_csv(data_dir, db_path) != store_lists:
+            print("list store rows differ from the CSV files")
+
+        csv_kb = sum(os.path.getsize(csv_path(data_dir, level, lesson_type)) for lesson_type in LESSON_TYPES for level in LEVELS) // 1024
+        print(f"csv files {csv_kb} KB, list store {os.path.getsize(db_path) // 1024} KB\n")
+
+        print(f"{'approach':<16} {'ms/load':>10} {'peak rss kb':>12}")
+        for approach, func in APPROACHES.items():
+            ms = seconds_per_load(func, data_dir, db_path, iterations) * 1000
+            rss_kb = peak_rss_growth_kb(approach, data_dir, db_path)
+            print(f"{approach:<16} {ms:>10.2f} {rss_kb:>12}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 5 and sys.argv[1] == '--measure-memory':
+        measure_memory(sys.argv[2], sys.argv[3], sys.argv[4])
+    else:
+        main(
+            sys.argv[1] if len(sys.argv) > 1 else DATA_DIR,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+        )
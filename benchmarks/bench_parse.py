@@ -0,0 +1,166 @@
+"""
+Parse benchmark: full BeautifulSoup trees vs the lxml extractors in src/page_extractors.py
+
+For each saved fixture page, reports CPU time per parse and the peak RSS growth of parsing it once in a fresh
+process, and checks both approaches extract the same data.
+
+Run from the repository root with `python -m benchmarks.bench_parse [fixture_dir] [iterations]`
+"""
+import os
+import subprocess
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+from src.page_extractors import extract_grammar_rows, extract_vocabulary_rows, extract_examples, extract_header_image
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'pages')
+
+
+def soup_grammar_rows(html: bytes):
+    bs = BeautifulSoup(html, 'lxml')
+    page_rows = []
+    try:
+        table_element = bs.find('table', {'id': 'jl-grammar'})
+        for tr in table_element.tbody.find_all('tr', {'class': 'jl-row'}):
+            row_data = []
+            for td_element in tr.find_all('td'):
+                if td_element['class'][0] == 'jl-td-gj':
+                    splitted_td = td_element.string.split('（')
+                    row_data.append(splitted_td[0])
+                    row_data.append(splitted_td[1].split('）')[0] if len(splitted_td) == 2 else '')
+                elif td_element['class'][0] != 'jl-td-gr':
+                    row_data.append(td_element.string)
+            row_data.append(tr.find('a', href=True)['href'])
+            page_rows.append(row_data)
+    except AttributeError:
+        return None
+    return page_rows
+
+
+def soup_vocabulary_rows(html: bytes):
+    bs = BeautifulSoup(html, 'lxml')
+    page_rows = []
+    try:
+        table_element = bs.find('table', {'id': 'jl-vocab'})
+        for tr in table_element.tbody.find_all('tr', {'class': 'jl-row'}):
+            row_data = []
+            for td_element in tr.find_all('td'):
+                if td_element['class'][0] == 'jl-td-vr':
+                    vocab_reading_td = ''
+                    try:
+                        vocab_reading_td = td_element.a.p.string
+                    except AttributeError:
+                        pass
+                    row_data.append(vocab_reading_td)
+                else:
+                    row_data.append(td_element.string)
+            page_rows.append(row_data)
+    except AttributeError:
+        return None
+    return page_rows
+
+
+def soup_examples(html: bytes):
+    bs = BeautifulSoup(html, 'lxml')
+    examples = []
+    for i, example in enumerate(bs.find_all('div', {'class': 'example-cont'}), start=1):
+        jp_sentence_element = example.find('div', {'class': 'example-main'})
+        en_sentence_element = example.find('div', {'id': f'example_{i}_en'})
+        examples.append((jp_sentence_element.text, en_sentence_element.string))
+    return examples
+
+
+def soup_header_image(html: bytes):
+    img_element = BeautifulSoup(html, 'lxml').find('img', {'id': 'header-image'})
+    return img_element['src'] if img_element is not None else None
+
+
+# fixture file name prefix -> (BeautifulSoup reference, extractor)
+PAGE_SHAPES = {
+    'grammar_list': (soup_grammar_rows, extract_grammar_rows),
+    'vocabulary_list': (soup_vocabulary_rows, extract_vocabulary_rows),
+    'vocabulary_detail': (soup_examples, extract_examples),
+    'grammar_lesson': (soup_header_image, extract_header_image),
+}
+APPROACHES = ['soup', 'extractor']
+
+
+def page_shape(filename: str):
+    for prefix in PAGE_SHAPES:
+        if filename.startswith(prefix):
+            return prefix
+    return None
+
+
+def cpu_seconds_per_parse(func, html: bytes, iterations: int) -> float:
+    start = time.process_time()
+    for _ in range(iterations):
+        func(html)
+    return (time.process_time() - start) / iterations
+
+
+def peak_rss_growth_kb(approach: str, path: str) -> int:
+    """
+    Parse a page once in a fresh interpreter and report how far its peak RSS rose above the pre-parse baseline (Linux only)
+    """
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_parse', '--measure-memory', approach, path],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return int(output.strip())
+
+
+def measure_memory(approach: str, path: str) -> None:
+    with open(path, 'rb') as f:
+        html = f.read()
+    func = PAGE_SHAPES[page_shape(os.path.basename(path))][APPROACHES.index(approach)]
+
+    # reset the kernel's peak RSS mark so import-time allocations don't hide the parse
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    baseline_kb = proc_status_kb('VmRSS')
+    func(html)
+    print(proc_status_kb('VmHWM') - baseline_kb)
+
+
+def proc_status_kb(field: str) -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def main(fixture_dir: str = FIXTURE_DIR, iterations: int = 50) -> None:
+    print(f"{'page':<40} {'approach':<10} {'cpu ms/page':>12} {'peak rss kb':>12}")
+
+    for filename in sorted(os.listdir(fixture_dir)):
+        shape = page_shape(filename)
+        if shape is None:
+            continue
+
+        path = os.path.join(fixture_dir, filename)
+        with open(path, 'rb') as f:
+            html = f.read()
+
+        soup_func, extractor_func = PAGE_SHAPES[shape]
+        if soup_func(html) != extractor_func(html):
+            print(f"{filename}: extractor output differs from BeautifulSoup")
+
+        for approach, func in zip(APPROACHES, (soup_func, extractor_func)):
+            cpu_ms = cpu_seconds_per_parse(func, html, iterations) * 1000
+            rss_kb = peak_rss_growth_kb(approach, path)
+            print(f"{filename:<40} {approach:<10} {cpu_ms:>12.2f} {rss_kb:>12}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--measure-memory':
+        measure_memory(sys.argv[2], sys.argv[3])
+    else:
+        main(
+            sys.argv[1] if len(sys.argv) > 1 else FIXTURE_DIR,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 50,
+        )
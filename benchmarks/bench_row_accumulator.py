@@ -0,0 +1,73 @@
+"""
+Micro-benchmark: row-by-row DataFrame growth vs RowAccumulator on synthetic vocabulary rows
+
+Run from the repository root with `python -m benchmarks.bench_row_accumulator [row_count]`
+"""
+import filecmp
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from src.row_accumulator import RowAccumulator
+
+
+COLUMN_NAMES = ['#', 'Vocabulary', 'Reading', 'Type', 'Meaning', 'Sentence JP', 'Sentence EN']
+
+
+def synthetic_rows(row_count: int) -> list:
+    return [
+        [str(i), f'食べ物{i}', f'たべもの{i}', 'Noun, Suru verb', f'food, "meal" {i}', None, None]
+        for i in range(1, row_count+1)
+    ]
+
+
+def build_with_dataframe(rows: list, path: str) -> None:
+    df = pd.DataFrame(columns=COLUMN_NAMES)
+    for row_data in rows:
+        df.loc[len(df)] = row_data
+    for i in range(len(rows)):
+        df.at[i, 'Sentence JP'] = f'例文{i}、です。'
+        df.at[i, 'Sentence EN'] = f'Example {i}, with a comma.'
+    df.to_csv(path, index=False)
+
+
+def build_with_accumulator(rows: list, path: str) -> None:
+    scraped_rows = RowAccumulator(COLUMN_NAMES)
+    for row_data in rows:
+        scraped_rows.append(row_data)
+    for i in range(len(rows)):
+        scraped_rows.set(i, 'Sentence JP', f'例文{i}、です。')
+        scraped_rows.set(i, 'Sentence EN', f'Example {i}, with a comma.')
+    scraped_rows.to_csv(path)
+
+
+def timed(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main(row_count: int = 10_000) -> None:
+    rows = synthetic_rows(row_count)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        df_path = os.path.join(tmpdir, 'dataframe.csv')
+        acc_path = os.path.join(tmpdir, 'accumulator.csv')
+
+        df_seconds = timed(build_with_dataframe, rows, df_path)
+        acc_seconds = timed(build_with_accumulator, rows, acc_path)
+
+        identical = filecmp.cmp(df_path, acc_path, shallow=False)
+
+    print(f"{row_count} rows")
+    print(f"DataFrame .loc/.at: {df_seconds:.3f}s")
+    print(f"RowAccumulator:     {acc_seconds:.3f}s")
+    print(f"Speedup:            {df_seconds / acc_seconds:.0f}x")
+    print(f"Identical CSV:      {identical}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
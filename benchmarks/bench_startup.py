@@ -0,0 +1,149 @@
+"""
+Startup benchmark: how long the entry point takes to start, and what it imports, for `--help` and a deck-only run
+
+Runs `python -X importtime __main__.py` in fresh processes from a scratch directory holding copies of the scraped
+lists, so the built decks never touch the repository's own. The deck-only run is started once untimed, so the timed
+runs build from a warm deck cache the way repeated builds do. For each case it reports the median wall time and
+total import time, the number of modules imported, which heavy dependencies were loaded and the slowest top-level
+imports.
+
+`--baseline REV` runs the same cases against the tree at a git revision as well, for comparison. Both trees are
+given the same arguments, in the form the entry point has always accepted.
+
+Run from the repository root with `python -m benchmarks.bench_startup --help`
+"""
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+import argparse
+import io
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+from benchmarks.record_fixtures import REPO_DIR
+
+
+# dependencies a run only needs for some of its work
+HEAVY_MODULES = ['pandas', 'bs4', 'lxml', 'genanki', 'PIL', 'http.client', 'multiprocessing', 'src.fetch_engine']
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+
+def cases(levels: List[str], lesson_types: List[str]) -> Dict[str, List[str]]:
+    return {
+        'help': ['--help'],
+        'decks': ['--levels', *levels, '--types', *lesson_types, '--stages', 'decks'],
+    }
+
+
+@contextmanager
+def tree_at(revision: str):
+    """
+    The repository's files at a git revision, in a temporary directory
+    """
+    archive = subprocess.run(['git', 'archive', revision], cwd=REPO_DIR, capture_output=True, check=True).stdout
+    with tempfile.TemporaryDirectory() as tree_dir:
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(tree_dir)
+        yield tree_dir
+
+
+@contextmanager
+def workdir_for(tree_dir: str, levels: List[str], lesson_types: List[str]):
+    """
+    Scratch directory linking to a tree's src, with copies of the lists a deck-only run reads
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        os.symlink(os.path.join(tree_dir, 'src'), os.path.join(workdir, 'src'))
+        for lesson_type in lesson_types:
+            os.makedirs(os.path.join(workdir, 'data', lesson_type))
+            for level in levels:
+                name = f'{level}_{lesson_type}_list.csv'
+                shutil.copy(os.path.join(REPO_DIR, 'data', lesson_type, name), os.path.join(workdir, 'data', lesson_type, name))
+        images_dir = os.path.join(REPO_DIR, 'data', 'grammar', 'flashcard_images')
+        if 'grammar' in lesson_types and os.path.isdir(images_dir):
+            os.symlink(images_dir, os.path.join(workdir, 'data', 'grammar', 'flashcard_images'))
+        yield workdir
+
+
+def run_once(tree_dir: str, workdir: str, args: List[str]) -> Tuple[float, Dict[str, Tuple[int, int]], List[str]]:
+    """
+    Start the entry point once, returning its wall time, each module's (self, cumulative) import microseconds
+    and the modules imported at the top level, in order
+    """
+    command = [sys.executable, '-X', 'importtime', os.path.join(tree_dir, '__main__.py'), *args]
+    start = time.perf_counter()
+    process = subprocess.run(command, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall_seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} exited with {process.returncode}:\n{process.stderr[-2000:]}")
+
+    modules, top_level = {}, []
+    for line in process.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        modules[name] = (int(self_us), int(cumulative_us))
+        if not indent:
+            top_level.append(name)
+    return wall_seconds, modules, top_level
+
+
+def measure(tree_dir: str, levels: List[str], lesson_types: List[str], repeats: int) -> Dict[str, dict]:
+    results = {}
+    with workdir_for(tree_dir, levels, lesson_types) as workdir:
+        for name, args in cases(levels, lesson_types).items():
+            # the first run fills the deck cache and the OS file cache
+            run_once(tree_dir, workdir, args)
+            runs = [run_once(tree_dir, workdir, args) for _ in range(repeats)]
+
+            _, modules, top_level = runs[-1]
+            results[name] = {
+                'wall_seconds': statistics.median(wall for wall, _, _ in runs),
+                'import_seconds': statistics.median(
+                    sum(run_modules[module][1] for module in run_top_level) / 1e6 for _, run_modules, run_top_level in runs
+                ),
+                'modules': len(modules),
+                'heavy': [module for module in HEAVY_MODULES if module in modules],
+                'slowest': sorted(((modules[module][1], module) for module in top_level), reverse=True)[:5],
+            }
+    return results
+
+
+def print_results(label: str, results: Dict[str, dict], baseline: Dict[str, dict] = None) -> None:
+    print(f"{label}:")
+    for name, result in results.items():
+        line = f"  {name:<6} wall {result['wall_seconds']*1000:7.1f} ms, imports {result['import_seconds']*1000:7.1f} ms, {result['modules']:>4} modules"
+        if baseline is not None and name in baseline:
+            line += f" ({result['wall_seconds'] / baseline[name]['wall_seconds']:.0%} of the baseline's wall time)"
+        print(line)
+        print(f"         heavy: {', '.join(result['heavy']) or 'none'}")
+        print(f"         slowest: {', '.join(f'{module} {us/1000:.1f} ms' for us, module in result['slowest'])}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time the entry point's startup and imports for --help and a deck-only run.")
+    parser.add_argument('--levels', nargs='+', default=['n5'], help="levels the deck-only run builds (default: n5)")
+    parser.add_argument('--types', nargs='+', default=['vocabulary'], help="lesson types the deck-only run builds (default: vocabulary)")
+    parser.add_argument('--repeats', type=int, default=5, help="timed runs per case, the median is reported")
+    parser.add_argument('--baseline', default=None, help="git revision to compare with, e.g. HEAD~1")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with tree_at(args.baseline) as tree_dir:
+            baseline = measure(tree_dir, args.levels, args.types, args.repeats)
+        print_results(f"baseline {args.baseline}", baseline)
+        print()
+
+    print_results('working tree', measure(REPO_DIR, args.levels, args.types, args.repeats), baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""
+Local stand-in for jlptsensei.com with injectable latency and faults
+
+Serves either a snapshot of the real site recorded by benchmarks/record_fixtures.py, or generated grammar and
+vocabulary lists with pagination links, grammar lessons with a header image, vocabulary pages with example sentences
+and flashcard images, in the markup the extractors expect. Responses carry an ETag and answer conditional requests
+with a 304. Faults are injected at random from a seeded generator:
+
+- latency on every response, plus occasional slow responses
+- 503s, and connections dropped without a response
+- 429s with a Retry-After once requests go over the site's rate limit
+
+Some generated words only have a page under japanese-meaning-of- and some have none, like on the real site.
+GET /_stats returns what the server saw as JSON.
+
+Run from the repository root with `python -m benchmarks.mock_site --help`, then point the scraper at it with
+`python . --stages scrape --base-url http://127.0.0.1:8765`
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Union
+from urllib.parse import unquote, urlsplit
+import argparse
+import collections
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+
+ROWS_PER_PAGE = 10
+# a minimal jpeg, start and end markers included
+FLASHCARD_IMAGE = b'\xff\xd8\xff\xe0' + b'\x00' * 2048 + b'\xff\xd9'
+
+
+class MockSite:
+    def __init__(self, port: int = 8765, pages: Optional[Dict[str, int]] = None, latency: float = 0.0,
+                 slow_rate: float = 0.0, slow_latency: float = 2.0, error_rate: float = 0.0, drop_rate: float = 0.0,
+                 rate_limit: float = 0.0, retry_after: Union[int, str] = 1, seed: int = 0, snapshot_dir: Optional[str] = None) -> None:
+        self.port = port
+        # list pages per level, the same for grammar and vocabulary
+        self.pages = pages or {'n5': 3, 'n4': 2}
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.rate_limit = rate_limit
+        # sent as the Retry-After of a 429, seconds or an http date
+        self.retry_after = retry_after
+
+        # path -> recorded response, when serving a snapshot of the real site
+        self.snapshot_dir = snapshot_dir
+        self.snapshot: Optional[dict] = None
+        if snapshot_dir is not None:
+            with open(os.path.join(snapshot_dir, 'index.json'), encoding='utf-8') as f:
+                self.snapshot = json.load(f)
+
+        self.stats = collections.Counter()
+        self._random = random.Random(seed)
+        self._request_times = collections.deque()
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+
+    def start(self) -> 'MockSite':
+        """
+        Serve from a background thread
+        """
+        site = self
+
+        class Handler(MockSiteHandler):
+            mock_site = site
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+    def fault(self) -> Optional[str]:
+        """
+        Pick the fault, if any, for the next request
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._request_times.append(now)
+            while self._request_times and self._request_times[0] < now - 1:
+                self._request_times.popleft()
+
+            if self.rate_limit and len(self._request_times) > self.rate_limit:
+                return 'throttle'
+            roll = self._random.random()
+            if roll < self.drop_rate:
+                return 'drop'
+            if roll < self.drop_rate + self.error_rate:
+                return 'error'
+            if roll < self.drop_rate + self.error_rate + self.slow_rate:
+                return 'slow'
+            return None
+
+
+    def grammar_list(self, level: str, page: int) -> str:
+        rows = []
+        for n in range((page - 1) * ROWS_PER_PAGE + 1, page * ROWS_PER_PAGE + 1):
+            rows.append(
+                f'<tr class="jl-row"><td class="jl-td-num">{n}</td>'
+                f'<td class="jl-td-gj"><a href="{self.base_url}/learn-japanese-grammar/{level}-grammar-{n}/">文法{n}（ぶんぽう{n}）</a></td>'
+                f'<td class="jl-td-gr">bunpou {n}</td><td class="jl-td-gm">grammar point {n}, must do</td></tr>'
+            )
+        return self.list_page(level, 'grammar', page, f'<table id="jl-grammar"><tbody>{"".join(rows)}</tbody></table>')
+
+
+    def vocabulary_list(self, level: str, page: int) -> str:
+        rows = []
+        for n in range((page - 1) * ROWS_PER_PAGE + 1, page * ROWS_PER_PAGE + 1):
+            rows.append(
+                f'<tr class="jl-row"><td class="jl-td-num">{n}</td>'
+                f'<td class="jl-td-v"><a href="#">{self.word(level, n)}</a></td>'
+                f'<td class="jl-td-vr"><a href="#"><p>{self.reading(level, n)}</p></a></td>'
+                f'<td class="jl-td-vt">Verb, Ichidan verb</td><td class="jl-td-vm">to eat ({n})</td>'
+                f'<td class="jl-td-sj"></td><td class="jl-td-se"></td></tr>'
+            )
+        return self.list_page(level, 'vocabulary', page, f'<table id="jl-vocab"><tbody>{"".join(rows)}</tbody></table>')
+
+
+    def list_page(self, level: str, lesson_type: str, page: int, table: str) -> str:
+        links = ''.join(
+            f'<a class="page-numbers" href="{self.base_url}/jlpt-{level}-{lesson_type}-list/page/{n}/">{n}</a>'
+            for n in range(1, self.pages[level] + 1)
+        )
+        return f'<html><body>{table}<nav>{links}</nav></body></html>'
+
+
+    def word(self, level: str, n: int) -> str:
+        return f'食べ{level}{n}'
+
+
+    def reading(self, level: str, n: int) -> str:
+        return f'たべ{level}{n}'
+
+
+    def vocabulary_page(self, slug: str) -> Optional[str]:
+        """
+        Every word has a page under its bare form, except every 7th which is only under japanese-meaning-of-
+        and every 13th which has none at all
+        """
+        match = re.match(r'(japanese-meaning-of-)?食べ(n\d)(\d+)$', slug)
+        if match is None:
+            return None
+        prefixed, n = match.group(1) is not None, int(match.group(3))
+        if n % 13 == 0 or (n % 7 == 0) != prefixed:
+            return None
+
+        word = f'食べ{match.group(2)}{n}'
+        examples = ''.join(
+            f'<div class="example-cont"><div class="example-main">{word}の例文{i}。</div><div id="example_{i}_en">Example {i} for {word}.</div></div>'
+            for i in (1, 2, 3)
+        )
+        return f'<html><body><h1>{word}</h1>{examples}</body></html>'
+
+
+    def route(self, path: str):
+        """
+        Status, content type and body for a path
+        """
+        if self.snapshot is not None:
+            return self.recorded(path)
+
+        match = re.match(r'/jlpt-(n\d)-(grammar|vocabulary)-list/page/(\d+)/?$', path)
+        if match:
+            level, lesson_type, page = match.group(1), match.group(2), int(match.group(3))
+            if level not in self.pages or not 1 <= page <= self.pages[level]:
+                return 404, 'text/html', 'Not found'
+            if lesson_type == 'grammar':
+                return 200, 'text/html; charset=utf-8', self.grammar_list(level, page)
+            return 200, 'text/html; charset=utf-8', self.vocabulary_list(level, page)
+
+        match = re.match(r'/learn-japanese-grammar/([\w-]+)/?$', path)
+        if match:
+            return 200, 'text/html; charset=utf-8', f'<html><body><img id="header-image" src="{self.base_url}/images/{match.group(1)}.jpg"></body></html>'
+
+        if path.startswith('/images/'):
+            return 200, 'image/jpeg', FLASHCARD_IMAGE
+
+        match = re.match(r'/learn-japanese-vocabulary/(.+?)/?$', path)
+        if match:
+            page = self.vocabulary_page(match.group(1))
+            if page is not None:
+                return 200, 'text/html; charset=utf-8', page
+
+        return 404, 'text/html', 'Not found'
+
+
+    def recorded(self, path: str):
+        response = self.snapshot['responses'].get(path)
+        # redirects are followed here, the page they led to was recorded too
+        for _ in range(5):
+            if response is None or not response.get('location'):
+                break
+            response = self.snapshot['responses'].get(unquote(urlsplit(response['location']).path))
+        if response is None:
+            return 404, 'text/html', 'Not found'
+
+        with open(os.path.join(self.snapshot_dir, 'bodies', response['body']), 'rb') as f:
+            body = f.read()
+        if response['content_type'].startswith('text/html'):
+            # recorded pages link to the real site, point them back here
+            for site in [self.snapshot['site'], *self.snapshot.get('other_sites', [])]:
+                body = body.replace(site.encode(), self.base_url.encode())
+        return response['status'], response['content_type'], body
+
+
+class MockSiteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    mock_site: MockSite = None
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+    def do_GET(self) -> None:
+        site = self.mock_site
+        if self.path == '/_stats':
+            return self.send(200, 'application/json', json.dumps(site.stats))
+
+        fault = site.fault()
+        with site._lock:
+            site.stats['requests'] += 1
+            if fault is not None:
+                site.stats[fault] += 1
+
+        if fault == 'drop':
+            self.close_connection = True
+            return
+        if fault == 'throttle':
+            return self.send(429, 'text/html', 'Too many requests', {'Retry-After': str(site.retry_after)})
+
+        time.sleep(site.latency + (site.slow_latency if fault == 'slow' else 0))
+
+        if fault == 'error':
+            return self.send(503, 'text/html', 'Service unavailable')
+
+        status, content_type, body = site.route(unquote(self.path))
+        with site._lock:
+            site.stats[str(status)] += 1
+        self.send(status, content_type, body)
+
+
+    def send(self, status: int, content_type: str, body, headers: Optional[Dict[str, str]] = None) -> None:
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        if status == 200:
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+            headers = {**(headers or {}), 'ETag': etag}
+            if self.headers.get('If-None-Match') == etag:
+                with self.mock_site._lock:
+                    self.mock_site.stats['304'] += 1
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for jlptsensei.com with injected latency and faults.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--pages', nargs='+', default=['n5=3', 'n4=2'], help="list pages per level, e.g. n5=3 n4=2")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="fraction of responses that are slow")
+    parser.add_argument('--slow-latency', type=float, default=2.0, help="extra seconds for a slow response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with a 503")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="fraction of connections dropped without a response")
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="requests per second before answering 429 (default: no limit)")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with a 429")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--snapshot', default=None, help="serve a snapshot recorded by benchmarks.record_fixtures instead of generated pages")
+    args = parser.parse_args()
+
+    pages = {level: int(count) for level, count in (pair.split('=') for pair in args.pages)}
+    site = MockSite(args.port, pages, args.latency, args.slow_rate, args.slow_latency, args.error_rate,
+                    args.drop_rate, args.rate_limit, args.retry_after, args.seed, args.snapshot).start()
+    print(f"Serving a mock JLPT Sensei at {site.base_url}, ctrl-c to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        site.stop()
+
+
+if __name__ == '__main__':
+    main()
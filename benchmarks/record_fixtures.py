@@ -0,0 +1,134 @@
+"""
+Records a snapshot of jlptsensei.com for the offline benchmarks
+
+Runs the grammar and vocabulary scrapers for the given levels against the real site with a fetch engine that keeps
+every final response, 404s included: list pages, grammar lessons, vocabulary pages and flashcard images. Responses
+are saved under benchmarks/fixtures/site as an index.json of path -> status and content type, plus one file per
+distinct body. benchmarks/mock_site.py serves the snapshot back with --snapshot, with its links pointed at itself.
+
+The scrape runs in a scratch directory so the lists, images and caches under ./data are left alone.
+
+Run from the repository root with `python -m benchmarks.record_fixtures [levels...]`
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Tuple
+from urllib.parse import unquote, urlsplit
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import tempfile
+import threading
+
+from src.fetch_engine import FetchEngine, REDIRECT_CODES
+from src.grammar_scraper import GrammarScraper
+from src.vocabulary_scraper import VocabularyScraper
+
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'site')
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRAPERS = {
+    'vocabulary': VocabularyScraper,
+    'grammar': GrammarScraper,
+}
+
+
+def snapshot_key(url: str) -> str:
+    """
+    Path and query of a url as the mock site sees it
+    """
+    parts = urlsplit(url)
+    path = unquote(parts.path or '/')
+    return f'{path}?{parts.query}' if parts.query else path
+
+
+@contextmanager
+def scratch_workdir():
+    """
+    Work from an empty directory that only links back to the repository's src, which the scrapers and deck
+    generators read their templates and rules from
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.symlink(os.path.join(REPO_DIR, 'src'), os.path.join(workdir, 'src'))
+        os.chdir(workdir)
+        try:
+            yield workdir
+        finally:
+            os.chdir(cwd)
+
+
+class RecordingFetchEngine(FetchEngine):
+    """
+    Fetch engine that keeps the final response to every request it makes
+    """
+    def __init__(self, snapshot_dir: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.snapshot_dir = snapshot_dir
+        self.responses: Dict[str, dict] = {}
+        self.sites = set()
+        self._record_lock = threading.Lock()
+        Path(os.path.join(snapshot_dir, 'bodies')).mkdir(parents=True, exist_ok=True)
+
+
+    def _request_with_retries(self, url: str, extra_headers: Dict[str, str]) -> Tuple[int, str, http.client.HTTPMessage, bytes]:
+        status, reason, headers, body = super()._request_with_retries(url, extra_headers)
+
+        body_name = hashlib.sha256(body).hexdigest()
+        body_path = os.path.join(self.snapshot_dir, 'bodies', body_name)
+        if not os.path.exists(body_path):
+            with open(body_path, 'wb') as f:
+                f.write(body)
+
+        parts = urlsplit(url)
+        with self._record_lock:
+            self.sites.add(f'{parts.scheme}://{parts.netloc}')
+            self.responses[snapshot_key(url)] = {
+                'status': status,
+                'content_type': headers.get('Content-Type', 'application/octet-stream'),
+                'body': body_name,
+                'location': headers.get('Location') if status in REDIRECT_CODES else None,
+            }
+
+        return status, reason, headers, body
+
+
+    def save(self, site: str) -> None:
+        with self._record_lock:
+            snapshot = {
+                'site': site,
+                'other_sites': sorted(self.sites - {site}),
+                'responses': dict(sorted(self.responses.items())),
+            }
+        with open(os.path.join(self.snapshot_dir, 'index.json'), 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Record a snapshot of jlptsensei.com for benchmarks.mock_site to serve.")
+    parser.add_argument('levels', nargs='*', default=['n5'], help="JLPT levels to record (default: n5)")
+    parser.add_argument('--types', nargs='+', choices=list(SCRAPERS), default=list(SCRAPERS))
+    parser.add_argument('--base-url', default='https://jlptsensei.com')
+    parser.add_argument('--rate', type=float, default=5.0, help="maximum requests per second to the site")
+    parser.add_argument('--out', default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    out = os.path.abspath(args.out)
+    # no cache, so every page is fetched whole rather than revalidated
+    fetch_engine = RecordingFetchEngine(out, max_requests_per_second=args.rate)
+
+    with scratch_workdir():
+        for level in args.levels:
+            for lesson_type in args.types:
+                SCRAPERS[lesson_type](level, fetch_engine, args.base_url).scrape()
+
+    fetch_engine.close()
+    fetch_engine.save(args.base_url.rstrip('/'))
+    print(f"Recorded {len(fetch_engine.responses)} responses to {out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,65 @@
 from abc import ABC, abstractmethod
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 import genanki
 from pathlib import Path
+import hashlib
+import json
 import os
+import time
+
+from src.image_optimizer import ImageOptimizer
+from src.incremental_package_writer import IncrementalPackageWriter
+from src.list_store import read_csv_list
+from src.instrumentation import run_recorder
+
+
+def stable_id(*names: str) -> int:
+    """
+    Derive a model or deck id in genanki's recommended range from names, so it is the same on every build
+    """
+    digest = hashlib.sha1('::'.join(names).encode('utf8')).digest()
+    return (1 << 30) + int.from_bytes(digest[:4], 'big') % (1 << 30)
+
+
+@lru_cache(maxsize=None)
+def load_templates(lesson_type: str) -> Tuple[str, str, str]:
+    """
+    Read a lesson type's front and back template html and its css, once per process
+    """
+    templates = []
+    for filename in (f'{lesson_type}_recognition_front.html', f'{lesson_type}_recognition_back.html', f'{lesson_type}_recognition.css'):
+        with open(os.path.join('src/template', filename), 'r') as f:
+            templates.append(f.read())
+
+    return tuple(templates)
 
 
 class AnkiDeckGenerator(ABC):
-    def __init__(self, level: str) -> None:
+    def __init__(self, level: str, subdeck: bool = False, image_optimizer: Optional[ImageOptimizer] = None, sentence_rotation: int = 0) -> None:
         self.jlpt_level = level
+        # subdecks are nested under their level for the combined package of every level
+        self.subdeck = subdeck
         self.anki_model = genanki.Model()
         self.anki_deck = genanki.Deck()
         self.media_files = []
+        # package names for media files that aren't packaged under their own file name
+        self.media_names: Dict[str, str] = {}
+        # files packaged in place of media files, such as smaller copies of images
+        self.media_sources: Dict[str, str] = {}
+        self.image_optimizer = image_optimizer or ImageOptimizer()
+        # which of its stored example sentences each card shows, moving every card on to its next one per step
+        self.sentence_rotation = sentence_rotation
 
         self.LESSON_TYPE = ''
 
+        # notes built from each csv row, keyed by the row's hash, carried over between builds
+        self.build_cache: Dict[str, dict] = {}
+        self.used_cache_keys: List[str] = []
+        # notes built so far per guid, to tell apart entries listed more than once under the same key
+        self.guid_counts: Counter = Counter()
+
 
     @abstractmethod
     def generate_model(self) -> None:
@@ -23,13 +70,115 @@ class AnkiDeckGenerator(ABC):
 
 
     @abstractmethod
-    def generate_deck(self) -> None:
+    def generate_deck(self, rows: Optional[Iterable[Sequence[str]]] = None) -> None:
         """
-        Read CSV file and convert each row into an Anki card
+        Read CSV file, or take the given rows, and convert each row into an Anki card
         """
         pass
 
 
+    @abstractmethod
+    def note_data(self, row: List[str]) -> Tuple[List[str], List[str], str]:
+        """
+        Turn a CSV row into note fields, note tags and a key that identifies the note across rebuilds
+        """
+        pass
+
+
+    def read_rows(self) -> List[Sequence[str]]:
+        """
+        Read the level's list rows from its CSV file, quicker for whole rows than the list store
+        """
+        return read_csv_list(self.jlpt_level, self.LESSON_TYPE)
+
+
+    def model_id(self) -> int:
+        return stable_id('JLPT Sensei', self.LESSON_TYPE, 'model')
+
+
+    def deck_id(self) -> int:
+        return stable_id('JLPT Sensei', self.jlpt_level, self.LESSON_TYPE, 'subdeck' if self.subdeck else 'deck')
+
+
+    def deck_name(self) -> str:
+        if self.subdeck:
+            return f'JLPT Sensei::{self.jlpt_level.upper()}::{self.LESSON_TYPE.capitalize()}'
+        return f'JLPT Sensei {self.jlpt_level.upper()} {self.LESSON_TYPE.capitalize()}'
+
+
+    def note_extras(self, row: List[str]) -> Any:
+        """
+        Anything besides the CSV row that the row's note depends on
+        """
+        return None
+
+
+    def build_note(self, row: List[str]) -> genanki.Note:
+        """
+        Build the note for a CSV row, reusing the previous build's note if the row hasn't changed
+        """
+        # hashing the model's field names too means a changed note layout never reuses stale notes
+        field_names = [field['name'] for field in self.anki_model.fields]
+        row_hash = hashlib.sha1(json.dumps([field_names, row, self.note_extras(row)], ensure_ascii=False).encode('utf8')).hexdigest()
+
+        cached = self.build_cache.get(row_hash)
+        run_recorder.count('note_cache', outcome='hit' if cached is not None else 'miss', lesson_type=self.LESSON_TYPE)
+        if cached is None:
+            fields, tags, note_key = self.note_data(row)
+            cached = {
+                'fields': fields,
+                'tags': tags,
+                # the guid follows the note's identity rather than its content, so edits update the note in Anki
+                'guid': genanki.guid_for(self.jlpt_level, self.LESSON_TYPE, note_key),
+                'mod': int(time.time()),
+            }
+            self.build_cache[row_hash] = cached
+        self.used_cache_keys.append(row_hash)
+
+        # a key listed more than once, such as homographs with the same reading, would otherwise collapse into one
+        # note, so later occurrences get a guid of their own, as snapshot_diff tells them apart by occurrence
+        self.guid_counts[cached['guid']] += 1
+        occurrence = self.guid_counts[cached['guid']]
+        guid = cached['guid']
+        if occurrence > 1:
+            print(f"{self.jlpt_level.capitalize()} {self.LESSON_TYPE} {cached['fields'][0]} is listed {occurrence} times under the same key, keeping it as separate notes")
+            guid = genanki.guid_for(cached['guid'], occurrence)
+
+        return genanki.Note(model=self.anki_model, fields=cached['fields'], tags=cached['tags'], guid=guid)
+
+
+    def build_cache_path(self) -> str:
+        prefix = 'combined_' if self.subdeck else ''
+        return os.path.join('./data/decks/.build_cache', f'{prefix}{self.jlpt_level}_{self.LESSON_TYPE}.json')
+
+
+    def load_build_cache(self) -> None:
+        try:
+            with open(self.build_cache_path(), encoding='utf8') as f:
+                self.build_cache = json.load(f)
+        except FileNotFoundError:
+            self.build_cache = {}
+        self.used_cache_keys = []
+        self.guid_counts = Counter()
+
+
+    def save_build_cache(self) -> None:
+        """
+        Keep only the notes used by this build, so rows deleted from the CSV drop out of the cache
+        """
+        Path(os.path.dirname(self.build_cache_path())).mkdir(parents=True, exist_ok=True)
+        used_cache = {row_hash: self.build_cache[row_hash] for row_hash in self.used_cache_keys}
+        with open(self.build_cache_path(), 'w', encoding='utf8') as f:
+            json.dump(used_cache, f, ensure_ascii=False)
+
+
+    def build_timestamp(self) -> int:
+        """
+        Time the deck's content last changed, which stays put while the CSV rows do
+        """
+        return max((self.build_cache[row_hash]['mod'] for row_hash in self.used_cache_keys), default=0)
+
+
     def save_deck(self) -> None:
         """
         Save genanki package object as importable Anki deck
@@ -40,9 +189,9 @@ class AnkiDeckGenerator(ABC):
         filename = f'JLPT_Sensei_{self.jlpt_level.capitalize()}_{self.LESSON_TYPE.capitalize()}.apkg'
         fullpath = os.path.join(outdir, filename)
 
-        my_package = genanki.Package(self.anki_deck)
-        if len(self.media_files) > 0:
-            my_package.media_files = self.media_files
-        my_package.write_to_file(fullpath)
+        # only the notes and media that changed since the last build are written
+        with run_recorder.span('package_write', level=self.jlpt_level, lesson_type=self.LESSON_TYPE):
+            IncrementalPackageWriter(fullpath).write([self.anki_deck], self.media_files, self.build_timestamp(), self.media_names, self.media_sources)
+        self.save_build_cache()
 
         print(f"Finished generating {self.jlpt_level.capitalize()} {self.LESSON_TYPE.capitalize()} Deck!")
@@ -0,0 +1,81 @@
+from pathlib import Path
+from typing import Any, Hashable
+import json
+import os
+import threading
+
+
+class CheckpointJournal:
+    """
+    Append-only record of finished scrape work for one level and lesson type, so a restarted run can skip it
+    """
+    def __init__(self, level: str, lesson_type: str, journal_dir: str = './data/journal') -> None:
+        self.path = os.path.join(journal_dir, f'{level}_{lesson_type}.jsonl')
+        self.entries = {}
+
+        self._lock = threading.Lock()
+        self._file = None
+
+        self._replay()
+
+
+    def has(self, kind: str, key: Hashable) -> bool:
+        return (kind, key) in self.entries
+
+
+    def get(self, kind: str, key: Hashable, default: Any = None) -> Any:
+        return self.entries.get((kind, key), default)
+
+
+    def record(self, kind: str, key: Hashable, value: Any = None) -> None:
+        """
+        Append a finished piece of work, flushed straight away so it survives a crash
+        """
+        line = json.dumps([kind, key, value], ensure_ascii=False)
+
+        with self._lock:
+            if self._file is None:
+                Path(os.path.dirname(self.path)).mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+
+            self._file.write(line + '\n')
+            self._file.flush()
+            self.entries[(kind, key)] = value
+
+
+    def clear(self) -> None:
+        """
+        Delete the journal once its run has finished and the results are saved
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.entries = {}
+
+
+    def _replay(self) -> None:
+        if not os.path.exists(self.path):
+            return
+
+        good_size = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    kind, key, value = json.loads(line)
+                except ValueError:
+                    break
+                good_size += len(line)
+
+                # json turns tuple keys into lists
+                if isinstance(key, list):
+                    key = tuple(key)
+                self.entries[(kind, key)] = value
+
+        # a crash mid-write can leave the last line truncated, drop it so new records start on a clean line
+        if good_size != os.path.getsize(self.path):
+            os.truncate(self.path, good_size)
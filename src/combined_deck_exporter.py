@@ -0,0 +1,84 @@
+from pathlib import Path
+from typing import Dict, List, Optional
+import os
+
+from src.anki_deck_generator import AnkiDeckGenerator
+from src.image_optimizer import ImageOptimizer
+from src.incremental_package_writer import IncrementalPackageWriter
+from src.instrumentation import run_recorder
+from src.vocabulary_deck_generator import VocabularyDeckGenerator
+from src.grammar_deck_generator import GrammarDeckGenerator
+
+
+DECK_GENERATORS = {
+    'vocabulary': VocabularyDeckGenerator,
+    'grammar': GrammarDeckGenerator,
+}
+
+
+class CombinedDeckExporter:
+    """
+    Builds every selected level and lesson type into one .apkg of nested subdecks, e.g. JLPT Sensei::N5::Grammar
+    """
+    def __init__(self, levels: List[str], lesson_types: List[str], image_optimizer: Optional[ImageOptimizer] = None, sentence_rotation: int = 0) -> None:
+        self.levels = levels
+        self.lesson_types = lesson_types
+        self.image_optimizer = image_optimizer
+        self.sentence_rotation = sentence_rotation
+
+
+    def filename(self) -> str:
+        name = 'JLPT_Sensei_' + '_'.join(level.capitalize() for level in self.levels)
+        if len(self.lesson_types) == 1:
+            name += f'_{self.lesson_types[0].capitalize()}'
+        return f'{name}.apkg'
+
+
+    def generate_decks(self) -> List[AnkiDeckGenerator]:
+        """
+        Build each level's decks, with one model per lesson type shared by all of its levels
+        """
+        models = {}
+        generators = []
+
+        for level in self.levels:
+            for lesson_type in self.lesson_types:
+                generator = DECK_GENERATORS[lesson_type](level, subdeck=True, image_optimizer=self.image_optimizer, sentence_rotation=self.sentence_rotation)
+                if lesson_type not in models:
+                    with run_recorder.span('model_build', level=level, lesson_type=lesson_type):
+                        generator.generate_model()
+                    models[lesson_type] = generator.anki_model
+                generator.anki_model = models[lesson_type]
+
+                with run_recorder.span('deck_build', level=level, lesson_type=lesson_type):
+                    generator.generate_deck()
+                generators.append(generator)
+
+        return generators
+
+
+    def save_package(self, generators: List[AnkiDeckGenerator]) -> None:
+        outdir = './data/decks'
+        Path(outdir).mkdir(parents=True, exist_ok=True)
+        fullpath = os.path.join(outdir, self.filename())
+
+        media_files: List[str] = []
+        media_names: Dict[str, str] = {}
+        media_sources: Dict[str, str] = {}
+        for generator in generators:
+            media_files += generator.media_files
+            media_names.update(generator.media_names)
+            media_sources.update(generator.media_sources)
+
+        timestamp = max(generator.build_timestamp() for generator in generators)
+        with run_recorder.span('package_write', level='all', lesson_type='combined'):
+            IncrementalPackageWriter(fullpath).write([generator.anki_deck for generator in generators], media_files, timestamp, media_names, media_sources)
+
+        for generator in generators:
+            generator.save_build_cache()
+
+        print(f"Finished generating {self.filename()}!")
+
+
+    def main(self):
+        self.save_package(self.generate_decks())
@@ -0,0 +1,245 @@
+"""
+Indexed queries over the scraped vocabulary and grammar lists
+
+Each (level, lesson type) list gets its own index segment under data/index, rebuilt only when that list's CSV
+changes. Run `python -m src.corpus_index --help` from the repository root for the command line.
+"""
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from src.list_store import list_csv_path, read_list
+from src.vocab_tags import process_vocab_type_tags
+
+
+LEVELS = ['n5', 'n4', 'n3', 'n2', 'n1']
+LESSON_TYPES = ['vocabulary', 'grammar']
+
+# bumped whenever the segment layout changes, so old segments are rebuilt
+INDEX_VERSION = 1
+TAG_PREFIX = 'JLPT_Sensei::'
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+class Entry(NamedTuple):
+    level: str
+    lesson_type: str
+    number: str
+    text: str
+    reading: str
+    meaning: str
+    tags: List[str]
+
+
+def ngrams(text: str) -> Set[str]:
+    """
+    Every single character and character pair in text
+    """
+    return set(text) | {text[i:i+2] for i in range(len(text) - 1)}
+
+
+def meaning_tokens(meaning: str) -> List[str]:
+    return TOKEN_PATTERN.findall(meaning.lower())
+
+
+def normalise_tag(tag: str) -> str:
+    """
+    Accept tags as the decks have them (JLPT_Sensei::godan_verb) or as the site writes them (Godan verb)
+    """
+    if tag.startswith(TAG_PREFIX):
+        return tag
+    return process_vocab_type_tags(tag)[0]
+
+
+class IndexSegment:
+    """
+    One level's list of a lesson type with its character n-gram, reading, tag and meaning token indexes
+    """
+    def __init__(self, level: str, lesson_type: str, data: dict) -> None:
+        self.level = level
+        self.lesson_type = lesson_type
+        self.signature = data['signature']
+
+        self.entries = [Entry(level, lesson_type, *entry) for entry in data['entries']]
+        self.ngrams = {gram: set(ids) for gram, ids in data['ngrams'].items()}
+        # (reading, entry id) pairs in reading order, a prefix is a contiguous run of them
+        self.readings = [tuple(pair) for pair in data['readings']]
+        self.tags = {tag: set(ids) for tag, ids in data['tags'].items()}
+        self.tokens = {token: set(ids) for token, ids in data['tokens'].items()}
+
+
+    @staticmethod
+    def build(level: str, lesson_type: str, signature: List[int]) -> dict:
+        """
+        Index a level's list, returning the segment's data as saved to disk
+        """
+        if lesson_type == 'vocabulary':
+            rows = [
+                (number, text, reading, meaning, process_vocab_type_tags(vocab_type) if vocab_type else [])
+                for number, text, reading, vocab_type, meaning in read_list(level, lesson_type, ['#', 'Vocabulary', 'Reading', 'Type', 'Meaning'])
+            ]
+        else:
+            rows = [
+                (number, text, reading, meaning, [])
+                for number, text, reading, meaning in read_list(level, lesson_type, ['#', 'Grammar', 'Reading', 'Meaning'])
+            ]
+
+        ngram_index: Dict[str, List[int]] = {}
+        tag_index: Dict[str, List[int]] = {}
+        token_index: Dict[str, List[int]] = {}
+        readings = []
+
+        for i, (number, text, reading, meaning, tags) in enumerate(rows):
+            for gram in ngrams(text):
+                ngram_index.setdefault(gram, []).append(i)
+            for tag in tags:
+                tag_index.setdefault(tag, []).append(i)
+            for token in set(meaning_tokens(meaning)):
+                token_index.setdefault(token, []).append(i)
+            # grammar written in kana has no separate reading
+            readings.append((reading or text, i))
+
+        return {
+            'version': INDEX_VERSION,
+            'signature': signature,
+            'entries': rows,
+            'ngrams': ngram_index,
+            'readings': sorted(readings),
+            'tags': tag_index,
+            'tokens': token_index,
+        }
+
+
+    def search(self, contains: Optional[str] = None, reading_prefix: Optional[str] = None, tags: Sequence[str] = (), meaning: Optional[str] = None) -> List[Entry]:
+        """
+        Entries matching every given condition, in list order
+        """
+        candidates: List[Set[int]] = []
+
+        if contains:
+            grams = [contains] if len(contains) == 1 else [contains[i:i+2] for i in range(len(contains) - 1)]
+            candidates += [self.ngrams.get(gram, set()) for gram in grams]
+        if reading_prefix:
+            start = bisect_left(self.readings, (reading_prefix,))
+            end = bisect_left(self.readings, (reading_prefix + '\U0010ffff',))
+            candidates.append({i for _, i in self.readings[start:end]})
+        for tag in tags:
+            candidates.append(self.tags.get(normalise_tag(tag), set()))
+        if meaning:
+            candidates += [self.tokens.get(token, set()) for token in meaning_tokens(meaning)]
+
+        if not candidates:
+            return list(self.entries)
+
+        # intersect from the smallest posting set up
+        candidates.sort(key=len)
+        ids = set(candidates[0])
+        for posting in candidates[1:]:
+            ids &= posting
+            if not ids:
+                return []
+
+        matches = [self.entries[i] for i in sorted(ids)]
+        if contains and len(contains) > 2:
+            # sharing every character pair doesn't make it a substring
+            matches = [entry for entry in matches if contains in entry.text]
+        return matches
+
+
+class CorpusIndex:
+    """
+    Query API over the index segments of every scraped level and lesson type
+    """
+    def __init__(self, segments: Iterable[IndexSegment]) -> None:
+        self.segments = {(segment.level, segment.lesson_type): segment for segment in segments}
+
+
+    @classmethod
+    def load(cls, levels: Sequence[str] = LEVELS, lesson_types: Sequence[str] = LESSON_TYPES, index_dir: str = './data/index') -> 'CorpusIndex':
+        """
+        Load the index segments of the given lists, rebuilding any whose list changed since it was indexed
+        """
+        segments = []
+        for level in levels:
+            for lesson_type in lesson_types:
+                try:
+                    csv_stat = os.stat(list_csv_path(level, lesson_type))
+                except FileNotFoundError:
+                    continue
+                signature = [csv_stat.st_size, csv_stat.st_mtime_ns]
+
+                segment_path = os.path.join(index_dir, f'{level}_{lesson_type}.json')
+                data = cls._load_segment(segment_path)
+                if data is None or data.get('version') != INDEX_VERSION or data['signature'] != signature:
+                    data = IndexSegment.build(level, lesson_type, signature)
+                    cls._save_segment(segment_path, data)
+
+                segments.append(IndexSegment(level, lesson_type, data))
+
+        return cls(segments)
+
+
+    def search(self, lesson_type: Optional[str] = None, levels: Optional[Sequence[str]] = None, contains: Optional[str] = None,
+               reading_prefix: Optional[str] = None, tags: Sequence[str] = (), meaning: Optional[str] = None) -> List[Entry]:
+        """
+        Find entries by headword substring, reading prefix, vocabulary type tags and words in their meaning,
+        e.g. search('vocabulary', ['n4', 'n3'], contains='食', tags=['verb'])
+        """
+        results = []
+        for (level, segment_type), segment in self.segments.items():
+            if (lesson_type is None or segment_type == lesson_type) and (levels is None or level in levels):
+                results += segment.search(contains, reading_prefix, tags, meaning)
+
+        return results
+
+
+    @staticmethod
+    def _load_segment(segment_path: str) -> Optional[dict]:
+        try:
+            with open(segment_path, encoding='utf8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+
+    @staticmethod
+    def _save_segment(segment_path: str, data: dict) -> None:
+        Path(os.path.dirname(segment_path)).mkdir(parents=True, exist_ok=True)
+        tmp_path = f'{segment_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, segment_path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Search the scraped JLPT Sensei vocabulary and grammar lists.")
+    parser.add_argument('--levels', nargs='+', choices=LEVELS, default=None, help="levels to search (default: all)")
+    parser.add_argument('--type', choices=LESSON_TYPES, default=None, help="lesson type to search (default: both)")
+    parser.add_argument('--contains', default=None, help="characters the word or grammar point contains, e.g. 食")
+    parser.add_argument('--reading', default=None, help="start of the reading, e.g. たべ")
+    parser.add_argument('--tag', nargs='+', default=[], help="vocabulary types, e.g. verb or 'Godan verb'")
+    parser.add_argument('--meaning', default=None, help="words in the English meaning, e.g. must")
+    args = parser.parse_args(argv)
+
+    corpus_index = CorpusIndex.load(args.levels or LEVELS, [args.type] if args.type else LESSON_TYPES)
+
+    start = time.perf_counter()
+    results = corpus_index.search(args.type, args.levels, args.contains, args.reading, args.tag, args.meaning)
+    query_ms = (time.perf_counter() - start) * 1000
+
+    for entry in results:
+        reading = f' ({entry.reading})' if entry.reading else ''
+        print(f"{entry.level.upper()} {entry.lesson_type:<10} {entry.number:>4}  {entry.text}{reading}  {entry.meaning}")
+    print(f"{len(results)} results in {query_ms:.3f} ms")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,480 @@
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin, urlsplit, quote
+import http.client
+import gzip
+import random
+import sys
+import threading
+import time
+from src.http_cache import HTTPCache
+from src.instrumentation import run_recorder, url_category
+
+
+# same user agent urlopen sent, which the site is known to accept
+USER_AGENT = 'Python-urllib/%d.%d' % sys.version_info[:2]
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+# responses worth trying again after a pause, the site being busy or briefly down
+RETRY_CODES = (429, 500, 502, 503, 504)
+# longest Retry-After a request will wait for before giving up
+MAX_RETRY_AFTER = 120.0
+SUPPORTED_SCHEMES = ('http', 'https')
+
+
+class NotCachedError(URLError):
+    """
+    An offline fetch of a url the cache doesn't have
+    """
+
+
+class UnsupportedSchemeError(URLError):
+    """
+    A url that isn't http or https, such as the data: placeholders of lazy loaded images, which no retry can fetch
+    """
+
+
+class ConnectionPool:
+    def __init__(self, timeout: float) -> None:
+        self.timeout = timeout
+        self._idle: Dict[Tuple[str, str], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+
+    def acquire(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        """
+        Reuse an idle keep-alive connection to the host, or open a new one
+        """
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                return idle.pop()
+
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+
+    def release(self, scheme: str, netloc: str, conn: http.client.HTTPConnection) -> None:
+        """
+        Hand a connection back so other worker threads can reuse it
+        """
+        with self._lock:
+            self._idle.setdefault((scheme, netloc), []).append(conn)
+
+
+    def close(self) -> None:
+        with self._lock:
+            for connections in self._idle.values():
+                for conn in connections:
+                    conn.close()
+            self._idle.clear()
+
+
+class HostRateLimiter:
+    """
+    Token bucket per host: requests spend a token, tokens refill at the host's rate up to burst
+
+    Each host starts at max_requests_per_second. An adaptive limiter cuts a host's rate by a quarter when it pushes back and
+    grows it by about one request per second every second while it doesn't (AIMD).
+    """
+    def __init__(self, max_requests_per_second: float, burst: int = 1, adaptive: bool = False, min_requests_per_second: float = 0.5) -> None:
+        self.max_rate = max_requests_per_second
+        self.min_rate = min(min_requests_per_second, max_requests_per_second)
+        self.burst = max(burst, 1)
+        self.adaptive = adaptive and max_requests_per_second > 0
+
+        self._rate: Dict[str, float] = {}
+        # the bucket is kept as the time it will next be full (generic cell rate algorithm)
+        self._full_at: Dict[str, float] = {}
+        self._paused_until: Dict[str, float] = {}
+        self._hold_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+
+    def rate(self, host: str) -> float:
+        return self._rate.get(host, self.max_rate)
+
+
+    def wait(self, host: str) -> None:
+        """
+        Block until a token for the host is available, and spend it
+        """
+        with self._lock:
+            now = time.monotonic()
+            paused_until = self._paused_until.get(host, 0)
+            if self.max_rate <= 0 and paused_until <= now:
+                return
+
+            interval = 1 / self.rate(host) if self.max_rate > 0 else 0
+            full_at = max(self._full_at.get(host, now), paused_until)
+            # how far ahead of the refill rate a burst may run
+            slot = max(now, full_at - (self.burst - 1) * interval, paused_until)
+            self._full_at[host] = max(full_at, slot) + interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+    def pause(self, host: str, seconds: float) -> None:
+        """
+        Hold back every request to the host, e.g. for as long as its Retry-After asked
+        """
+        with self._lock:
+            self._paused_until[host] = max(self._paused_until.get(host, 0), time.monotonic() + seconds)
+
+
+    def slow_down(self, host: str) -> None:
+        """
+        Cut the host's rate, at most once a second since requests already sent saw the same push back
+        """
+        if not self.adaptive:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._hold_until.get(host, 0):
+                self._rate[host] = max(self.min_rate, self.rate(host) * 0.75)
+                self._hold_until[host] = now + 1
+
+
+    def speed_up(self, host: str) -> None:
+        if not self.adaptive:
+            return
+        with self._lock:
+            rate = self.rate(host)
+            self._rate[host] = min(self.max_rate, rate + 1 / rate)
+
+
+class ConcurrencyController:
+    """
+    AIMD cap on requests in flight: the cap grows by one per cap's worth of good responses and halves on errors,
+    throttling or responses slower than slow_seconds, at most once per round trip
+    """
+    def __init__(self, max_limit: int, min_limit: int = 1, slow_seconds: float = 5.0) -> None:
+        self.max_limit = max(max_limit, 1)
+        self.min_limit = max(min(min_limit, self.max_limit), 1)
+        self.slow_seconds = slow_seconds
+        self.limit = float(self.max_limit)
+
+        self.in_flight = 0
+        self._hold_until = 0.0
+        self._condition = threading.Condition()
+
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+
+    def release(self, seconds: float, congested: bool) -> None:
+        with self._condition:
+            self.in_flight -= 1
+
+            now = time.monotonic()
+            if congested or seconds > self.slow_seconds:
+                # requests already in flight saw the same congestion, so they don't cut the cap again
+                if now >= self._hold_until:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self._hold_until = now + seconds
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            self._condition.notify_all()
+
+
+class RequestRecord(NamedTuple):
+    url: str
+    # final status, None when the request never got a response
+    status: Optional[int]
+    attempts: int
+    seconds: float
+    size: int
+
+
+class RequestMetrics:
+    """
+    Outcome of every fetch made through an engine
+    """
+    def __init__(self) -> None:
+        self.records: List[RequestRecord] = []
+        self._lock = threading.Lock()
+
+
+    def record(self, record: RequestRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+
+
+    def summary(self) -> dict:
+        with self._lock:
+            records = list(self.records)
+
+        latencies = sorted(record.seconds for record in records)
+        def percentile(p: float) -> float:
+            return latencies[min(int(p * len(latencies)), len(latencies) - 1)] if latencies else 0.0
+
+        return {
+            'requests': len(records),
+            'attempts': sum(record.attempts for record in records),
+            'retries': sum(record.attempts - 1 for record in records),
+            'failed': sum(1 for record in records if record.status is None or record.status >= 400),
+            'statuses': dict(Counter('error' if record.status is None else str(record.status) for record in records)),
+            'bytes': sum(record.size for record in records),
+            'p50_seconds': percentile(0.5),
+            'p95_seconds': percentile(0.95),
+            'p99_seconds': percentile(0.99),
+            'max_seconds': latencies[-1] if latencies else 0.0,
+        }
+
+
+class FetchEngine:
+    """
+    Bounded thread pool for fetching pages with a per-host rate cap and shared keep-alive connections
+
+    Failed requests are retried with jittered exponential backoff, honouring Retry-After, and unless adaptive is off
+    the request rate and the number of requests in flight adapt to how the site is coping.
+    """
+    def __init__(self, max_workers: int = 8, max_requests_per_second: float = 10.0, timeout: float = 30.0, cache: HTTPCache = None,
+                 max_retries: int = 4, backoff_seconds: float = 0.5, max_backoff_seconds: float = 30.0, adaptive: bool = True) -> None:
+        self.max_workers = max_workers
+        self.cache = cache
+        self.connection_pool = ConnectionPool(timeout)
+        self.rate_limiter = HostRateLimiter(max_requests_per_second, adaptive=adaptive)
+
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        # a fixed cap of max_workers when not adaptive
+        self.concurrency = ConcurrencyController(max_workers, min_limit=max_workers if not adaptive else 1, slow_seconds=timeout / 2)
+        self.metrics = RequestMetrics()
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+
+    def fetch(self, url: str) -> bytes:
+        """
+        GET a url and return the response body, raising HTTPError/URLError like urlopen would
+        """
+        requested_url = url
+        self._check_scheme(url)
+
+        if self.cache is not None and self.cache.offline:
+            entry = self.cache.lookup(url)
+            run_recorder.count('http_cache', outcome='offline_hit' if entry is not None else 'offline_miss', category=url_category(url))
+            if entry is None:
+                raise NotCachedError(f'{url} is not cached and the cache is offline')
+            return self.cache.read(url, entry)
+
+        for _ in range(MAX_REDIRECTS + 1):
+            entry = self.cache.lookup(url) if self.cache is not None else None
+            request_headers = self.cache.conditional_headers(entry) if entry is not None else {}
+
+            status, reason, headers, body = self._request_with_retries(url, request_headers)
+
+            if status == 304 and entry is not None:
+                run_recorder.count('http_cache', outcome='revalidated', category=url_category(url))
+                return self.cache.read(url, entry)
+            if status in REDIRECT_CODES and headers.get('Location'):
+                url = urljoin(url, headers['Location'])
+                self._check_scheme(url)
+                continue
+            if status >= 400:
+                raise HTTPError(url, status, reason, headers, None)
+
+            if self.cache is not None:
+                run_recorder.count('http_cache', outcome='changed' if entry is not None else 'miss', category=url_category(url))
+                self.cache.store(url, body, headers.get('ETag'), headers.get('Last-Modified'))
+                if url != requested_url:
+                    # also file the body under the url that was asked for so offline runs can follow redirects
+                    self.cache.store(requested_url, body)
+
+            return body
+
+        raise URLError(f'too many redirects for {url}')
+
+
+    def map(self, func: Callable, items: Iterable) -> list:
+        """
+        Run func over items on the worker pool, returning results in input order
+        """
+        return list(self._get_executor().map(run_recorder.profiled(func), items))
+
+
+    def imap(self, func: Callable, items: Iterable, window: Optional[int] = None) -> Iterator:
+        """
+        Run func over items on the worker pool, yielding results in input order as they are ready.
+        Items are taken lazily and at most window results are in flight or waiting to be consumed,
+        so a slow consumer holds the producer back instead of results piling up
+        """
+        window = window or self.max_workers * 2
+        executor = self._get_executor()
+        func = run_recorder.profiled(func)
+
+        pending = deque()
+        try:
+            for item in items:
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(func, item))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # a consumer that stops early leaves nothing queued behind it
+            for future in pending:
+                future.cancel()
+
+
+    def close(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+        self.connection_pool.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+    def _check_scheme(self, url: str) -> None:
+        scheme = urlsplit(url).scheme
+        if scheme not in SUPPORTED_SCHEMES:
+            # raised before any request, so it is never retried or counted as a failed request
+            raise UnsupportedSchemeError(f'{scheme or "no"} scheme in {url[:80]}, only http and https can be fetched')
+
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+
+    def _request_with_retries(self, url: str, extra_headers: Dict[str, str]) -> Tuple[int, str, http.client.HTTPMessage, bytes]:
+        """
+        Make a request, retrying connection errors and busy or failing responses, and record how it went
+        """
+        start = time.perf_counter()
+        host = urlsplit(url).netloc
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                status, reason, headers, body = self._request(url, extra_headers)
+            except URLError:
+                if attempt == self.max_retries:
+                    self._record(RequestRecord(url, None, attempt + 1, time.perf_counter() - start, 0))
+                    raise
+                time.sleep(self.backoff_delay(attempt))
+                continue
+
+            retry_after = self.retry_after(headers) if status in RETRY_CODES else None
+            # only throttling says the rate is too high, other errors are left to the concurrency cap
+            if status == 429 or retry_after is not None:
+                self.rate_limiter.slow_down(host)
+            elif status < 500:
+                self.rate_limiter.speed_up(host)
+
+            if status not in RETRY_CODES or attempt == self.max_retries:
+                self._record(RequestRecord(url, status, attempt + 1, time.perf_counter() - start, len(body)))
+                return status, reason, headers, body
+
+            if retry_after is not None:
+                if retry_after > MAX_RETRY_AFTER:
+                    self._record(RequestRecord(url, status, attempt + 1, time.perf_counter() - start, len(body)))
+                    return status, reason, headers, body
+                # the site asked every client to hold off, not just this request
+                self.rate_limiter.pause(host, retry_after)
+                time.sleep(retry_after)
+            else:
+                time.sleep(self.backoff_delay(attempt))
+
+
+    def _record(self, record: RequestRecord) -> None:
+        self.metrics.record(record)
+
+        category = url_category(record.url)
+        run_recorder.observe('request_seconds', record.seconds, category=category)
+        run_recorder.count('requests', category=category, status='error' if record.status is None else str(record.status))
+        run_recorder.count('bytes', record.size, category=category)
+        run_recorder.count('retries', record.attempts - 1, category=category)
+        if record.status is None or record.status >= 400:
+            run_recorder.count('failures', category=category)
+
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        Full jitter exponential backoff, so retrying workers don't come back in lockstep
+        """
+        return random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt))
+
+
+    def retry_after(self, headers: http.client.HTTPMessage) -> Optional[float]:
+        """
+        Seconds a Retry-After header asks to wait, given as seconds or as an http date
+        """
+        value = headers.get('Retry-After')
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+
+    def _request(self, url: str, extra_headers: Dict[str, str]) -> Tuple[int, str, http.client.HTTPMessage, bytes]:
+        parts = urlsplit(url)
+        # non-ascii characters in hrefs have to be percent encoded before going on the wire
+        path = quote(parts.path or '/', safe="/%:@!$&'()*+,;=-._~")
+        if parts.query:
+            path += '?' + parts.query
+
+        request_headers = {
+            'User-Agent': USER_AGENT,
+            'Accept-Encoding': 'gzip',
+            'Connection': 'keep-alive',
+            **extra_headers,
+        }
+
+        self.concurrency.acquire()
+        self.rate_limiter.wait(parts.netloc)
+        start = time.perf_counter()
+        congested = True
+        try:
+            status, reason, headers, body = self._exchange(parts.scheme, parts.netloc, path, request_headers)
+            congested = status in RETRY_CODES
+            return status, reason, headers, body
+        finally:
+            self.concurrency.release(time.perf_counter() - start, congested)
+
+
+    def _exchange(self, scheme: str, netloc: str, path: str, request_headers: Dict[str, str]) -> Tuple[int, str, http.client.HTTPMessage, bytes]:
+        # an idle keep-alive connection may have been dropped by the server, so retry once on a fresh one
+        for attempt in range(2):
+            conn = self.connection_pool.acquire(scheme, netloc)
+            try:
+                conn.request('GET', path, headers=request_headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if attempt == 0:
+                    continue
+                raise URLError(e)
+
+            if response.will_close:
+                conn.close()
+            else:
+                self.connection_pool.release(scheme, netloc, conn)
+
+            if response.getheader('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+
+            return response.status, response.reason, response.headers, body
@@ -1,27 +1,27 @@
-import random
-import csv
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 import genanki
 
-from src.anki_deck_generator import AnkiDeckGenerator
+from src.anki_deck_generator import AnkiDeckGenerator, load_templates
+from src.image_downloader import is_complete_image_file
+from src.image_optimizer import ImageOptimizer
+from src.instrumentation import run_recorder
+from src.incremental_package_writer import file_sha256
 
 
 class GrammarDeckGenerator(AnkiDeckGenerator):
-    def __init__(self, level: str) -> None:
-        super().__init__(level)
+    def __init__(self, level: str, subdeck: bool = False, image_optimizer: Optional[ImageOptimizer] = None, sentence_rotation: int = 0) -> None:
+        super().__init__(level, subdeck, image_optimizer, sentence_rotation)
         self.LESSON_TYPE = 'grammar'
+        # flashcard index -> whether its image is a complete jpeg or png on disk
+        self.available_images: Dict[str, bool] = {}
 
 
     def generate_model(self) -> None:
-        # generate a unique model id
-        model_id = random.randrange(1 << 30, 1 << 31)
+        # derive the model id from its name, so rebuilt decks update the same note type in Anki
+        model_id = self.model_id()
 
-        # read template html and css files to assign to model properties
-        with open(f'src/template/{self.LESSON_TYPE}_recognition_front.html', 'r') as f:
-            front_template_html = f.read()
-        with open(f'src/template/{self.LESSON_TYPE}_recognition_back.html', 'r') as f:
-            back_template_html = f.read()
-        with open(f'src/template/{self.LESSON_TYPE}_recognition.css', 'r') as f:
-            template_css = f.read()
+        # template html and css files are read once and shared by every deck of this lesson type
+        front_template_html, back_template_html, template_css = load_templates(self.LESSON_TYPE)
 
         grammar_model = genanki.Model(
             model_id,
@@ -48,31 +48,71 @@ class GrammarDeckGenerator(AnkiDeckGenerator):
         self.anki_model = grammar_model
 
 
-    def generate_deck(self) -> None:
+    def generate_deck(self, rows: Optional[Iterable[Sequence[str]]] = None) -> None:
         print(f"Generating {self.jlpt_level.capitalize()} {self.LESSON_TYPE} deck...", end='\r')
 
-        deck_id = random.randrange(1 << 30, 1 << 31)
-        grammar_deck = genanki.Deck(deck_id, f'JLPT Sensei {self.jlpt_level.upper()} {self.LESSON_TYPE.capitalize()}')
+        grammar_deck = genanki.Deck(self.deck_id(), self.deck_name())
 
-        with open(f'data/{self.LESSON_TYPE}/{self.jlpt_level}_{self.LESSON_TYPE}_list.csv', encoding='utf8') as grammar_csv:
-            grammar_csv_reader = csv.reader(grammar_csv, delimiter=',')
-            next(grammar_csv_reader) # skip column headings
+        self.load_build_cache()
 
-            for row in grammar_csv_reader:
-                g_index, grammar, g_reading, g_meaning, g_source = list(row)
-                relative_img_path = f'<img src="flashcard{g_index}.jpg">'
-                grammar_note = genanki.Note(
-                    model=self.anki_model,
-                    fields=[grammar, g_reading, g_meaning, '', '', '', relative_img_path, g_source, g_index]
-                )
+        # rows can also be streamed straight from a scrape instead of read from the saved list
+        self.media_files = []
+        for row in self.read_rows() if rows is None else rows:
+            grammar_deck.add_note(self.build_note(row))
+            if self.has_image(row[0]):
+                self.media_files.append(self.image_path(row[0]))
 
-                grammar_deck.add_note(grammar_note)
-        
-        self.media_files = [f"data/grammar/flashcard_images/{self.jlpt_level}/flashcard{g_index}.jpg" for g_index in range(1, len(grammar_deck.notes)+1)]
+        # the package gets smaller re-encoded copies of the flashcards, under the originals' names
+        with run_recorder.span('image_optimize', level=self.jlpt_level, lesson_type=self.LESSON_TYPE):
+            self.media_sources = self.image_optimizer.optimize(self.media_files)
         self.anki_deck = grammar_deck
     
 
+    def note_extras(self, row: List[str]) -> Optional[str]:
+        return self.media_name(row[0]) if self.has_image(row[0]) else None
+
+
+    def note_data(self, row: List[str]) -> Tuple[List[str], List[str], str]:
+        g_index, grammar, g_reading, g_meaning, g_source = list(row)
+        relative_img_path = f'<img src="{self.media_name(g_index)}">' if self.has_image(g_index) else ''
+        fields = [grammar, g_reading, g_meaning, '', '', '', relative_img_path, g_source, g_index]
+
+        # each grammar point has its own lesson page
+        return fields, [], g_source
+
+
+    def image_path(self, g_index) -> str:
+        return f"data/grammar/flashcard_images/{self.jlpt_level}/flashcard{g_index}.jpg"
+
+
+    def has_image(self, g_index) -> bool:
+        """
+        Whether a flashcard was downloaded, a missing or failed one, or a placeholder, leaves its note without an image
+        """
+        if g_index not in self.available_images:
+            self.available_images[g_index] = is_complete_image_file(self.image_path(g_index))
+            if not self.available_images[g_index]:
+                print(f"No flashcard image for {self.jlpt_level.capitalize()} grammar #{g_index}, its note has none")
+        return self.available_images[g_index]
+
+
+    def media_name(self, g_index) -> str:
+        """
+        Name of a flashcard image inside the package, by content in combined packages where every level's
+        flashcard1.jpg would otherwise collide and identical images are stored once
+        """
+        if not self.subdeck:
+            return f'flashcard{g_index}.jpg'
+
+        path = self.image_path(g_index)
+        if path not in self.media_names:
+            self.media_names[path] = f'flashcard_{file_sha256(path)[:16]}.jpg'
+        return self.media_names[path]
+
+
     def main(self):
-        self.generate_model()
-        self.generate_deck()
+        with run_recorder.span('model_build', level=self.jlpt_level, lesson_type=self.LESSON_TYPE):
+            self.generate_model()
+        with run_recorder.span('deck_build', level=self.jlpt_level, lesson_type=self.LESSON_TYPE):
+            self.generate_deck()
         self.save_deck()
@@ -1,107 +1,160 @@
-from urllib.request import urlopen, urlretrieve
 from urllib.error import HTTPError, URLError
-from bs4 import BeautifulSoup, NavigableString
-import pandas as pd
+from urllib.parse import urljoin
+from typing import Iterator, List, Optional
 import os
-from pathlib import Path
+import threading
 from src.jlptsensei_scraper import JLPTSenseiScraper
+from src.fetch_engine import FetchEngine
+from src.row_accumulator import RowAccumulator
+from src.checkpoint_journal import CheckpointJournal
+from src.page_extractors import extract_grammar_rows, extract_header_image
+from src.image_downloader import ImageDownloader, is_complete_image_file
+from src.instrumentation import run_recorder
+
+
+def flashcard_image_path(level: str, g_index: str) -> str:
+    return os.path.join(f'./data/grammar/flashcard_images/{level}', f'flashcard{g_index}.jpg')
 
 
 class GrammarScraper(JLPTSenseiScraper):
-    def __init__(self, level: str) -> None:
-        super().__init__(level)
+    COLUMN_NAMES = ['#', 'Grammar', 'Reading', 'Meaning', 'Source']
+
+    def __init__(self, level: str, fetch_engine: FetchEngine = None, base_url: str = None) -> None:
+        super().__init__(level, fetch_engine, base_url)
 
         self.LESSON_TYPE = 'grammar'
 
-        column_names = ['#', 'Grammar', 'Reading', 'Meaning', 'Source']
-        self.scraped_df = pd.DataFrame(columns=column_names)
+        self.scraped_rows = RowAccumulator(self.COLUMN_NAMES)
+        self.journal = CheckpointJournal(self.jlpt_level, self.LESSON_TYPE)
+
+        self.image_downloader = ImageDownloader(self.fetch_engine, self.jlpt_level)
+
+        self.scraped_pages = 0
+        self.pages_to_scrape = 0
+        self.progress_lock = threading.Lock()
 
 
     def scrape(self) -> None:
-        page_number = 1
-
-        while True:
-            try:
-                html = urlopen(f'https://jlptsensei.com/jlpt-{self.jlpt_level}-grammar-list/page/{page_number}')
-            except HTTPError as e:
-                print(e)
-                break
-            except URLError as e:
-                print(e)
-                break
-            
-            print(f"Scraping {self.jlpt_level.capitalize()} grammar, page {page_number}...", end='\r')
-
-            bs = BeautifulSoup(html, 'lxml')
-
-            try:
-                table_element = bs.find('table', {'id': 'jl-grammar'})
-
-                # get table rows
-                tr_elements = table_element.tbody.find_all('tr', {'class': 'jl-row'})
-                # get table data in rows
-                for tr in tr_elements:
-                    row_data = []
-                    for td_element in tr.find_all('td'):
-                        if td_element['class'][0] == 'jl-td-gj':
-                            splitted_td = td_element.string.split('（')
-                            row_data.append(splitted_td[0])
-                            if len(splitted_td) == 2:
-                                row_data.append(f'{splitted_td[1].split("）")[0]}')
-                            else:
-                                row_data.append('')
-                        elif td_element['class'][0] == 'jl-td-gr':
-                            # skip the romaji readings from grammar table
-                            pass
-                        else:
-                            row_data.append(td_element.string)
-
-                    # append grammar lesson source link for more details
-                    row_data.append(tr.find('a', href=True)['href'])
-
-                    # insert row data into dataframe
-                    self.scraped_df.loc[len(self.scraped_df)] = row_data
-            except AttributeError as e:
-                print("No more table pages...", end='\r')
-                break
-
-            # increment variable to scrape next table page
-            page_number += 1
+        list_pages = self.fetch_list_pages(self.list_url())
+        for rows in list_pages:
+            for row_data in rows:
+                self.scraped_rows.append(row_data)
 
         self.df_to_csv()
         print(f"Finished scraping {self.jlpt_level.capitalize()} grammar tables.")
 
-        # # get more data from each grammar point link
-        for index, df_row in self.scraped_df.iterrows():
-            self.scrape_images(df_row)
+        rows_to_scrape = [df_row for df_row in self.scraped_rows.records() if self.needs_image(df_row)]
+
+        # get more data from each grammar point link, concurrently on the fetch engine
+        self.pages_to_scrape = len(rows_to_scrape)
+        with run_recorder.span('detail_fetch', level=self.jlpt_level, lesson_type=self.LESSON_TYPE):
+            image_urls = self.fetch_engine.map(self.scrape_images, rows_to_scrape)
+
+        found = [(df_row, img_url) for df_row, img_url in zip(rows_to_scrape, image_urls) if img_url is not None]
+
+        # then download the flashcard images themselves, again concurrently
+        with run_recorder.span('image_download', level=self.jlpt_level, lesson_type=self.LESSON_TYPE):
+            saved = self.image_downloader.download([(img_url, self.image_path(df_row), df_row['Source']) for df_row, img_url in found])
+        for (df_row, _), is_saved in zip(found, saved):
+            if is_saved:
+                self.journal.record('image', df_row['Source'], self.image_path(df_row))
+        print(f"Saved {sum(saved)}/{len(rows_to_scrape)} grammar flashcards.")
 
+        self.journal.clear()
         print(f"Finished scraping {self.jlpt_level.capitalize()} grammar flashcard images.")
 
 
-    def scrape_images(self, df_row) -> None:
+    def stream_rows(self, queue_size: int) -> Iterator[List[str]]:
+        list_rows = self.iter_list_rows(self.list_url())
+
+        def add_image(row_data: list) -> list:
+            df_row = dict(zip(self.scraped_rows.column_names, row_data))
+            if self.needs_image(df_row):
+                img_url = self.scrape_images(df_row)
+                if img_url is not None:
+                    self.save_image(df_row, img_url)
+            return row_data
+
+        # a grammar point's lesson and image are fetched while earlier points are already on their way into the deck
+        try:
+            for row_data in self.fetch_engine.imap(add_image, list_rows, queue_size):
+                self.scraped_rows.append(row_data)
+                yield ['' if value is None else value for value in row_data]
+        finally:
+            self.close()
+
+
+    def close(self) -> None:
+        self.image_downloader.save_manifest()
+
+
+    def parse_list_page(self, html: bytes) -> Optional[List[list]]:
+        return extract_grammar_rows(html)
+
+
+    def needs_image(self, df_row: dict) -> bool:
         """
-        Scrape grammar point links to obtain futher data
+        An image is only fetched again if its grammar point moved to a different index or went missing.
+        What each file holds is taken from the downloads that finished, never from the saved list, which is written
+        before the images are
         """
-        try:
-            html = urlopen(df_row['Source'])
-        except HTTPError as e:
-            print(e)
-        except URLError as e:
-            print(e)
+        image_path = self.image_path(df_row)
+        already_saved = (
+            self.journal.get('image', df_row['Source']) == image_path
+            or self.image_downloader.saved_page(image_path) == df_row['Source']
+        )
+        return not (already_saved and is_complete_image_file(image_path))
+
+
+    def image_path(self, df_row: dict) -> str:
+        return flashcard_image_path(self.jlpt_level, df_row['#'])
+
+
+    def save_image(self, df_row: dict, img_url: str) -> bool:
+        """
+        Download a grammar point's flashcard image, returning whether it is now on disk
+        """
+        image_path = self.image_path(df_row)
+        if not self.image_downloader.download_image(img_url, image_path, df_row['Source']):
+            return False
+        self.journal.record('image', df_row['Source'], image_path)
+        return True
 
-        bs = BeautifulSoup(html, 'lxml')
 
+    def scrape_images(self, df_row: dict) -> Optional[str]:
+        """
+        Scrape grammar point links to obtain futher data, returning the flashcard image url
+        """
         try:
-            img_element = bs.find('img', {'id': 'header-image'})
+            return self.find_image(df_row)
         except URLError as e:
-            print(f"{e}. No flashcard image found for {df_row['Grammar Lesson']}")
-        
-        outdir = f'./data/grammar/flashcard_images/{self.jlpt_level}'
-        Path(outdir).mkdir(parents=True, exist_ok=True)
-        filename = f'flashcard{df_row["#"]}.jpg'
-        fullpath = os.path.join(outdir, filename)
+            print(f"{e} for #{df_row['#']} {df_row['Grammar']}")
+            return None
 
-        # save flashcard image
-        urlretrieve(img_element['src'], fullpath)
 
-        print(f"Saved {df_row['#']}/{len(self.scraped_df.index)} grammar flashcards.", end='\r')
+    def find_image(self, df_row: dict) -> Optional[str]:
+        """
+        The flashcard image url on a grammar point's lesson, None if the lesson or its image is missing.
+        Other failures to fetch the lesson are raised
+        """
+        try:
+            html = self.fetch(df_row['Source'])
+        except HTTPError as e:
+            if e.code != 404:
+                raise
+            print(f"{e} for #{df_row['#']} {df_row['Grammar']}")
+            return None
+
+        with self.progress_lock:
+            self.scraped_pages += 1
+            # a streamed scrape doesn't know how many are left
+            total = f"/{self.pages_to_scrape}" if self.pages_to_scrape else ''
+            print(f"Scraped {self.scraped_pages}{total} grammar lessons.", end='\r')
+
+        with run_recorder.span('parse', level=self.jlpt_level, lesson_type=self.LESSON_TYPE, page='grammar_lesson'):
+            img_src = extract_header_image(html)
+        if img_src is None:
+            print(f"No flashcard image found for #{df_row['#']} {df_row['Grammar']}")
+            return None
+
+        return urljoin(df_row['Source'], img_src)
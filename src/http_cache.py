@@ -0,0 +1,144 @@
+from pathlib import Path
+from typing import NamedTuple, Optional
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+class CacheEntry(NamedTuple):
+    sha256: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class HTTPCache:
+    """
+    Content-addressed on-disk cache of HTTP responses keyed by url, revalidated with conditional GETs
+    """
+    def __init__(self, cache_dir: str = './data/cache', max_size_bytes: int = 512 * 1024 * 1024, offline: bool = False) -> None:
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.max_size_bytes = max_size_bytes
+        # offline caches never go to the network, every lookup is answered from disk or fails
+        self.offline = offline
+
+        Path(self.objects_dir).mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite3'), check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+        self._db.commit()
+
+
+    def lookup(self, url: str) -> Optional[CacheEntry]:
+        """
+        Return the cache entry for a url, if its body is still on disk
+        """
+        with self._lock:
+            row = self._db.execute('SELECT sha256, etag, last_modified FROM responses WHERE url = ?', (url,)).fetchone()
+
+        if row is None or not os.path.exists(self._object_path(row[0])):
+            return None
+        return CacheEntry(*row)
+
+
+    def conditional_headers(self, entry: CacheEntry) -> dict:
+        """
+        Request headers for revalidating a cached response with the server
+        """
+        headers = {}
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+
+    def read(self, url: str, entry: CacheEntry) -> bytes:
+        """
+        Read a cached body and mark it as recently used
+        """
+        with open(self._object_path(entry.sha256), 'rb') as f:
+            body = f.read()
+
+        with self._lock:
+            self._db.execute('UPDATE responses SET last_access = ? WHERE url = ?', (time.time(), url))
+            self._db.commit()
+
+        return body
+
+
+    def store(self, url: str, body: bytes, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """
+        Save a response body under its content hash and point the url at it
+        """
+        sha256 = hashlib.sha256(body).hexdigest()
+        object_path = self._object_path(sha256)
+
+        if not os.path.exists(object_path):
+            Path(os.path.dirname(object_path)).mkdir(parents=True, exist_ok=True)
+            # write to a temp file first so a crash never leaves a truncated object behind
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(object_path))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, object_path)
+
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (url, sha256, etag, last_modified, len(body), time.time())
+            )
+            self._db.commit()
+
+        self.evict()
+
+
+    def evict(self) -> None:
+        """
+        Drop least recently used responses until the cache fits in max_size_bytes
+        """
+        with self._lock:
+            # identical bodies share one object, so only count each object once
+            total_size, = self._db.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT sha256, size FROM responses)'
+            ).fetchone()
+            if total_size <= self.max_size_bytes:
+                return
+
+            lru_rows = self._db.execute('SELECT url, sha256, size FROM responses ORDER BY last_access').fetchall()
+            for url, sha256, size in lru_rows:
+                if total_size <= self.max_size_bytes:
+                    break
+
+                self._db.execute('DELETE FROM responses WHERE url = ?', (url,))
+                still_referenced = self._db.execute('SELECT 1 FROM responses WHERE sha256 = ? LIMIT 1', (sha256,)).fetchone()
+                if not still_referenced:
+                    total_size -= size
+                    try:
+                        os.remove(self._object_path(sha256))
+                    except FileNotFoundError:
+                        pass
+
+            self._db.commit()
+
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+    def _object_path(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
@@ -0,0 +1,172 @@
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from src.instrumentation import run_recorder
+
+if TYPE_CHECKING:
+    # deck builds hash images with file_sha256 without loading the network stack
+    from src.fetch_engine import FetchEngine
+
+
+JPEG_START, JPEG_END = b'\xff\xd8\xff', b'\xff\xd9'
+PNG_START, PNG_END = b'\x89PNG\r\n\x1a\n', b'IEND\xaeB`\x82'
+
+
+def is_complete_image(data: bytes) -> bool:
+    """
+    Check an image has both its start and end markers, so a truncated download is never kept.
+    Only JPEG and PNG are recognised, which also rejects the site's lazy loading placeholders, svg images that
+    are neither and aren't flashcards
+    """
+    if data.startswith(JPEG_START):
+        # some encoders pad a few bytes after the end of image marker
+        return JPEG_END in data[-32:]
+    if data.startswith(PNG_START):
+        return data.endswith(PNG_END)
+    return False
+
+
+def is_complete_image_file(path: str) -> bool:
+    try:
+        with open(path, 'rb') as f:
+            return is_complete_image(f.read())
+    except FileNotFoundError:
+        return False
+
+
+def file_sha256(path: str) -> Optional[str]:
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+class ImageDownloader:
+    """
+    Concurrent flashcard image downloads into a content-hash store shared by every level
+    """
+    def __init__(self, fetch_engine: 'FetchEngine', level: str, images_dir: str = './data/grammar/flashcard_images') -> None:
+        self.fetch_engine = fetch_engine
+        self.store_dir = os.path.join(images_dir, 'store')
+        # records the source url, content hash and the page linking to it of every image linked out of the store,
+        # one per level so levels scraped in parallel never write the same manifest
+        self.manifest_path = os.path.join(images_dir, 'manifests', f'{level}.json')
+
+        self._lock = threading.Lock()
+        self.manifest: Dict[str, Dict[str, str]] = self._load_manifest()
+
+
+    def download(self, images: List[Tuple[str, ...]]) -> List[bool]:
+        """
+        Download (url, destination path[, page]) tuples concurrently, returning whether each image is now on disk
+        """
+        results = self.fetch_engine.map(lambda image: self.download_image(*image), images)
+        self.save_manifest()
+        return results
+
+
+    def download_image(self, url: str, dest_path: str, page: Optional[str] = None) -> bool:
+        """
+        Make dest_path hold the image at url, skipping the request if the file already matches its manifest hash.
+        The page the image was found on is recorded with it, for saved_page
+        """
+        manifest_key = os.path.normpath(dest_path)
+        entry = self.manifest.get(manifest_key)
+        if entry is not None and entry['url'] == url and file_sha256(dest_path) == entry['sha256']:
+            with self._lock:
+                self.manifest[manifest_key] = {**entry, 'page': page}
+            run_recorder.count('images', outcome='unchanged')
+            return True
+
+        try:
+            data = self.fetch_engine.fetch(url)
+        except (HTTPError, URLError) as e:
+            print(f"{e} for {url}")
+            run_recorder.count('images', outcome='failed')
+            return False
+
+        if not is_complete_image(data):
+            print(f"Incomplete or unrecognised image from {url}, not saved")
+            run_recorder.count('images', outcome='incomplete')
+            return False
+
+        sha256 = hashlib.sha256(data).hexdigest()
+        # identical images already in place only need their manifest entry
+        if file_sha256(dest_path) != sha256:
+            store_path = self._store(sha256, data)
+            self._link(store_path, dest_path)
+            run_recorder.count('images', outcome='saved')
+        else:
+            run_recorder.count('images', outcome='identical')
+
+        with self._lock:
+            self.manifest[manifest_key] = {'url': url, 'sha256': sha256, 'page': page}
+
+        return True
+
+
+    def saved_page(self, dest_path: str) -> Optional[str]:
+        """
+        The page whose image dest_path holds, or None if it doesn't hold the image last downloaded to it.
+        Only a finished download updates the manifest, so a failed or interrupted one never passes for the new page
+        """
+        entry = self.manifest.get(os.path.normpath(dest_path))
+        if entry is None or file_sha256(dest_path) != entry['sha256']:
+            return None
+        return entry.get('page')
+
+
+    def _store(self, sha256: str, data: bytes) -> str:
+        store_path = os.path.join(self.store_dir, sha256[:2], f'{sha256}.jpg')
+        if not os.path.exists(store_path):
+            Path(os.path.dirname(store_path)).mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(store_path), suffix='.part')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # mkstemp files are owner-only, images should be readable like any other download
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, store_path)
+
+        return store_path
+
+
+    def _link(self, store_path: str, dest_path: str) -> None:
+        """
+        Point dest_path at a stored image, hard linked where possible, swapped in atomically
+        """
+        dest_dir = os.path.dirname(dest_path)
+        Path(dest_dir).mkdir(parents=True, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix='.part')
+        os.close(fd)
+        os.remove(tmp_path)
+        try:
+            os.link(store_path, tmp_path)
+        except OSError:
+            shutil.copyfile(store_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+
+
+    def _load_manifest(self) -> Dict[str, Dict[str, str]]:
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+
+    def save_manifest(self) -> None:
+        with self._lock:
+            Path(os.path.dirname(self.manifest_path)).mkdir(parents=True, exist_ok=True)
+            tmp_path = f'{self.manifest_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.manifest, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,129 @@
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import importlib.util
+import os
+import tempfile
+
+from src.image_downloader import file_sha256
+from src.instrumentation import run_recorder
+
+
+def optimize_image(source_path: str, dest_path: str, max_size: Tuple[int, int], quality: int) -> bool:
+    """
+    Re-encode an image as a JPEG that fits in max_size, with no metadata kept, returning whether it could be read.
+    Runs in a worker process
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(source_path) as image:
+            image.thumbnail(max_size, Image.LANCZOS)
+            if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+                # jpeg has no alpha, so transparent areas go white like the card behind them
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path), suffix='.part')
+            with os.fdopen(fd, 'wb') as f:
+                # no exif or icc_profile is passed on, so neither is written
+                image.save(f, 'JPEG', quality=quality, optimize=True, progressive=True)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return False
+
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, dest_path)
+    return True
+
+
+class ImageOptimizer:
+    """
+    Makes smaller copies of flashcard images for packaging, re-encoded across cores on a process pool
+
+    Copies are cached by the hash of their source and the settings they were made with, so an image is only
+    processed again once it or the settings change. Images Pillow can't read, and every image if Pillow isn't
+    installed, are packaged as they are.
+    """
+    def __init__(self, max_size: Tuple[int, int] = (600, 600), quality: int = 80, enabled: bool = True,
+                 cache_dir: str = './data/grammar/flashcard_images/optimized', max_workers: Optional[int] = None) -> None:
+        self.max_size = max_size
+        self.quality = quality
+        self.enabled = enabled
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+
+
+    @staticmethod
+    def available() -> bool:
+        return importlib.util.find_spec('PIL') is not None
+
+
+    def variant_path(self, source_sha256: str) -> str:
+        width, height = self.max_size
+        return os.path.join(self.cache_dir, source_sha256[:2], f'{source_sha256}-{width}x{height}-q{self.quality}.jpg')
+
+
+    def optimize(self, paths: List[str]) -> Dict[str, str]:
+        """
+        Map each image path to the file to package for it, its optimized copy or else the image itself
+        """
+        if not self.enabled:
+            return {path: path for path in paths}
+        if not self.available():
+            print("Pillow isn't installed, packaging flashcard images as they are")
+            return {path: path for path in paths}
+
+        packaged: Dict[str, str] = {}
+        # variant path -> a source to make it from, identical images are processed once
+        to_process: Dict[str, str] = {}
+        for path in paths:
+            source_sha256 = file_sha256(path)
+            if source_sha256 is None:
+                # left for the package writer to report
+                packaged[path] = path
+                continue
+
+            variant = self.variant_path(source_sha256)
+            packaged[path] = variant
+            if os.path.exists(variant):
+                run_recorder.count('image_variants', outcome='cached')
+            elif os.path.exists(f'{variant}.unsupported'):
+                packaged[path] = path
+                run_recorder.count('image_variants', outcome='unsupported')
+            else:
+                to_process.setdefault(variant, path)
+
+        if to_process:
+            self._process(to_process)
+            for path, variant in packaged.items():
+                if variant in to_process and not os.path.exists(variant):
+                    packaged[path] = path
+
+        return packaged
+
+
+    def _process(self, to_process: Dict[str, str]) -> None:
+        # only loaded when there are images to make, a cached build never starts a pool
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+
+        for variant in to_process:
+            Path(os.path.dirname(variant)).mkdir(parents=True, exist_ok=True)
+
+        # spawned rather than forked, the deck builds calling this run on threads of their own
+        with ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = list(pool.map(
+                optimize_image, to_process.values(), to_process.keys(),
+                [self.max_size] * len(to_process), [self.quality] * len(to_process),
+            ))
+
+        for variant, optimized in zip(to_process, results):
+            if optimized:
+                run_recorder.count('image_variants', outcome='optimized')
+            else:
+                # remembered so a file Pillow can't read, such as an svg, isn't tried on every build
+                Path(f'{variant}.unsupported').touch()
+                run_recorder.count('image_variants', outcome='unsupported')
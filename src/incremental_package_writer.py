@@ -0,0 +1,219 @@
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import genanki
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import zipfile
+
+from genanki.apkg_col import APKG_COL
+from genanki.apkg_schema import APKG_SCHEMA
+
+
+# fixed zip entry time so an unchanged deck is written byte for byte the same
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+# already compressed media gains nothing from deflate, so it's stored as is
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp3', '.ogg')
+
+
+def file_sha256(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class IncrementalPackageWriter:
+    """
+    Writes an .apkg by patching the previous build's collection with only the inserted, updated and deleted notes
+
+    Only the collection is incremental. An .apkg is a zip archive, which can't have entries replaced in place, so
+    whenever any note or media file changes the archive is written again in full, every media file included. It is
+    only left alone when nothing changed at all.
+    """
+    def __init__(self, fullpath: str, state_dir: str = './data/decks/.build') -> None:
+        self.fullpath = fullpath
+
+        build_name = os.path.splitext(os.path.basename(fullpath))[0]
+        self.state_dir = os.path.join(state_dir, build_name)
+        self.collection_path = os.path.join(self.state_dir, 'collection.anki2')
+        self.manifest_path = os.path.join(self.state_dir, 'manifest.json')
+
+
+    def write(self, decks: List[genanki.Deck], media_files: List[str], timestamp: float, media_names: Optional[Dict[str, str]] = None,
+              media_sources: Optional[Dict[str, str]] = None) -> None:
+        """
+        Bring the package at fullpath up to date with decks and media_files, packaged under their media_names
+        if given or their own file names otherwise, with the content of their media_sources file if they have one,
+        such as an optimized copy. Files that share a package name are stored once
+        """
+        Path(self.state_dir).mkdir(parents=True, exist_ok=True)
+        # package name -> path, the first path wins for media packaged under the same name
+        media_paths: Dict[str, str] = {}
+        for path in media_files:
+            media_paths.setdefault((media_names or {}).get(path, os.path.basename(path)), (media_sources or {}).get(path, path))
+
+        manifest = self._load_manifest()
+
+        notes = {note.guid: (deck.deck_id, note) for deck in decks for note in deck.notes}
+        note_hashes = {guid: self._note_hash(deck_id, note) for guid, (deck_id, note) in notes.items()}
+        schema_hash = self._schema_hash(decks)
+
+        # anything that isn't a note change (models, templates, deck names) or a collection that doesn't
+        # match the manifest means starting over from an empty collection
+        if manifest.get('schema') != schema_hash or manifest.get('collection') != self._collection_hash():
+            self._build_collection(decks, timestamp)
+            changed_notes = len(notes)
+        else:
+            changed_notes = self._patch_collection(manifest['notes'], note_hashes, notes, timestamp)
+
+        media = self._media_index(manifest.get('media', {}), media_paths)
+
+        if changed_notes or media != manifest.get('media') or not os.path.exists(self.fullpath):
+            self._write_archive(media, media_paths)
+
+        self._save_manifest({
+            'schema': schema_hash,
+            'collection': self._collection_hash(),
+            'notes': note_hashes,
+            'media': media,
+        })
+
+
+    def _build_collection(self, decks: List[genanki.Deck], timestamp: float) -> None:
+        tmp_path = f'{self.collection_path}.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        conn = sqlite3.connect(tmp_path)
+        cursor = conn.cursor()
+        cursor.executescript(APKG_SCHEMA)
+        cursor.executescript(APKG_COL)
+
+        id_gen = itertools.count(int(timestamp * 1000))
+        for deck in decks:
+            deck.write_to_db(cursor, timestamp, id_gen)
+
+        conn.commit()
+        conn.close()
+        os.replace(tmp_path, self.collection_path)
+
+
+    def _patch_collection(self, old_hashes: Dict[str, str], new_hashes: Dict[str, str], notes: Dict[str, Tuple[int, genanki.Note]], timestamp: float) -> int:
+        """
+        Apply note inserts, updates and deletes to the previous collection, returning how many notes changed
+        """
+        deleted = [guid for guid in old_hashes if guid not in new_hashes]
+        updated = [guid for guid in new_hashes if guid in old_hashes and old_hashes[guid] != new_hashes[guid]]
+        inserted = [guid for guid in new_hashes if guid not in old_hashes]
+
+        if not (deleted or updated or inserted):
+            return 0
+
+        conn = sqlite3.connect(self.collection_path)
+        cursor = conn.cursor()
+
+        # new note and card ids carry on after the newest existing ones
+        max_id, = cursor.execute('SELECT MAX(id) FROM (SELECT id FROM notes UNION ALL SELECT id FROM cards)').fetchone()
+        id_gen = itertools.count(max(int(timestamp * 1000), (max_id or 0) + 1))
+
+        for guid in deleted + updated:
+            cursor.execute('DELETE FROM cards WHERE nid IN (SELECT id FROM notes WHERE guid = ?)', (guid,))
+            cursor.execute('DELETE FROM notes WHERE guid = ?', (guid,))
+
+        for guid in updated + inserted:
+            deck_id, note = notes[guid]
+            note.write_to_db(cursor, timestamp, deck_id, id_gen)
+
+        conn.commit()
+        conn.close()
+
+        return len(deleted) + len(updated) + len(inserted)
+
+
+    def _media_index(self, old_media: Dict[str, dict], media_paths: Dict[str, str]) -> Dict[str, dict]:
+        """
+        Give every media file a stable archive index, keeping the indexes of files already in the package
+        """
+        next_index = max((entry['index'] for entry in old_media.values()), default=-1) + 1
+
+        media = {}
+        for name, path in media_paths.items():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # a missing file leaves its notes without that media rather than failing the whole package
+                print(f"Media file {path} is missing, not packaged")
+                continue
+
+            old_entry = old_media.get(name)
+            if old_entry is not None and old_entry['size'] == stat.st_size and old_entry['mtime_ns'] == stat.st_mtime_ns:
+                media[name] = old_entry
+                continue
+
+            index = old_entry['index'] if old_entry is not None else next_index
+            if old_entry is None:
+                next_index += 1
+            media[name] = {'index': index, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+        return media
+
+
+    def _write_archive(self, media: Dict[str, dict], media_paths: Dict[str, str]) -> None:
+        """
+        Write the whole archive again, the collection and every media file, reading each media file from disk
+        """
+        tmp_path = f'{self.fullpath}.tmp'
+
+        with zipfile.ZipFile(tmp_path, 'w') as outzip:
+            with open(self.collection_path, 'rb') as f:
+                self._write_entry(outzip, 'collection.anki2', f.read(), zipfile.ZIP_DEFLATED)
+
+            media_json = {entry['index']: name for name, entry in sorted(media.items(), key=lambda item: item[1]['index'])}
+            self._write_entry(outzip, 'media', json.dumps(media_json).encode('utf8'), zipfile.ZIP_DEFLATED)
+
+            for name, entry in sorted(media.items(), key=lambda item: item[1]['index']):
+                compress_type = zipfile.ZIP_STORED if name.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+                with open(media_paths[name], 'rb') as f:
+                    self._write_entry(outzip, str(entry['index']), f.read(), compress_type)
+
+        os.replace(tmp_path, self.fullpath)
+
+
+    def _write_entry(self, outzip: zipfile.ZipFile, name: str, data: bytes, compress_type: int) -> None:
+        info = zipfile.ZipInfo(name, ZIP_DATE_TIME)
+        info.compress_type = compress_type
+        outzip.writestr(info, data)
+
+
+    def _note_hash(self, deck_id: int, note: genanki.Note) -> str:
+        note_json = json.dumps([deck_id, note.model.model_id, note.fields, list(note.tags)], ensure_ascii=False)
+        return hashlib.sha1(note_json.encode('utf8')).hexdigest()
+
+
+    def _schema_hash(self, decks: List[genanki.Deck]) -> str:
+        models = {note.model.model_id: note.model for deck in decks for note in deck.notes}
+        schema_json = json.dumps([
+            [deck.to_json() for deck in decks],
+            [models[model_id].to_json(0, decks[0].deck_id) for model_id in sorted(models)],
+        ], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(schema_json.encode('utf8')).hexdigest()
+
+
+    def _collection_hash(self) -> str:
+        return file_sha256(self.collection_path) if os.path.exists(self.collection_path) else ''
+
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, encoding='utf8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+
+    def _save_manifest(self, manifest: dict) -> None:
+        tmp_path = f'{self.manifest_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,219 @@
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+import datetime
+import functools
+import json
+import os
+import re
+import threading
+import time
+
+if TYPE_CHECKING:
+    import cProfile
+    import pstats
+
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+URL_CATEGORIES = (
+    ('list_page', re.compile(r'/jlpt-n\d-(grammar|vocabulary)-list(/page/\d+)?/?$')),
+    ('grammar_lesson', re.compile(r'/learn-japanese-grammar/')),
+    ('vocabulary_page', re.compile(r'/learn-japanese-vocabulary/')),
+    ('image', re.compile(r'\.(jpe?g|png|gif|webp)$', re.IGNORECASE)),
+)
+
+
+def url_category(url: str) -> str:
+    """
+    Group a url by the kind of page the scrapers fetch it for
+    """
+    path = url.split('?', 1)[0]
+    for category, pattern in URL_CATEGORIES:
+        if pattern.search(path):
+            return category
+    return 'other'
+
+
+def label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted(labels.items()))
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        # the last count is for values past the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.values: List[float] = []
+
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.values.append(value)
+
+
+    def to_json(self) -> dict:
+        values = sorted(self.values)
+        def percentile(p: float) -> float:
+            return values[min(int(p * len(values)), len(values) - 1)] if values else 0.0
+
+        return {
+            'count': len(values),
+            'sum': sum(values),
+            'p50': percentile(0.5),
+            'p95': percentile(0.95),
+            'p99': percentile(0.99),
+            'max': values[-1] if values else 0.0,
+            'buckets': {**{str(bound): count for bound, count in zip(self.buckets, self.counts)}, 'inf': self.counts[-1]},
+        }
+
+
+class RunRecorder:
+    """
+    Spans, counters and histograms for one run of the pipeline, written out as a JSON run report
+    """
+    def __init__(self) -> None:
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+
+        # (span name, labels) -> [count, total seconds, max seconds]
+        self.spans: Dict[Tuple[str, tuple], List[float]] = {}
+        self.counters: Counter = Counter()
+        self.histograms: Dict[Tuple[str, tuple], Histogram] = {}
+        self._lock = threading.Lock()
+
+        self.profiling = False
+        self._profiles: List['cProfile.Profile'] = []
+        self._thread_state = threading.local()
+
+
+    @contextmanager
+    def span(self, name: str, **labels: str):
+        """
+        Time a block of work, aggregated by name and labels
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            key = (name, label_key(labels))
+            with self._lock:
+                span = self.spans.setdefault(key, [0, 0.0, 0.0])
+                span[0] += 1
+                span[1] += seconds
+                span[2] = max(span[2], seconds)
+
+
+    def count(self, name: str, n: int = 1, **labels: str) -> None:
+        with self._lock:
+            self.counters[(name, label_key(labels))] += n
+
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+
+    def hit_rates(self, name: str, hit_outcomes: Tuple[str, ...], by: str) -> Dict[str, float]:
+        """
+        Share of a counter's outcomes that were hits, per value of the label by
+        """
+        totals, hits = Counter(), Counter()
+        with self._lock:
+            for (counter_name, labels), value in self.counters.items():
+                labels = dict(labels)
+                if counter_name == name:
+                    totals[labels.get(by)] += value
+                    if labels.get('outcome') in hit_outcomes:
+                        hits[labels.get(by)] += value
+
+        return {group: hits[group] / total for group, total in sorted(totals.items()) if total}
+
+
+    def profiled(self, func: Callable) -> Callable:
+        """
+        Wrap func so each call is profiled on its own thread while profiling is on.
+        cProfile only sees the thread that enabled it, so worker threads need a profiler of their own
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.profiling or getattr(self._thread_state, 'profiling', False):
+                return func(*args, **kwargs)
+
+            # the profilers are only loaded by runs that profile
+            import cProfile
+            profile = cProfile.Profile()
+            self._thread_state.profiling = True
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                self._thread_state.profiling = False
+                with self._lock:
+                    self._profiles.append(profile)
+
+        return wrapper
+
+
+    def profile_stats(self) -> Optional['pstats.Stats']:
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+
+        import pstats
+        return pstats.Stats(*profiles)
+
+
+    def report(self, **extra) -> dict:
+        with self._lock:
+            spans = sorted(self.spans.items())
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+
+        return {
+            'started_at': datetime.datetime.fromtimestamp(self.started_at, datetime.timezone.utc).isoformat(),
+            'wall_seconds': time.perf_counter() - self._start,
+            **extra,
+            'spans': [
+                {'name': name, 'labels': dict(labels), 'count': count, 'seconds': total, 'max_seconds': longest}
+                for (name, labels), (count, total, longest) in spans
+            ],
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in counters
+            ],
+            'histograms': [
+                {'name': name, 'labels': dict(labels), **histogram.to_json()}
+                for (name, labels), histogram in histograms
+            ],
+            'cache_hit_rates': {
+                'http_cache': self.hit_rates('http_cache', ('revalidated', 'offline_hit'), by='category'),
+                'note_cache': self.hit_rates('note_cache', ('hit',), by='lesson_type'),
+            },
+        }
+
+
+    def write_report(self, path: str, **extra) -> None:
+        Path(os.path.dirname(path) or '.').mkdir(parents=True, exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(**extra), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+# the recorder every module reports to during a run
+run_recorder = RunRecorder()
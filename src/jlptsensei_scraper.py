@@ -1,15 +1,69 @@
 from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+import csv
 import os
+import re
 from pathlib import Path
-import pandas as pd
+from src.fetch_engine import FetchEngine, NotCachedError
+from src.http_cache import HTTPCache
+from src.row_accumulator import RowAccumulator
+from src.checkpoint_journal import CheckpointJournal
+from src.list_store import ListStore, list_csv_path
+from src.snapshot_diff import ListSnapshot, diff_lists, save_changeset, summary
+from src.instrumentation import run_recorder
+
+
+def read_page_count(html: bytes, list_url: str) -> Optional[int]:
+    """
+    Read the number of pages in a list from the pagination links on one of its pages
+    """
+    list_path = re.escape(urlsplit(list_url).path.encode())
+    page_numbers = [int(n) for n in re.findall(list_path + rb'/page/(\d+)', html)]
+
+    return max(page_numbers) if page_numbers else None
+
+
+def save_list(level: str, lesson_type: str, scraped_rows: RowAccumulator) -> None:
+    """
+    Save a level's rows to its CSV file and the list store, and the changeset since the list was last saved
+    """
+    fullname = list_csv_path(level, lesson_type)
+    Path(os.path.dirname(fullname)).mkdir(parents=True, exist_ok=True)
+
+    # what changed since the list was last saved, matched by entry rather than position
+    with run_recorder.span('diff', level=level, lesson_type=lesson_type):
+        changeset = diff_lists(
+            ListSnapshot.from_csv(lesson_type, fullname),
+            ListSnapshot(lesson_type, scraped_rows.column_names, list(scraped_rows.rows())),
+        )
+        save_changeset(level, lesson_type, changeset)
+    print(f"{level.capitalize()} {lesson_type} changes: {summary(changeset)}")
+
+    # write accumulated rows into a csv file, and the list store the deck generators read from
+    with run_recorder.span('csv_write', level=level, lesson_type=lesson_type):
+        scraped_rows.to_csv(fullname)
+        ListStore().write(level, lesson_type, scraped_rows.column_names, scraped_rows.rows(), fullname)
+
+    print(f"Saved {level.capitalize()} {lesson_type} list.")
 
 
 class JLPTSenseiScraper(ABC):
-    def __init__(self, level: str) -> None:
+    BASE_URL = 'https://jlptsensei.com'
+
+    def __init__(self, level: str, fetch_engine: FetchEngine = None, base_url: str = None) -> None:
         self.jlpt_level = level
 
-        self.scraped_df = pd.DataFrame()
+        # scrapers can share one engine so the rate cap and connection pool apply across all of them
+        self.fetch_engine = fetch_engine or FetchEngine(cache=HTTPCache())
+        self.base_url = (base_url or self.BASE_URL).rstrip('/')
+
+        self.scraped_rows = RowAccumulator([])
         self.LESSON_TYPE = ''
+
+        # subclasses open this once LESSON_TYPE is known
+        self.journal: Optional[CheckpointJournal] = None
     
 
     @abstractmethod
@@ -20,17 +74,150 @@ class JLPTSenseiScraper(ABC):
         pass
 
 
-    def df_to_csv(self) -> None:
+    def list_url(self) -> str:
+        return f'{self.base_url}/jlpt-{self.jlpt_level}-{self.LESSON_TYPE}-list'
+
+
+    def fetch(self, url: str) -> bytes:
         """
-        Save scraped data into a csv file
+        Fetch a page through the shared fetch engine
+        """
+        return self.fetch_engine.fetch(url)
+
+
+    @abstractmethod
+    def parse_list_page(self, html: bytes) -> Optional[List[list]]:
+        """
+        Parse the table rows from one list page, None if the page has no table
+        """
+        pass
+
+
+    def fetch_list_pages(self, list_url: str) -> List[List[list]]:
+        """
+        Fetch and parse every page of a paginated list table concurrently, returned in site order
+        """
+        with run_recorder.span('pagination', level=self.jlpt_level, lesson_type=self.LESSON_TYPE):
+            return self._fetch_list_pages(list_url)
+
+
+    def _fetch_list_pages(self, list_url: str) -> List[List[list]]:
+        return list(self.iter_list_pages(list_url))
+
+
+    def iter_list_pages(self, list_url: str) -> Iterator[List[list]]:
+        """
+        Yield the parsed pages of a list table in site order as they arrive, up to the first one that couldn't be fetched
+        """
+        first_page = self.fetch_list_page(list_url, 1)
+        if first_page is None:
+            return
+        yield first_page
+
+        page_count = self.journal.get('page_count', list_url)
+        if page_count is not None:
+            pages = self.fetch_engine.imap(lambda n: self.fetch_list_page(list_url, n), range(2, page_count+1))
+        else:
+            pages = self._probe_list_pages(list_url)
+
+        for page in pages:
+            if page is None:
+                print("No more table pages...", end='\r')
+                return
+            yield page
+
+
+    def _probe_list_pages(self, list_url: str) -> Iterator[Optional[List[list]]]:
+        # no pagination links to go by, so probe batches of pages speculatively until one is missing
+        next_page = 2
+        while True:
+            page_numbers = range(next_page, next_page+self.fetch_engine.max_workers)
+            yield from self.fetch_engine.map(lambda n: self.fetch_list_page(list_url, n), page_numbers)
+            next_page += len(page_numbers)
+
+
+    def iter_list_rows(self, list_url: str) -> Iterator[list]:
+        for rows in self.iter_list_pages(list_url):
+            yield from rows
+
+
+    @abstractmethod
+    def stream_rows(self, queue_size: int) -> Iterator[List[str]]:
+        """
+        Yield finished rows, detail pages and all, in list order while later rows are still being fetched,
+        keeping them for finish_stream
+        """
+        pass
+
+
+    def close(self) -> None:
+        """
+        Save what the scraper learned about the site and release what it holds open, once its rows are done
         """
-        outdir = f'./data/{self.LESSON_TYPE}'
-        Path(outdir).mkdir(parents=True, exist_ok=True)
+        pass
 
-        outname = f'{self.jlpt_level}_{self.LESSON_TYPE}_list.csv'
-        fullname = os.path.join(outdir, outname)
 
-        # convert df into a csv file
-        self.scraped_df.to_csv(fullname, index=False)
+    def finish_stream(self) -> None:
+        """
+        Save the rows stream_rows yielded, once the stream has been consumed
+        """
+        self.df_to_csv()
+        self.journal.clear()
+
 
-        print(f"Saved {self.jlpt_level.capitalize()} {self.LESSON_TYPE} list.")
+    def read_previous_rows(self) -> List[Dict[str, str]]:
+        """
+        Read the rows saved by the last finished run, so a rerun only fetches new or changed entries
+        """
+        try:
+            with open(self.csv_path(), encoding='utf8', newline='') as f:
+                return list(csv.DictReader(f))
+        except FileNotFoundError:
+            return []
+
+
+    def fetch_list_page(self, list_url: str, page_number: int) -> Optional[List[list]]:
+        """
+        Fetch and parse one page of a list table, None if it is past the end of the list
+        """
+        # pages finished before a restart come straight from the journal
+        if self.journal.has('list_page', page_number):
+            return self.journal.get('list_page', page_number)
+
+        try:
+            html = self.fetch(f'{list_url}/page/{page_number}')
+        except HTTPError as e:
+            # only a missing page marks the end of the list, any other failure is left to fail the scrape,
+            # rather than quietly cutting the list short once the engine's retries are used up
+            if e.code != 404:
+                raise
+            return None
+        except NotCachedError:
+            # pages past the end of the list are never cached
+            return None
+
+        print(f"Scraping {self.jlpt_level.capitalize()} {self.LESSON_TYPE}, page {page_number}...", end='\r')
+
+        if page_number == 1:
+            page_count = read_page_count(html, list_url)
+            if page_count is not None:
+                self.journal.record('page_count', list_url, page_count)
+
+        with run_recorder.span('parse', level=self.jlpt_level, lesson_type=self.LESSON_TYPE, page='list'):
+            rows = self.parse_list_page(html)
+        if rows is not None:
+            rows = [[None if value is None else str(value) for value in row] for row in rows]
+            self.journal.record('list_page', page_number, rows)
+
+        return rows
+
+
+    def csv_path(self) -> str:
+        return list_csv_path(self.jlpt_level, self.LESSON_TYPE)
+
+
+    def df_to_csv(self) -> None:
+        """
+        Save scraped data into a csv file
+        """
+        save_list(self.jlpt_level, self.LESSON_TYPE, self.scraped_rows)
@@ -0,0 +1,185 @@
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence
+import csv
+import os
+import sqlite3
+
+
+# list columns holding numbers, every other column is text
+INTEGER_COLUMNS = ('#',)
+# map the database into memory for reads instead of copying pages through sqlite's cache
+MMAP_SIZE = 256 * 1024 * 1024
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def list_csv_path(level: str, lesson_type: str) -> str:
+    return os.path.join(f'./data/{lesson_type}', f'{level}_{lesson_type}_list.csv')
+
+
+def read_list(level: str, lesson_type: str, columns: Sequence[str]) -> List[Sequence[str]]:
+    """
+    Read some columns of a level's list rows from the list store, or from its CSV file if the store doesn't match it.
+    Whole rows are quicker to read straight from the CSV file, with read_csv_list
+    """
+    rows = ListStore().read_current(level, lesson_type, list_csv_path(level, lesson_type), columns)
+    if rows is not None:
+        return rows
+    return read_csv_list(level, lesson_type, columns)
+
+
+def read_csv_list(level: str, lesson_type: str, columns: Optional[Sequence[str]] = None) -> List[Sequence[str]]:
+    """
+    Read a level's list rows from its CSV file, optionally only some columns
+    """
+    with open(list_csv_path(level, lesson_type), encoding='utf8', newline='') as list_csv:
+        csv_reader = csv.reader(list_csv, delimiter=',')
+        column_names = next(csv_reader)
+        if not columns:
+            return list(csv_reader)
+
+        positions = [column_names.index(name) for name in columns]
+        return [[row[i] for i in positions] for row in csv_reader]
+
+
+class ListStore:
+    """
+    Every level's scraped lists in a single SQLite database, one typed table per lesson type keyed by level and #
+
+    The CSV files stay the source of truth, a level's rows are only read from here while its CSV is the one
+    they were saved with. Reading whole levels is quicker from the CSV files, so the store serves queries for some
+    columns, such as the corpus index's.
+    """
+    def __init__(self, db_path: str = './data/jlpt_sensei.sqlite3') -> None:
+        self.db_path = db_path
+
+
+    def write(self, level: str, lesson_type: str, column_names: Sequence[str], rows: Iterable[Sequence[Optional[str]]], csv_path: str) -> None:
+        """
+        Replace a level's rows of a lesson type, recording the CSV file saved alongside them
+        """
+        Path(os.path.dirname(self.db_path) or '.').mkdir(parents=True, exist_ok=True)
+
+        column_defs = ', '.join(
+            f"{quote(name)} {'INTEGER NOT NULL' if name in INTEGER_COLUMNS else 'TEXT'}" for name in column_names
+        )
+        placeholders = ', '.join('?' for _ in range(len(column_names) + 1))
+        csv_stat = os.stat(csv_path)
+
+        # levels scraped in parallel write from separate connections, waiting on each other's transactions
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        try:
+            with conn:
+                conn.execute('PRAGMA journal_mode = WAL')
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {quote(lesson_type)} (level TEXT NOT NULL, {column_defs}, PRIMARY KEY (level, "#")) WITHOUT ROWID')
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS lists (
+                        level TEXT NOT NULL,
+                        lesson_type TEXT NOT NULL,
+                        csv_size INTEGER NOT NULL,
+                        csv_mtime_ns INTEGER NOT NULL,
+                        PRIMARY KEY (level, lesson_type)
+                    )
+                """)
+
+                conn.execute(f'DELETE FROM {quote(lesson_type)} WHERE level = ?', (level,))
+                conn.executemany(
+                    f"INSERT INTO {quote(lesson_type)} (level, {', '.join(quote(name) for name in column_names)}) VALUES ({placeholders})",
+                    # empty cells are stored as '' like the CSV has them, rather than NULL
+                    ((level, *('' if value is None else value for value in row)) for row in rows),
+                )
+                conn.execute(
+                    'INSERT OR REPLACE INTO lists VALUES (?, ?, ?, ?)',
+                    (level, lesson_type, csv_stat.st_size, csv_stat.st_mtime_ns),
+                )
+        finally:
+            conn.close()
+
+
+    def import_csv(self, level: str, lesson_type: str, csv_path: str) -> None:
+        """
+        Load a level's rows from an existing CSV file
+        """
+        with open(csv_path, encoding='utf8', newline='') as f:
+            csv_reader = csv.reader(f)
+            column_names = next(csv_reader)
+            self.write(level, lesson_type, column_names, csv_reader, csv_path)
+
+
+    def read_current(self, level: str, lesson_type: str, csv_path: str, columns: Optional[Sequence[str]] = None) -> Optional[List[tuple]]:
+        """
+        Read a level's rows like read, or return None if the store doesn't hold them or they don't match its CSV file,
+        which may have been edited by hand since. Both are done on one connection
+        """
+        if not os.path.exists(self.db_path):
+            return None
+
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT csv_size, csv_mtime_ns FROM lists WHERE level = ? AND lesson_type = ?', (level, lesson_type)
+            ).fetchone()
+            if row is None:
+                return None
+            try:
+                csv_stat = os.stat(csv_path)
+            except FileNotFoundError:
+                csv_stat = None
+            if csv_stat is not None and (csv_stat.st_size, csv_stat.st_mtime_ns) != row:
+                return None
+
+            return self._read(conn, lesson_type, [level], columns)
+        except sqlite3.OperationalError:
+            return None
+        finally:
+            conn.close()
+
+
+    def read(self, lesson_type: str, levels: Optional[Sequence[str]] = None, columns: Optional[Sequence[str]] = None) -> List[tuple]:
+        """
+        Read rows of a lesson type in site order, optionally only some levels and columns
+
+        Values come back as the strings a csv.reader would give, so rows need no converting.
+        """
+        conn = self._connect()
+        try:
+            return self._read(conn, lesson_type, levels, columns)
+        finally:
+            conn.close()
+
+
+    def column_names(self, lesson_type: str) -> List[str]:
+        conn = self._connect()
+        try:
+            return self._column_names(conn, lesson_type)
+        finally:
+            conn.close()
+
+
+    def _read(self, conn: sqlite3.Connection, lesson_type: str, levels: Optional[Sequence[str]], columns: Optional[Sequence[str]]) -> List[tuple]:
+        columns = columns or self._column_names(conn, lesson_type)
+        select = ', '.join(
+            f'CAST({quote(name)} AS TEXT)' if name in INTEGER_COLUMNS else quote(name) for name in columns
+        )
+        query = f'SELECT {select} FROM {quote(lesson_type)}'
+        params: Sequence[str] = ()
+        if levels:
+            query += f" WHERE level IN ({', '.join('?' for _ in levels)})"
+            params = tuple(levels)
+        # the primary key's order, so sqlite reads rows straight off the table's b-tree
+        query += ' ORDER BY level, "#"'
+
+        return conn.execute(query, params).fetchall()
+
+
+    def _column_names(self, conn: sqlite3.Connection, lesson_type: str) -> List[str]:
+        # every column after the level
+        return [row[1] for row in conn.execute(f'PRAGMA table_info({quote(lesson_type)})')][1:]
+
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True)
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        return conn
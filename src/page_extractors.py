@@ -0,0 +1,147 @@
+"""
+Targeted extractors for the page shapes the scrapers read, using lxml XPath instead of full BeautifulSoup trees
+
+Each extractor returns exactly what the BeautifulSoup code it replaced produced, including its .string quirks
+"""
+from typing import List, Optional, Tuple
+import threading
+
+import lxml.html
+
+
+# lxml parsers must not be shared between threads, and the fetch engine parses on many
+_local = threading.local()
+
+ROW_XPATH = './/tr[contains(concat(" ", normalize-space(@class), " "), " jl-row ")]'
+EXAMPLE_XPATH = '//div[contains(concat(" ", normalize-space(@class), " "), " example-cont ")]'
+EXAMPLE_MAIN_XPATH = './/div[contains(concat(" ", normalize-space(@class), " "), " example-main ")]'
+
+
+def extract_grammar_rows(html: bytes) -> Optional[List[list]]:
+    """
+    Rows of a grammar list page as [#, Grammar, Reading, Meaning, Source], None if the page has no table
+    """
+    tbody = _table_body(html, 'jl-grammar')
+    if tbody is None:
+        return None
+
+    page_rows = []
+    for tr in tbody.xpath(ROW_XPATH):
+        row_data = []
+        for td in tr.iter('td'):
+            td_class = _first_class(td)
+            if td_class == 'jl-td-gj':
+                grammar = _string(td)
+                if grammar is None:
+                    return None
+                splitted_td = grammar.split('（')
+                row_data.append(splitted_td[0])
+                if len(splitted_td) == 2:
+                    row_data.append(splitted_td[1].split('）')[0])
+                else:
+                    row_data.append('')
+            elif td_class == 'jl-td-gr':
+                # skip the romaji readings from grammar table
+                pass
+            else:
+                row_data.append(_string(td))
+
+        # append grammar lesson source link for more details
+        links = tr.xpath('.//a[@href]')
+        if not links:
+            return None
+        row_data.append(links[0].get('href'))
+
+        page_rows.append(row_data)
+
+    return page_rows
+
+
+def extract_vocabulary_rows(html: bytes) -> Optional[List[list]]:
+    """
+    Rows of a vocabulary list page in table column order, None if the page has no table
+    """
+    tbody = _table_body(html, 'jl-vocab')
+    if tbody is None:
+        return None
+
+    page_rows = []
+    for tr in tbody.xpath(ROW_XPATH):
+        row_data = []
+        for td in tr.iter('td'):
+            if _first_class(td) == 'jl-td-vr':
+                # only want furigana if it exists and not the romaji
+                vocab_reading_td = ''
+                link = next(td.iter('a'), None)
+                paragraph = next(link.iter('p'), None) if link is not None else None
+                if paragraph is not None:
+                    vocab_reading_td = _string(paragraph)
+                row_data.append(vocab_reading_td)
+            else:
+                row_data.append(_string(td))
+
+        page_rows.append(row_data)
+
+    return page_rows
+
+
+def extract_examples(html: bytes) -> List[Tuple[str, Optional[str]]]:
+    """
+    Every (JP, EN) example sentence pair on a vocabulary page, in page order
+    """
+    examples = []
+    for i, example in enumerate(_parse(html).xpath(EXAMPLE_XPATH), start=1):
+        jp_elements = example.xpath(EXAMPLE_MAIN_XPATH)
+        en_elements = example.xpath(f'.//div[@id="example_{i}_en"]')
+        if not jp_elements or not en_elements:
+            continue
+        examples.append((jp_elements[0].text_content(), _string(en_elements[0])))
+
+    return examples
+
+
+def extract_header_image(html: bytes) -> Optional[str]:
+    """
+    src of the flashcard header image on a grammar lesson page, None if there is only a placeholder.
+    Lazy loaded images carry the real url in data-lazy-src or data-src, with a data: placeholder svg as their src
+    """
+    images = _parse(html).xpath('//img[@id="header-image"]')
+    if not images:
+        return None
+    for attribute in ('data-lazy-src', 'data-src', 'src'):
+        src = (images[0].get(attribute) or '').strip()
+        if src and not src.startswith('data:'):
+            return src
+    return None
+
+
+def _parse(html: bytes):
+    parser = getattr(_local, 'parser', None)
+    if parser is None:
+        # the site is served as utf-8, decoding up front skips libxml2's charset guessing
+        parser = _local.parser = lxml.html.HTMLParser(encoding='utf-8')
+    return lxml.html.document_fromstring(html, parser=parser)
+
+
+def _table_body(html: bytes, table_id: str):
+    tables = _parse(html).xpath(f'//table[@id="{table_id}"]')
+    if not tables:
+        return None
+    return tables[0].find('.//tbody')
+
+
+def _first_class(element) -> str:
+    classes = (element.get('class') or '').split()
+    return classes[0] if classes else ''
+
+
+def _string(element) -> Optional[str]:
+    """
+    Mirror BeautifulSoup's Tag.string: text of an element with a single text child, following single child elements
+    """
+    children = list(element)
+    if not children:
+        return element.text
+    if len(children) == 1 and not element.text and not children[0].tail:
+        return _string(children[0])
+    return None
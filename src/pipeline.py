@@ -0,0 +1,170 @@
+"""
+Running scrape and deck jobs for each level and lesson type, the work behind `python . run`, `scrape` and `decks`
+
+Scrapers, deck generators and the fetch engine are imported when a job first needs them, so a deck-only run never
+loads the scrapers, lxml or the network stack.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import argparse
+import datetime
+import importlib
+import sys
+import threading
+import time
+
+from src.instrumentation import run_recorder
+
+if TYPE_CHECKING:
+    from src.fetch_engine import FetchEngine
+    from src.image_optimizer import ImageOptimizer
+
+
+# module and class of each job's scraper and deck generator
+SCRAPERS = {
+    'vocabulary': ('src.vocabulary_scraper', 'VocabularyScraper'),
+    'grammar': ('src.grammar_scraper', 'GrammarScraper'),
+}
+DECK_GENERATORS = {
+    'vocabulary': ('src.vocabulary_deck_generator', 'VocabularyDeckGenerator'),
+    'grammar': ('src.grammar_deck_generator', 'GrammarDeckGenerator'),
+}
+
+
+def load(module_name: str, name: str):
+    return getattr(importlib.import_module(module_name), name)
+
+
+class StageTimings:
+    def __init__(self) -> None:
+        self.seconds: Dict[Tuple[str, str, str], float] = {}
+        self.failed: List[Tuple[str, str, str]] = []
+        self._lock = threading.Lock()
+
+
+    @contextmanager
+    def time(self, level: str, lesson_type: str, stage: str):
+        start = time.perf_counter()
+        try:
+            with run_recorder.span('stage', level=level, lesson_type=lesson_type, stage=stage):
+                yield
+        except Exception:
+            with self._lock:
+                self.failed.append((level, lesson_type, stage))
+            raise
+        finally:
+            with self._lock:
+                self.seconds[(level, lesson_type, stage)] = time.perf_counter() - start
+
+
+    def print_summary(self, wall_seconds: float) -> None:
+        print("\nStage timings:")
+        for (level, lesson_type, stage), seconds in sorted(self.seconds.items()):
+            status = ' FAILED' if (level, lesson_type, stage) in self.failed else ''
+            print(f"  {level} {lesson_type:<10} {stage:<6} {seconds:8.2f}s{status}")
+
+        print(f"  total job time {sum(self.seconds.values()):8.2f}s")
+        print(f"  wall time      {wall_seconds:8.2f}s")
+
+
+def print_request_summary(fetch_engine: 'FetchEngine') -> None:
+    summary = fetch_engine.metrics.summary()
+    statuses = ', '.join(f"{status}: {count}" for status, count in sorted(summary['statuses'].items()))
+
+    print("\nRequests:")
+    print(f"  {summary['requests']} requests, {summary['retries']} retries, {summary['failed']} failed ({statuses})")
+    print(f"  latency p50 {summary['p50_seconds']:.3f}s, p95 {summary['p95_seconds']:.3f}s, max {summary['max_seconds']:.3f}s")
+    print(f"  concurrency limit at the end {fetch_engine.concurrency.limit:.1f} of {fetch_engine.max_workers}")
+
+
+def write_run_report(args: argparse.Namespace, argv: Optional[List[str]], timings: StageTimings, fetch_engine: Optional['FetchEngine']) -> None:
+    report_path = args.report or f"./data/reports/run-{datetime.datetime.now(datetime.timezone.utc):%Y%m%dT%H%M%SZ}.json"
+    run_recorder.write_report(
+        report_path,
+        argv=sys.argv[1:] if argv is None else argv,
+        failed=[list(job) for job in timings.failed],
+        requests=fetch_engine.metrics.summary() if fetch_engine is not None else None,
+    )
+    print(f"\nRun report saved to {report_path}")
+
+    stats = run_recorder.profile_stats()
+    if stats is not None:
+        stats.dump_stats(args.profile)
+        print(f"Profile saved to {args.profile}, the functions taking the most time were:")
+        stats.sort_stats('cumulative').print_stats(15)
+
+
+def run_job(level: str, lesson_type: str, args: argparse.Namespace, fetch_engine: Optional['FetchEngine'], image_optimizer: 'ImageOptimizer',
+            timings: StageTimings) -> bool:
+    """
+    Scrape one level and lesson type, then build its deck straight away
+    """
+    try:
+        if args.stream:
+            with timings.time(level, lesson_type, 'stream'):
+                StreamingPipeline = load('src.streaming_pipeline', 'StreamingPipeline')
+                StreamingPipeline(level, lesson_type, fetch_engine, args.base_url, args.queue_size, image_optimizer, args.sentence_rotation).main()
+            return True
+
+        if 'scrape' in args.stages:
+            with timings.time(level, lesson_type, 'scrape'):
+                load(*SCRAPERS[lesson_type])(level, fetch_engine, args.base_url).scrape()
+
+        # the combined package is built once every job has scraped
+        if 'decks' in args.stages and not args.combined:
+            with timings.time(level, lesson_type, 'decks'):
+                load(*DECK_GENERATORS[lesson_type])(level, image_optimizer=image_optimizer, sentence_rotation=args.sentence_rotation).main()
+    except Exception as e:
+        print(f"{level} {lesson_type} failed: {e!r}")
+        return False
+
+    return True
+
+
+def run(args: argparse.Namespace, argv: Optional[List[str]] = None) -> int:
+    """
+    Run every (level, lesson type) job of the parsed command line, returning the exit code
+    """
+    from src.image_optimizer import ImageOptimizer
+
+    jobs = [(level, lesson_type) for level in args.levels for lesson_type in args.types]
+
+    # one engine for every scrape job, so the rate cap covers the whole run
+    fetch_engine = None
+    if 'scrape' in args.stages:
+        from src.fetch_engine import FetchEngine
+        from src.http_cache import HTTPCache
+        fetch_engine = FetchEngine(args.concurrency, args.rate, cache=HTTPCache(offline=args.offline), max_retries=args.retries)
+
+    image_optimizer = ImageOptimizer(tuple(args.image_size), args.image_quality, enabled=not args.original_images)
+
+    timings = StageTimings()
+    start = time.perf_counter()
+    run_recorder.profiling = args.profile is not None
+
+    with ThreadPoolExecutor(max_workers=args.jobs or len(jobs)) as executor:
+        results = list(executor.map(
+            run_recorder.profiled(lambda job: run_job(job[0], job[1], args, fetch_engine, image_optimizer, timings)),
+            jobs,
+        ))
+
+    if fetch_engine is not None:
+        fetch_engine.close()
+
+    if 'decks' in args.stages and args.combined:
+        try:
+            with timings.time('all', 'combined', 'decks'):
+                CombinedDeckExporter = load('src.combined_deck_exporter', 'CombinedDeckExporter')
+                run_recorder.profiled(CombinedDeckExporter(args.levels, args.types, image_optimizer, args.sentence_rotation).main)()
+        except Exception as e:
+            print(f"combined deck failed: {e!r}")
+            results.append(False)
+
+    timings.print_summary(time.perf_counter() - start)
+    if fetch_engine is not None:
+        print_request_summary(fetch_engine)
+
+    write_run_report(args, argv, timings, fetch_engine)
+
+    return 0 if all(results) else 1
@@ -0,0 +1,76 @@
+from typing import Dict, Iterator, List, Optional, Sequence
+import csv
+import os
+
+
+class RowAccumulator:
+    """
+    Column-oriented store for scraped table rows, turned into a DataFrame or CSV once at the end
+    """
+    def __init__(self, column_names: Sequence[str]) -> None:
+        self.column_names = list(column_names)
+        self.columns: Dict[str, List[Optional[str]]] = {name: [] for name in self.column_names}
+
+
+    def __len__(self) -> int:
+        return len(self.columns[self.column_names[0]]) if self.column_names else 0
+
+
+    def append(self, row_data: Sequence) -> None:
+        """
+        Add a row of cell values in column order
+        """
+        if len(row_data) != len(self.column_names):
+            raise ValueError("cannot set a row with mismatched columns")
+
+        for name, value in zip(self.column_names, row_data):
+            # store plain strings, a NavigableString would keep its whole parsed page alive
+            self.columns[name].append(None if value is None else str(value))
+
+
+    def column(self, name: str) -> List[Optional[str]]:
+        return self.columns[name]
+
+
+    def set(self, i: int, name: str, value: Optional[str]) -> None:
+        self.columns[name][i] = None if value is None else str(value)
+
+
+    def rows(self) -> Iterator[tuple]:
+        """
+        Iterate over rows as tuples in column order
+        """
+        return zip(*self.columns.values())
+
+
+    def records(self) -> Iterator[Dict[str, Optional[str]]]:
+        """
+        Iterate over rows as dicts keyed by column name
+        """
+        for values in self.rows():
+            yield dict(zip(self.column_names, values))
+
+
+    def to_dataframe(self):
+        """
+        Build a pandas DataFrame from the accumulated columns
+        """
+        import pandas as pd
+
+        return pd.DataFrame(self.columns, columns=self.column_names)
+
+
+    def to_csv(self, path: str) -> None:
+        """
+        Write the rows out the same way DataFrame.to_csv(path, index=False) does
+        """
+        # write next to the target and swap it in, so a crash never leaves a half-written list
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            csv_writer = csv.writer(f, lineterminator=os.linesep)
+            csv_writer.writerow(self.column_names)
+            csv_writer.writerows(
+                ['' if value is None else value for value in row]
+                for row in self.rows()
+            )
+        os.replace(tmp_path, path)
@@ -0,0 +1,122 @@
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from src.list_store import MMAP_SIZE
+
+
+Example = Tuple[str, Optional[str]]
+
+
+def pick_sentence(examples: Sequence[Example], vocab: str, reading: Optional[str], rotation: int = 0) -> Optional[Example]:
+    """
+    Choose one of an entry's example sentences, the same one on every build for the same rotation.
+    Each entry starts at its own example, so rotating moves every card on to its next sentence
+    """
+    if not examples:
+        return None
+    start = int.from_bytes(hashlib.sha1(f'{vocab}\t{reading or ""}'.encode('utf8')).digest()[:4], 'big')
+    return tuple(examples[(start + rotation) % len(examples)])
+
+
+class SentenceStore:
+    """
+    Every example sentence found on each vocabulary entry's page, in a SQLite database shared by all levels
+
+    Sentence texts are stored once in a table of their own and entries refer to them by id, so a sentence used by
+    several entries or levels, or an English translation shared by several sentences, is only kept once.
+    An entry whose page had no examples is stored with none, so it isn't fetched again either.
+    """
+    def __init__(self, db_path: str = './data/sentences.sqlite3') -> None:
+        self.db_path = db_path
+        # text id -> text, so each text read back is one string object however many entries use it
+        self._texts: Dict[int, str] = {}
+        # opened on the first put and shared by the fetch engine's threads
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+
+    def put(self, vocab: str, reading: Optional[str], examples: Sequence[Example]) -> List[Example]:
+        """
+        Replace an entry's examples, keeping their page order and dropping repeats, and return them as stored
+        """
+        examples = list(dict.fromkeys(tuple(example) for example in examples))
+
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                text_ids = [[self._text_id(conn, text) for text in example] for example in examples]
+                conn.execute(
+                    'INSERT OR REPLACE INTO entries VALUES (?, ?, ?)',
+                    (vocab, reading or '', json.dumps(text_ids, separators=(',', ':'))),
+                )
+
+        return examples
+
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+    def load(self) -> Dict[Tuple[str, str], List[Example]]:
+        """
+        Every entry's examples, keyed by (vocabulary, reading) with '' for no reading
+        """
+        if not os.path.exists(self.db_path):
+            return {}
+
+        conn = self._connect()
+        try:
+            for text_id, text in conn.execute('SELECT id, text FROM texts'):
+                self._texts.setdefault(text_id, text)
+            entries = conn.execute('SELECT vocabulary, reading, examples FROM entries').fetchall()
+        except sqlite3.OperationalError:
+            return {}
+        finally:
+            conn.close()
+
+        texts = self._texts
+        return {
+            (vocab, reading): [tuple(None if text_id is None else texts[text_id] for text_id in example) for example in json.loads(examples)]
+            for vocab, reading, examples in entries
+        }
+
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(os.path.dirname(self.db_path) or '.').mkdir(parents=True, exist_ok=True)
+            # vocabulary levels scraped in parallel write from separate connections, waiting on each other's transactions
+            self._conn = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+            with self._conn:
+                self._conn.execute('PRAGMA journal_mode = WAL')
+                self._conn.execute('CREATE TABLE IF NOT EXISTS texts (id INTEGER PRIMARY KEY, text TEXT NOT NULL UNIQUE)')
+                self._conn.execute("""
+                    CREATE TABLE IF NOT EXISTS entries (
+                        vocabulary TEXT NOT NULL,
+                        reading TEXT NOT NULL,
+                        examples TEXT NOT NULL,
+                        PRIMARY KEY (vocabulary, reading)
+                    ) WITHOUT ROWID
+                """)
+        return self._conn
+
+
+    def _text_id(self, conn: sqlite3.Connection, text: Optional[str]) -> Optional[int]:
+        if text is None:
+            return None
+        conn.execute('INSERT OR IGNORE INTO texts (text) VALUES (?)', (text,))
+        text_id, = conn.execute('SELECT id FROM texts WHERE text = ?', (text,)).fetchone()
+        return text_id
+
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True)
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        return conn
@@ -0,0 +1,187 @@
+"""
+What changed between two snapshots of the scraped lists
+
+Entries are matched by a stable key, vocabulary and reading or a grammar point's lesson url, rather than by their
+position #, and compared by a fingerprint of their content. Each list's changeset holds the added, removed and modified
+entries and those that only moved. Run `python -m src.snapshot_diff --help` from the repository root to compare two
+data directories, and every scrape saves the changeset of its own list to data/changes.
+"""
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import csv
+import datetime
+import hashlib
+import json
+import os
+import sys
+import time
+
+
+LEVELS = ['n5', 'n4', 'n3', 'n2', 'n1']
+LESSON_TYPES = ['vocabulary', 'grammar']
+
+KEY_COLUMNS = {
+    'vocabulary': ('Vocabulary', 'Reading'),
+    'grammar': ('Source',),
+}
+POSITION_COLUMN = '#'
+
+
+def row_fingerprint(values: Sequence[str]) -> bytes:
+    return hashlib.blake2b('\x1f'.join(values).encode('utf8'), digest_size=8).digest()
+
+
+class ListSnapshot:
+    """
+    One list's rows by entry key, each with a fingerprint of everything but its position
+    """
+    def __init__(self, lesson_type: str, column_names: Sequence[str], rows: Sequence[Sequence[Optional[str]]]) -> None:
+        self.lesson_type = lesson_type
+        self.column_names = list(column_names)
+
+        key_positions = [self.column_names.index(name) for name in KEY_COLUMNS[lesson_type]]
+        content_positions = [i for i, name in enumerate(self.column_names) if name != POSITION_COLUMN]
+
+        # entry key -> (fingerprint, row)
+        self.entries: Dict[str, Tuple[bytes, List[str]]] = {}
+        occurrences = Counter()
+        for row in rows:
+            row = ['' if value is None else value for value in row]
+            key = '\t'.join(row[i] for i in key_positions)
+            # an entry listed more than once is told apart by its occurrence
+            occurrences[key] += 1
+            if occurrences[key] > 1:
+                key = f'{key}\t{occurrences[key]}'
+            self.entries[key] = (row_fingerprint([row[i] for i in content_positions]), row)
+
+
+    @classmethod
+    def from_csv(cls, lesson_type: str, csv_path: str) -> 'ListSnapshot':
+        """
+        Read a list's CSV file, an empty snapshot if there is none yet
+        """
+        try:
+            with open(csv_path, encoding='utf8', newline='') as f:
+                csv_reader = csv.reader(f)
+                column_names = next(csv_reader)
+                return cls(lesson_type, column_names, list(csv_reader))
+        except FileNotFoundError:
+            return cls(lesson_type, [POSITION_COLUMN, *KEY_COLUMNS[lesson_type]], [])
+
+
+    def with_columns(self, column_names: Sequence[str]) -> 'ListSnapshot':
+        """
+        The same rows laid out in other columns, for comparing with a list saved with different ones
+        """
+        if list(column_names) == self.column_names:
+            return self
+        positions = [self.column_names.index(name) if name in self.column_names else None for name in column_names]
+        rows = [[row[i] if i is not None else '' for i in positions] for _, row in self.entries.values()]
+        return ListSnapshot(self.lesson_type, column_names, rows)
+
+
+def diff_lists(old: ListSnapshot, new: ListSnapshot) -> dict:
+    """
+    Changeset from one snapshot of a list to the next
+    """
+    old = old.with_columns(new.column_names)
+    column_names = new.column_names
+    position = column_names.index(POSITION_COLUMN)
+
+    def record(row: List[str]) -> Dict[str, str]:
+        return dict(zip(column_names, row))
+
+    added, modified, moved = [], [], []
+    unchanged = 0
+    for key, (fingerprint, row) in new.entries.items():
+        old_entry = old.entries.get(key)
+        if old_entry is None:
+            added.append(record(row))
+        elif old_entry[0] != fingerprint:
+            old_row = old_entry[1]
+            modified.append({
+                'key': key,
+                'changed': [name for name, before, after in zip(column_names, old_row, row) if before != after and name != POSITION_COLUMN],
+                'before': record(old_row),
+                'after': record(row),
+            })
+        elif old_entry[1][position] != row[position]:
+            moved.append({'key': key, 'before': old_entry[1][position], 'after': row[position]})
+        else:
+            unchanged += 1
+
+    removed = [record(row) for key, (_, row) in old.entries.items() if key not in new.entries]
+
+    return {
+        'key_columns': list(KEY_COLUMNS[new.lesson_type]),
+        'added': added,
+        'removed': removed,
+        'modified': modified,
+        'moved': moved,
+        'unchanged': unchanged,
+    }
+
+
+def has_changes(changeset: dict) -> bool:
+    return any(changeset[kind] for kind in ('added', 'removed', 'modified', 'moved'))
+
+
+def summary(changeset: dict) -> str:
+    return ', '.join(f"{len(changeset[kind])} {kind}" for kind in ('added', 'removed', 'modified', 'moved')) + f", {changeset['unchanged']} unchanged"
+
+
+def save_changeset(level: str, lesson_type: str, changeset: dict, changes_dir: str = './data/changes') -> str:
+    """
+    Save a list's latest changeset for stages that only act on what changed
+    """
+    Path(changes_dir).mkdir(parents=True, exist_ok=True)
+    path = os.path.join(changes_dir, f'{level}_{lesson_type}.json')
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf8') as f:
+        json.dump({
+            'level': level,
+            'lesson_type': lesson_type,
+            'saved_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            **changeset,
+        }, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+    return path
+
+
+def csv_path(data_dir: str, level: str, lesson_type: str) -> str:
+    return os.path.join(data_dir, lesson_type, f'{level}_{lesson_type}_list.csv')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Show what changed between two snapshots of the scraped lists.")
+    parser.add_argument('old', help="data directory of the older snapshot")
+    parser.add_argument('new', nargs='?', default='./data', help="data directory of the newer snapshot (default: ./data)")
+    parser.add_argument('--levels', nargs='+', choices=LEVELS, default=LEVELS)
+    parser.add_argument('--types', nargs='+', choices=LESSON_TYPES, default=LESSON_TYPES)
+    parser.add_argument('--out', default=None, help="write every list's changeset to this JSON file")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    changesets = {}
+    for lesson_type in args.types:
+        for level in args.levels:
+            old = ListSnapshot.from_csv(lesson_type, csv_path(args.old, level, lesson_type))
+            new = ListSnapshot.from_csv(lesson_type, csv_path(args.new, level, lesson_type))
+            changesets[f'{level}_{lesson_type}'] = diff_lists(old, new)
+    diff_ms = (time.perf_counter() - start) * 1000
+
+    for name, changeset in changesets.items():
+        print(f"{name:<16} {summary(changeset)}")
+    print(f"{len(changesets)} lists compared in {diff_ms:.1f} ms")
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf8') as f:
+            json.dump(changesets, f, ensure_ascii=False, indent=1)
+
+    return 0 if not any(has_changes(changeset) for changeset in changesets.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
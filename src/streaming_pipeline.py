@@ -0,0 +1,51 @@
+from typing import Optional
+
+from src.anki_deck_generator import AnkiDeckGenerator
+from src.fetch_engine import FetchEngine
+from src.grammar_deck_generator import GrammarDeckGenerator
+from src.grammar_scraper import GrammarScraper
+from src.image_optimizer import ImageOptimizer
+from src.instrumentation import run_recorder
+from src.jlptsensei_scraper import JLPTSenseiScraper
+from src.vocabulary_deck_generator import VocabularyDeckGenerator
+from src.vocabulary_scraper import VocabularyScraper
+
+
+SCRAPERS = {
+    'vocabulary': VocabularyScraper,
+    'grammar': GrammarScraper,
+}
+DECK_GENERATORS = {
+    'vocabulary': VocabularyDeckGenerator,
+    'grammar': GrammarDeckGenerator,
+}
+
+
+class StreamingPipeline:
+    """
+    Scrapes a level and builds its deck in one pass, each row going into the deck as soon as its detail page is done
+
+    Rows flow from the list pages through sentence or image fetching into note building, with at most queue_size rows
+    between stages, so pages and images never pile up in memory and building notes overlaps fetching.
+    The list is saved once the deck has every row, the same as a scrape on its own would save it.
+    """
+    def __init__(self, level: str, lesson_type: str, fetch_engine: FetchEngine = None, base_url: str = None, queue_size: int = 32,
+                 image_optimizer: Optional[ImageOptimizer] = None, sentence_rotation: int = 0) -> None:
+        self.level = level
+        self.lesson_type = lesson_type
+        self.queue_size = queue_size
+
+        self.scraper: JLPTSenseiScraper = SCRAPERS[lesson_type](level, fetch_engine, base_url)
+        self.deck_generator: AnkiDeckGenerator = DECK_GENERATORS[lesson_type](level, image_optimizer=image_optimizer, sentence_rotation=sentence_rotation)
+
+
+    def main(self) -> None:
+        with run_recorder.span('model_build', level=self.level, lesson_type=self.lesson_type):
+            self.deck_generator.generate_model()
+
+        with run_recorder.span('stream', level=self.level, lesson_type=self.lesson_type):
+            self.deck_generator.generate_deck(self.scraper.stream_rows(self.queue_size))
+        print(f"Finished scraping {self.level.capitalize()} {self.lesson_type}.")
+
+        self.scraper.finish_stream()
+        self.deck_generator.save_deck()
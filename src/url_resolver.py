@@ -0,0 +1,152 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+import json
+import os
+import threading
+import urllib.parse
+
+from src.fetch_engine import FetchEngine, NotCachedError
+
+
+# statuses that mean a candidate url doesn't exist, anything else may work on a later run
+NOT_FOUND_STATUSES = (404, 410)
+
+
+class VocabularyURLResolver:
+    """
+    Finds the page of a vocabulary entry among the url forms the site uses, remembering which one worked per entry
+
+    Candidate url forms and per-word overrides come from a rules file. Resolved and failed paths are kept per level,
+    so a rerun requests the right page first and never repeats a known 404.
+    """
+    def __init__(self, fetch_engine: FetchEngine, level: str, base_url: str,
+                 rules_path: str = './src/vocabulary_url_rules.json', table_dir: str = './data/url_table') -> None:
+        self.fetch_engine = fetch_engine
+        self.level = level
+        self.vocab_url = f'{base_url}/learn-japanese-vocabulary'
+
+        with open(rules_path, encoding='utf-8') as f:
+            rules = json.load(f)
+        self.candidate_forms: List[str] = rules['candidates']
+        self.overrides: Dict[str, List[str]] = rules.get('overrides', {})
+
+        self.table_path = os.path.join(table_dir, f'{level}.json')
+        self.table: Dict[str, dict] = self._load_table()
+        self._lock = threading.Lock()
+
+        # fallback candidates are fetched alongside each other, from threads of their own so they never wait on
+        # the engine's workers, which are the ones resolving
+        self._executor = ThreadPoolExecutor(max_workers=fetch_engine.max_workers * max(len(self.candidate_forms), 1))
+
+
+    def candidate_paths(self, vocab: str, reading: Optional[str]) -> List[str]:
+        """
+        Paths under learn-japanese-vocabulary to try for an entry, overrides first
+        """
+        paths = list(self.overrides.get(vocab, []))
+        for form in self.candidate_forms:
+            if '{reading}' in form and not reading:
+                continue
+            path = form.format(vocab=vocab, reading=reading or '', level=self.level)
+            if path not in paths:
+                paths.append(path)
+        return paths
+
+
+    def resolve(self, vocab: str, reading: Optional[str]) -> Optional[bytes]:
+        """
+        Fetch an entry's page, or return None if none of its candidate urls exist.
+        Network errors other than a missing page are raised, and nothing is remembered for them
+        """
+        key = f'{vocab}\t{reading or ""}'
+        with self._lock:
+            entry = dict(self.table.get(key, {}))
+        failed = set(entry.get('failed', []))
+
+        # a path that worked before is the only request a rerun needs
+        if entry.get('path'):
+            html, missing = self._try_path(entry['path'])
+            if html is not None:
+                return html
+            if missing:
+                failed.add(entry['path'])
+
+        # the learned path was just tried, whatever became of it
+        paths = [path for path in self.candidate_paths(vocab, reading) if path not in failed and path != entry.get('path')]
+        html, path = None, None
+
+        if paths:
+            # most entries live at the first form, only a miss there costs the speculative fallbacks
+            first_html, first_missing = self._try_path(paths[0])
+            if first_html is not None:
+                html, path = first_html, paths[0]
+            else:
+                if first_missing:
+                    failed.add(paths[0])
+                results = list(self._executor.map(self._try_fallback, paths[1:]))
+                for candidate, (candidate_html, missing, _) in zip(paths[1:], results):
+                    if candidate_html is not None and html is None:
+                        html, path = candidate_html, candidate
+                    elif missing:
+                        failed.add(candidate)
+
+                # a fallback that failed might have been the page, so the entry isn't settled unless another was found
+                errors = [error for _, _, error in results if error is not None]
+                if html is None and errors:
+                    raise errors[0]
+
+        # a learned path that only couldn't be fetched offline is kept for the next online run
+        if path is None and entry.get('path') not in failed:
+            path = entry.get('path')
+        with self._lock:
+            self.table[key] = {'path': path, 'failed': sorted(failed)}
+
+        return html
+
+
+    def save(self) -> None:
+        with self._lock:
+            Path(os.path.dirname(self.table_path)).mkdir(parents=True, exist_ok=True)
+            tmp_path = f'{self.table_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.table, f, ensure_ascii=False, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.table_path)
+
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+
+    def _try_path(self, path: str) -> Tuple[Optional[bytes], bool]:
+        """
+        Fetch a candidate path, returning its page if it exists and whether the site said it doesn't
+        """
+        try:
+            return self.fetch_engine.fetch(f'{self.vocab_url}/{urllib.parse.quote(path)}'), False
+        except HTTPError as e:
+            if e.code not in NOT_FOUND_STATUSES:
+                raise
+            return None, True
+        except NotCachedError:
+            # an offline run only has the pages fetched before, the others may still exist
+            return None, False
+
+
+    def _try_fallback(self, path: str) -> Tuple[Optional[bytes], bool, Optional[URLError]]:
+        """
+        _try_path for a fallback fetched alongside the others, returning its error rather than raising it
+        """
+        try:
+            return (*self._try_path(path), None)
+        except URLError as e:
+            return None, False, e
+
+
+    def _load_table(self) -> Dict[str, dict]:
+        try:
+            with open(self.table_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
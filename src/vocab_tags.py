@@ -0,0 +1,13 @@
+from typing import List
+
+
+def process_vocab_type_tags(vocab_type: str) -> List[str]:
+    """
+    Convert vocab types into valid note tags which can't contain spaces
+    """
+    vt_list = vocab_type.split(', ')
+    for i in range(len(vt_list)):
+        vt_list[i] = vt_list[i].replace(' ', '_').lower()
+        vt_list[i] = 'JLPT_Sensei::' + vt_list[i]
+
+    return vt_list
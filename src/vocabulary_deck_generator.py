@@ -1,28 +1,27 @@
-import random
-from typing import List
-import csv
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 import genanki
 
-from src.anki_deck_generator import AnkiDeckGenerator
+from src.anki_deck_generator import AnkiDeckGenerator, load_templates
+from src.image_optimizer import ImageOptimizer
+from src.sentence_store import Example, SentenceStore, pick_sentence
+from src.vocab_tags import process_vocab_type_tags
+from src.instrumentation import run_recorder
 
 
 class VocabularyDeckGenerator(AnkiDeckGenerator):
-    def __init__(self, level: str) -> None:
-        super().__init__(level)
+    def __init__(self, level: str, subdeck: bool = False, image_optimizer: Optional[ImageOptimizer] = None, sentence_rotation: int = 0) -> None:
+        super().__init__(level, subdeck, image_optimizer, sentence_rotation)
         self.LESSON_TYPE = 'vocabulary'
+        # every stored example sentence by (vocabulary, reading)
+        self.examples: Dict[Tuple[str, str], List[Example]] = {}
 
 
     def generate_model(self) -> None:
-        # generate a unique model id
-        model_id = random.randrange(1 << 30, 1 << 31)
+        # derive the model id from its name, so rebuilt decks update the same note type in Anki
+        model_id = self.model_id()
 
-        # read template html and css files to assign to model properties
-        with open(f'src/template/{self.LESSON_TYPE}_recognition_front.html', 'r') as f:
-            front_template_html = f.read()
-        with open(f'src/template/{self.LESSON_TYPE}_recognition_back.html', 'r') as f:
-            back_template_html = f.read()
-        with open(f'src/template/{self.LESSON_TYPE}_recognition.css', 'r') as f:
-            template_css = f.read()
+        # template html and css files are read once and shared by every deck of this lesson type
+        front_template_html, back_template_html, template_css = load_templates(self.LESSON_TYPE)
 
         vocab_model = genanki.Model(
             model_id,
@@ -47,42 +46,48 @@ class VocabularyDeckGenerator(AnkiDeckGenerator):
         self.anki_model = vocab_model
 
 
-    def generate_deck(self) -> None:
+    def generate_deck(self, rows: Optional[Iterable[Sequence[str]]] = None) -> None:
         print(f"Generating {self.jlpt_level.capitalize()} {self.LESSON_TYPE} deck...", end='\r')
 
-        deck_id = random.randrange(1 << 30, 1 << 31)
-        vocab_deck = genanki.Deck(deck_id, f'JLPT Sensei {self.jlpt_level.upper()} {self.LESSON_TYPE.capitalize()}')
+        vocab_deck = genanki.Deck(self.deck_id(), self.deck_name())
 
-        with open(f'data/{self.LESSON_TYPE}/{self.jlpt_level}_{self.LESSON_TYPE}_list.csv', encoding='utf8') as vocab_csv:
-            vocab_csv_reader = csv.reader(vocab_csv, delimiter=',')
-            next(vocab_csv_reader) # skip column headings
+        self.load_build_cache()
+        self.examples = SentenceStore().load()
 
-            for row in vocab_csv_reader:
-                v_index, vocab, v_reading, v_type, v_meaning, v_sentence_jp, v_sentence_en = list(row)
-                vocab_note = genanki.Note(
-                    model=self.anki_model,
-                    fields=[vocab, v_reading, v_meaning, v_sentence_jp, v_sentence_en, '', v_index],
-                    tags=self.process_vocab_type_tags(v_type)
-                )
-
-                vocab_deck.add_note(vocab_note)
+        # rows can also be streamed straight from a scrape instead of read from the saved list
+        for row in self.read_rows() if rows is None else rows:
+            vocab_deck.add_note(self.build_note(row))
         
         self.anki_deck = vocab_deck
 
 
-    def process_vocab_type_tags(self, vocab_type: str) -> List[str]:
+    def sentence(self, row: List[str]) -> Tuple[str, str]:
         """
-        Convert vocab types into valid note tags which can't contain spaces
+        The entry's example sentence picked from the sentence store, or the one saved in its row if none are stored
         """
-        vt_list = vocab_type.split(', ')
-        for i in range(len(vt_list)):
-            vt_list[i] = vt_list[i].replace(' ', '_').lower()
-            vt_list[i] = 'JLPT_Sensei::' + vt_list[i]
+        vocab, v_reading, v_sentence_jp, v_sentence_en = row[1], row[2], row[5], row[6]
+        picked = pick_sentence(self.examples.get((vocab, v_reading), []), vocab, v_reading, self.sentence_rotation)
+        if picked is None:
+            return v_sentence_jp, v_sentence_en
+        return picked[0], picked[1] or ''
+
+
+    def note_extras(self, row: List[str]) -> Tuple[str, str]:
+        return self.sentence(row)
+
+
+    def note_data(self, row: List[str]) -> Tuple[List[str], List[str], str]:
+        v_index, vocab, v_reading, v_type, v_meaning, _, _ = list(row)
+        v_sentence_jp, v_sentence_en = self.sentence(row)
+        fields = [vocab, v_reading, v_meaning, v_sentence_jp, v_sentence_en, '', v_index]
+
+        # the same word can appear with different readings, so both identify the note
+        return fields, process_vocab_type_tags(v_type), f'{vocab}\t{v_reading}'
 
-        return vt_list
-    
 
     def main(self):
-        self.generate_model()
-        self.generate_deck()
+        with run_recorder.span('model_build', level=self.jlpt_level, lesson_type=self.LESSON_TYPE):
+            self.generate_model()
+        with run_recorder.span('deck_build', level=self.jlpt_level, lesson_type=self.LESSON_TYPE):
+            self.generate_deck()
         self.save_deck()
@@ -1,193 +1,211 @@
-from urllib.request import urlopen
-from urllib.error import HTTPError, URLError
-from bs4 import BeautifulSoup, NavigableString
-import pandas as pd
-import urllib.parse
-from random import randint
+from urllib.error import URLError
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
 from src.jlptsensei_scraper import JLPTSenseiScraper
-# import multiprocessing as mp
+from src.fetch_engine import FetchEngine
+from src.row_accumulator import RowAccumulator
+from src.checkpoint_journal import CheckpointJournal
+from src.page_extractors import extract_vocabulary_rows, extract_examples
+from src.url_resolver import VocabularyURLResolver
+from src.sentence_store import SentenceStore, pick_sentence
+from src.instrumentation import run_recorder
 
 
 class VocabularyScraper(JLPTSenseiScraper):
-    def __init__(self, level: str) -> None:
-        super().__init__(level)
+    COLUMN_NAMES = ['#', 'Vocabulary', 'Reading', 'Type', 'Meaning', 'Sentence JP', 'Sentence EN']
+
+    def __init__(self, level: str, fetch_engine: FetchEngine = None, base_url: str = None) -> None:
+        super().__init__(level, fetch_engine, base_url)
 
         self.LESSON_TYPE = 'vocabulary'
 
-        column_names = ['#', 'Vocabulary', 'Reading', 'Type', 'Meaning', 'Sentence JP', 'Sentence EN']
-        self.scraped_df = pd.DataFrame(columns=column_names)
+        self.scraped_rows = RowAccumulator(self.COLUMN_NAMES)
+        self.journal = CheckpointJournal(self.jlpt_level, self.LESSON_TYPE)
+        self.url_resolver = VocabularyURLResolver(self.fetch_engine, self.jlpt_level, self.base_url)
+        # every example on each page is kept, so picking other sentences never needs the page again
+        self.sentence_store = SentenceStore()
+        self.stored_examples: Dict[Tuple[str, str], list] = {}
+        self.previous_sentences: Dict[Tuple[str, str, str, str], Tuple[str, str]] = {}
+
+        self.scraped_sentences = 0
+        self.sentences_to_scrape = 0
+        self.progress_lock = threading.Lock()
 
 
     def scrape(self):
-        page_number = 1
+        list_pages = self.fetch_list_pages(self.list_url())
+        for rows in list_pages:
+            for row_data in rows:
+                self.scraped_rows.append(row_data)
+
+        print(f"Finished scraping {self.jlpt_level.capitalize()} vocabulary tables.")
+
+        self.scrape_sentences()
+        print(f"Finished scraping {self.jlpt_level.capitalize()} vocabulary sentences.")
+
+        self.df_to_csv()
+        self.journal.clear()
+
+
+    def stream_rows(self, queue_size: int) -> Iterator[List[str]]:
+        self.load_known_sentences()
+        list_rows = self.iter_list_rows(self.list_url())
 
-        while True:
+        def add_sentence(row_data: list) -> list:
             try:
-                html = urlopen(f'https://jlptsensei.com/jlpt-{self.jlpt_level}-vocabulary-list/page/{page_number}')
-            except HTTPError as e:
-                print(e)
-                break
+                sentence = self.row_sentence(dict(zip(self.scraped_rows.column_names, row_data)))
             except URLError as e:
                 print(e)
-                break
-            
-            print(f"Scraping {self.jlpt_level.capitalize()} {self.LESSON_TYPE}, page {page_number}...", end="\r")
+                sentence = None
+            if sentence is not None:
+                row_data = row_data[:-2] + list(sentence)
+            return row_data
 
-            bs = BeautifulSoup(html, 'lxml') # 'html.parser' didn't work well
+        # each entry's page is fetched while earlier entries are already on their way into the deck
+        try:
+            for row_data in self.fetch_engine.imap(add_sentence, list_rows, queue_size):
+                self.scraped_rows.append(row_data)
+                yield ['' if value is None else value for value in row_data]
+        finally:
+            self.close()
 
-            try:
-                # get table element we are interested in
-                table_element = bs.find('table', {'id': 'jl-vocab'})
-
-                # get table rows
-                tr_elements = table_element.tbody.find_all('tr', {'class': 'jl-row'})
-                # get table data in rows
-                for tr in tr_elements:
-                    row_data = []
-                    for td_element in tr.find_all('td'):
-                        if td_element['class'][0] == 'jl-td-vr':
-                            # only want furigana if it exists and not the romaji, from vocabulary table
-                            vocab_reading_td = ""
-                            try:
-                                vocab_reading_td = td_element.a.p.string
-                            except AttributeError as e:
-                                pass
-                            
-                            row_data.append(vocab_reading_td)
-                        else:
-                            row_data.append(td_element.string)
-
-                    # insert row data into dataframe
-                    self.scraped_df.loc[len(self.scraped_df)] = row_data
-            except AttributeError as e:
-                print("No more table pages...", end="\r")
-                break
-
-            # increment variable to scrape next table page
-            page_number += 1
-        
-        print(f"Finished scraping {self.jlpt_level.capitalize()} vocabulary tables.")
 
-        self.scraped_df = self.scrape_sentences()
-        print(f"Finished scraping {self.jlpt_level.capitalize()} vocabulary sentences.")
+    def close(self) -> None:
+        self.url_resolver.save()
+        self.url_resolver.close()
+        self.sentence_store.close()
 
-        # global scraped_sentences
-        # scraped_sentences = 0
 
-        # global total_vocab
-        # total_vocab = len(df.index)
+    def parse_list_page(self, html: bytes) -> Optional[List[list]]:
+        return extract_vocabulary_rows(html)
 
-        # with mp.Pool(2) as pool:
-        #     # result = pool.map(add_example_sentence_row, df.iterrows(), chunksize=10)
-        #     result = pool.imap(add_example_sentence_row, df.itertuples(name=None), chunksize=10)
-        #     # result = [pool.apply(add_example_sentence_row, args=(row, 4, 8)) for row in df]
-        #     df = pd.DataFrame(result)
 
-        self.df_to_csv()
+    def read_previous_sentences(self) -> Dict[Tuple[str, str, str, str], Tuple[str, str]]:
+        """
+        Sentences saved by the last finished run. A row saved without one may be from a failed request, so it isn't
+        reused; an entry whose page had no examples is known from the sentence store or the journal instead
+        """
+        return {
+            (row['Vocabulary'], row['Reading'], row['Type'], row['Meaning']): (row['Sentence JP'], row['Sentence EN'])
+            for row in self.read_previous_rows()
+            if row['Sentence JP']
+        }
+
+
+    def load_known_sentences(self) -> None:
+        """
+        Load the stored examples and the last finished run's sentences, which known_sentence looks in
+        """
+        self.previous_sentences = self.read_previous_sentences()
+        self.stored_examples = self.sentence_store.load()
+
+
+    def known_sentence(self, df_row: dict) -> Tuple[bool, Optional[Tuple[str, str]]]:
+        """
+        Look up an entry's sentence without a request, returning whether it was known and the sentence if it has one
+        """
+        store_key = (df_row['Vocabulary'], df_row['Reading'] or '')
+        entry_key = (df_row['Vocabulary'], df_row['Reading'] or '', df_row['Type'] or '', df_row['Meaning'] or '')
+        journal_key = (df_row['Vocabulary'], df_row['Reading'])
+
+        if store_key in self.stored_examples:
+            run_recorder.count('sentences', level=self.jlpt_level, source='store')
+            return True, pick_sentence(self.stored_examples[store_key], df_row['Vocabulary'], df_row['Reading'])
+        if entry_key in self.previous_sentences:
+            run_recorder.count('sentences', level=self.jlpt_level, source='previous')
+            return True, self.previous_sentences[entry_key]
+        if self.journal.has('sentence', journal_key):
+            run_recorder.count('sentences', level=self.jlpt_level, source='journal')
+            return True, self.journal.get('sentence', journal_key)
+        return False, None
+
+
+    def row_sentence(self, df_row: dict) -> Optional[Tuple[str, str]]:
+        """
+        An entry's sentence, known or fetched, None if it has none.
+        Failing to fetch its page raises a URLError, and nothing is journaled for it
+        """
+        known, sentence = self.known_sentence(df_row)
+        if known:
+            return sentence
 
+        run_recorder.count('sentences', level=self.jlpt_level, source='fetched')
+        return self.fetch_sentence((df_row['#'], df_row['Vocabulary'], df_row['Reading']))
 
-    def scrape_sentences(self) -> pd.DataFrame:
+
+    def scrape_sentences(self) -> None:
         """
         Add example sentences for vocabulary lists
         """
-        i = -1
+        # stored entries and unchanged entries from the last finished run keep their sentences without another request
+        self.load_known_sentences()
+
+        sentences = []
+        rows_to_scrape = []
+        for i, df_row in enumerate(self.scraped_rows.records()):
+            known, sentence = self.known_sentence(df_row)
+            sentences.append(sentence)
+            if not known:
+                run_recorder.count('sentences', level=self.jlpt_level, source='fetched')
+                rows_to_scrape.append((i, (df_row['#'], df_row['Vocabulary'], df_row['Reading'])))
+
+        # visit each remaining vocabulary link for examples sentences, concurrently on the fetch engine
+        self.sentences_to_scrape = len(rows_to_scrape)
+        try:
+            with run_recorder.span('detail_fetch', level=self.jlpt_level, lesson_type=self.LESSON_TYPE):
+                scraped = self.fetch_engine.map(self.scrape_sentence, [row for _, row in rows_to_scrape])
+        finally:
+            self.close()
+        for (i, _), sentence in zip(rows_to_scrape, scraped):
+            sentences[i] = sentence
+
+        for i, sentence in enumerate(sentences):
+            if sentence is not None:
+                self.scraped_rows.set(i, 'Sentence JP', sentence[0])
+                self.scraped_rows.set(i, 'Sentence EN', sentence[1])
+
+
+    def scrape_sentence(self, row: Tuple[str, str, str]) -> Optional[Tuple[str, str]]:
+        try:
+            return self.fetch_sentence(row)
+        except URLError as e:
+            print(e)
+            return None
+
+
+    def fetch_sentence(self, row: Tuple[str, str, str]) -> Optional[Tuple[str, str]]:
+        """
+        Scrape every example sentence from a vocabulary's page into the sentence store, returning the one picked (JP, EN).
+        Network errors are raised
+        """
+        v_index, vocab, vocab_reading = row
 
-        # visit each vocabulary link for examples sentences
-        for vocab in self.scraped_df['Vocabulary']:
-            i += 1
+        with self.progress_lock:
+            self.scraped_sentences += 1
+            # a streamed scrape doesn't know how many are left
+            total = f"/{self.sentences_to_scrape}" if self.sentences_to_scrape else ''
+            print(f"Scraping sentence {self.scraped_sentences}{total}", end="\r")
 
-            print(f"Scraping sentence {i}/{len(self.scraped_df.index)}", end="\r")
-            
-            try:
-                html = urlopen(f"https://jlptsensei.com/learn-japanese-vocabulary/{urllib.parse.quote(vocab)}")
-            except HTTPError as e:
-                try:
-                    # some links can't be followed directly with only the vocab
-                    # need to append "japanese-meaning-of-" before vocab
-                    html = urlopen(f"https://jlptsensei.com/learn-japanese-vocabulary/japanese-meaning-of-{urllib.parse.quote(vocab)}")
-                except HTTPError as e:
-                    try:
-                        html = urlopen(f"https://jlptsensei.com/learn-japanese-vocabulary/jlpt-{self.jlpt_level}-vocabulary-{urllib.parse.quote(vocab)}")
-                    except HTTPError as e:
-                        try:
-                            # replace vocab with its reading with furigana
-                            vocab_reading = self.scraped_df.loc[self.scraped_df['Vocabulary'] == vocab]['Reading']
-                            html = urlopen(f"https://jlptsensei.com/learn-japanese-vocabulary/{urllib.parse.quote(vocab_reading)}")
-                        except HTTPError as e:
-                            # dealing with more exceptional cases
-                            # where the scraped vocab uses a different form in url
-                            if vocab == "晩ご飯":
-                                try:
-                                    html = urlopen(f"https://jlptsensei.com/learn-japanese-vocabulary/{urllib.parse.quote('晩御飯')}")
-                                except HTTPError as e:
-                                    print(f"{e} for #{self.scraped_df.at[i, '#']} {self.scraped_df.at[i, 'Vocabulary']}")
-                                    continue
-                            else:
-                                print(f"{e} for #{self.scraped_df.at[i, '#']} {self.scraped_df.at[i, 'Vocabulary']}")
-                                continue
-            except URLError as e:
-                print(e)
-                continue
-        
-            bs = BeautifulSoup(html, 'lxml')
+        # the resolver knows which url form worked for this entry last time, and tries the others only if needed
+        html = self.url_resolver.resolve(vocab, vocab_reading)
 
-            try:
-                example_elements = bs.find_all('div', {'class': 'example-cont'})
-                if len(example_elements) == 0:
-                    # if no example sentences are found, then move on
-                    raise AttributeError
-
-            except AttributeError as e:
-                print(f"No example sentences found for #{self.scraped_df.at[i, '#']} {self.scraped_df.at[i, 'Vocabulary']}")
-                continue
-
-            # choose a random example sentence to scrape
-            rand_example_i = randint(0, len(example_elements)-1)
-            jp_sentence_element = example_elements[rand_example_i].find('div', {'class': 'example-main'})
-            en_sentence_element = example_elements[rand_example_i].find('div', {'id': f'example_{rand_example_i+1}_en'})
-
-            self.scraped_df.at[i, 'Sentence JP'] = jp_sentence_element.text
-            self.scraped_df.at[i, 'Sentence EN'] = en_sentence_element.string
-
-        return self.scraped_df
-
-    # def add_example_sentence_row(self, df_row):
-    #     """
-    #     Take advantage of multiprocessing to speed up sentence scraping process
-    #     (doesn't work)
-    #     """
-
-    #     # print(df_row)
-    #     scraped_sentences += 1
-    #     print(f"Scraped {scraped_sentences}/{total_vocab} sentences", end="\r")
-
-    #     try:
-    #         html = urlopen(f"https://jlptsensei.com/learn-japanese-vocabulary/{urllib.parse.quote(df_row[2])}")
-    #     except HTTPError as e:
-    #         print(f"{e} for #{df_row[1]} {df_row[2]}")
-    #         return df_row
-    #     except URLError as e:
-    #         print(f"{e} for #{df_row[1]} {df_row[2]}")
-    #         return df_row
-        
-    #     bs = BeautifulSoup(str(html), 'lxml')
-
-    #     try:
-    #         example_elements = bs.find_all('div', {'class': 'example-cont'})
-    #         if len(example_elements) == 0:
-    #             # if no example sentences are found raise exception
-    #             raise AttributeError
-    #     except AttributeError as e:
-    #         print(f"No example sentences found for #{df_row[1]} {df_row[2]}")
-    #         return df_row
-
-    #     # choose a random example sentence to scrape
-    #     rand_example_i = randint(0, len(example_elements)-1)
-    #     jp_sentence_element = example_elements[rand_example_i].find('div', {'class': 'example-main'})
-    #     en_sentence_element = example_elements[rand_example_i].find('div', {'id': f'example_{rand_example_i+1}_en'})
-
-    #     new_df_row = list(df_row)
-    #     new_df_row.append(jp_sentence_element.text)
-    #     new_df_row.append(en_sentence_element.string)
-
-    #     return new_df_row
+        if html is None:
+            print(f"No vocabulary page found for #{v_index} {vocab}")
+            self.journal.record('sentence', (vocab, vocab_reading), None)
+            return None
+
+        with run_recorder.span('parse', level=self.jlpt_level, lesson_type=self.LESSON_TYPE, page='vocabulary'):
+            examples = extract_examples(html)
+        # picked from the examples as stored, without repeats, so the pick is the one the deck generators make
+        examples = self.sentence_store.put(vocab, vocab_reading, examples)
+
+        if len(examples) == 0:
+            # if no example sentences are found, then move on
+            print(f"No example sentences found for #{v_index} {vocab}")
+            self.journal.record('sentence', (vocab, vocab_reading), None)
+            return None
+
+        sentence = pick_sentence(examples, vocab, vocab_reading)
+        self.journal.record('sentence', (vocab, vocab_reading), sentence)
+
+        return sentence
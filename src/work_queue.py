@@ -0,0 +1,526 @@
+"""
+Scraping through a durable work queue shared by any number of worker processes
+
+List pages, vocabulary page lookups, grammar lessons and flashcard image downloads are tasks in a SQLite database.
+Workers, on this host or on others that share the database and the data directory, claim tasks under a lease, so a
+task whose worker died is claimed again once its lease runs out, and failed tasks are retried with backoff. Each task
+is keyed by what it fetches, so adding it twice or finishing it twice changes nothing. A finished list page adds the
+tasks for its rows, and a coordinator seeds the first page of each list, waits for the queue to drain and assembles
+the per-level CSV files from the results.
+
+Each task runs through the scrapers' own per-row methods, so a queued scrape reuses the sentences, images and
+journal of earlier runs the way a batch scrape does.
+
+Run `python -m src.work_queue coordinate --workers 4` to scrape with local workers, and
+`python -m src.work_queue work` on other hosts to help. SQLite locking needs a filesystem that supports it, and the
+hosts' clocks need to roughly agree for leases to expire on time.
+"""
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from src.fetch_engine import FetchEngine
+from src.http_cache import HTTPCache
+from src.row_accumulator import RowAccumulator
+from src.checkpoint_journal import CheckpointJournal
+from src.instrumentation import run_recorder
+from src.vocabulary_scraper import VocabularyScraper
+from src.grammar_scraper import GrammarScraper
+from src.jlptsensei_scraper import JLPTSenseiScraper, save_list
+
+
+LEVELS = ['n5', 'n4', 'n3', 'n2', 'n1']
+LESSON_TYPES = ['vocabulary', 'grammar']
+
+SCRAPERS = {
+    'vocabulary': VocabularyScraper,
+    'grammar': GrammarScraper,
+}
+# tasks whose results go into a list's rows, besides its list pages
+ROW_TASK_KINDS = {
+    'vocabulary': ['sentence'],
+    'grammar': [],
+}
+# the run report span each kind of task is timed under, as in a batch scrape
+TASK_SPANS = {
+    'list_page': 'pagination',
+    'sentence': 'detail_fetch',
+    'lesson': 'detail_fetch',
+    'image': 'image_download',
+}
+
+
+class Task(NamedTuple):
+    id: int
+    kind: str
+    key: str
+    level: str
+    lesson_type: str
+    payload: dict
+    attempts: int
+
+
+# (kind, key, level, lesson type, payload) of a task to add
+NewTask = Tuple[str, str, str, str, dict]
+
+
+def list_page_task(base_url: str, level: str, lesson_type: str, page: int, probe: bool = False) -> NewTask:
+    return ('list_page', f'{level}\t{lesson_type}\t{page}', level, lesson_type, {'base_url': base_url, 'page': page, 'probe': probe})
+
+
+class WorkQueue:
+    """
+    Tasks in a SQLite database, claimed under leases and finished at most once
+    """
+    def __init__(self, db_path: str = './data/work_queue.sqlite3', lease_seconds: float = 120.0, max_attempts: int = 5,
+                 backoff_seconds: float = 2.0) -> None:
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+
+        Path(os.path.dirname(db_path) or '.').mkdir(parents=True, exist_ok=True)
+        # every process has its own connection, whose transactions wait on each other's
+        self._conn = sqlite3.connect(db_path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode = WAL')
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    level TEXT NOT NULL,
+                    lesson_type TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    result TEXT,
+                    error TEXT,
+                    UNIQUE (kind, key)
+                )
+            """)
+            self._conn.execute('CREATE INDEX IF NOT EXISTS tasks_by_state ON tasks (state, available_at)')
+
+
+    def add(self, tasks: Iterable[NewTask]) -> None:
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._add(tasks)
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+
+    def claim(self, owner: str, limit: int) -> List[Task]:
+        """
+        Lease up to limit tasks that are waiting, or whose lease has run out. A task whose lease ran out on its last
+        attempt is given up on like a failed one, so a task that keeps killing its worker can't hold up the run forever
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute("""
+                    UPDATE tasks SET state = 'failed', error = 'lease expired on the last attempt', lease_owner = NULL
+                    WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?
+                """, (now, self.max_attempts))
+                rows = self._conn.execute("""
+                    SELECT id, kind, key, level, lesson_type, payload, attempts FROM tasks
+                    WHERE (state = 'pending' AND available_at <= ?) OR (state = 'leased' AND lease_expires < ?)
+                    ORDER BY id LIMIT ?
+                """, (now, now, limit)).fetchall()
+                self._conn.executemany(
+                    "UPDATE tasks SET state = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                    [(owner, now + self.lease_seconds, row[0]) for row in rows],
+                )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+        return [
+            Task(task_id, kind, key, level, lesson_type, json.loads(payload), attempts + 1)
+            for task_id, kind, key, level, lesson_type, payload, attempts in rows
+        ]
+
+
+    def complete(self, task: Task, owner: str, result: Any, follow_ups: Sequence[NewTask] = ()) -> bool:
+        """
+        Save a task's result and add the tasks it led to, unless its lease was lost and someone else has finished it
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                updated = self._conn.execute(
+                    "UPDATE tasks SET state = 'done', result = ?, error = NULL, lease_owner = NULL WHERE id = ? AND state = 'leased' AND lease_owner = ?",
+                    (json.dumps(result, ensure_ascii=False), task.id, owner),
+                ).rowcount
+                if updated:
+                    self._add(follow_ups)
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+        return bool(updated)
+
+
+    def fail(self, task: Task, owner: str, error: str) -> None:
+        """
+        Put a task back for a later attempt after a backoff, or give up on it after max_attempts
+        """
+        state = 'failed' if task.attempts >= self.max_attempts else 'pending'
+        available_at = time.time() + self.backoff_seconds * 2 ** (task.attempts - 1)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET state = ?, available_at = ?, error = ?, lease_owner = NULL WHERE id = ? AND state = 'leased' AND lease_owner = ?",
+                (state, available_at, error, task.id, owner),
+            )
+
+
+    def counts(self, levels: Optional[Sequence[str]] = None, lesson_types: Optional[Sequence[str]] = None,
+               kinds: Optional[Sequence[str]] = None) -> Counter:
+        """
+        Tasks by state, optionally only those of some lists or kinds
+        """
+        query, params = self._where(levels, lesson_types, kinds)
+        with self._lock:
+            return Counter(dict(self._conn.execute(f'SELECT state, COUNT(*) FROM tasks{query} GROUP BY state', params)))
+
+
+    def results(self, kind: str, level: str, lesson_type: str) -> List[Tuple[str, dict, str, Any]]:
+        """
+        (key, payload, state, result) of a list's tasks of one kind
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT key, payload, state, result FROM tasks WHERE kind = ? AND level = ? AND lesson_type = ?',
+                (kind, level, lesson_type),
+            ).fetchall()
+        return [(key, json.loads(payload), state, None if result is None else json.loads(result)) for key, payload, state, result in rows]
+
+
+    def reset(self, level: str, lesson_type: str) -> None:
+        """
+        Forget a list's tasks so it is scraped afresh
+        """
+        with self._lock:
+            self._conn.execute('DELETE FROM tasks WHERE level = ? AND lesson_type = ?', (level, lesson_type))
+
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+    def _add(self, tasks: Iterable[NewTask]) -> None:
+        # a task already added, or already done, is left as it is
+        self._conn.executemany(
+            'INSERT OR IGNORE INTO tasks (kind, key, level, lesson_type, payload) VALUES (?, ?, ?, ?, ?)',
+            [(kind, key, level, lesson_type, json.dumps(payload, ensure_ascii=False)) for kind, key, level, lesson_type, payload in tasks],
+        )
+
+
+    def _where(self, levels: Optional[Sequence[str]], lesson_types: Optional[Sequence[str]],
+               kinds: Optional[Sequence[str]] = None) -> Tuple[str, tuple]:
+        clauses, params = [], []
+        for column, values in (('level', levels), ('lesson_type', lesson_types), ('kind', kinds)):
+            if values:
+                clauses.append(f"{column} IN ({', '.join('?' for _ in values)})")
+                params += values
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), tuple(params)
+
+
+class QueueWorker:
+    """
+    Claims tasks in batches and runs each batch concurrently on a fetch engine
+    """
+    def __init__(self, work_queue: WorkQueue, fetch_engine: FetchEngine, owner: Optional[str] = None) -> None:
+        self.work_queue = work_queue
+        self.fetch_engine = fetch_engine
+        self.owner = owner or f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}'
+
+        # per list and site, made on first use
+        self.scrapers: Dict[Tuple[str, str, str], JLPTSenseiScraper] = {}
+        self._lock = threading.Lock()
+
+        self.handlers = {
+            'list_page': self.list_page,
+            'sentence': self.sentence,
+            'lesson': self.lesson,
+            'image': self.image,
+        }
+
+
+    def run(self, exit_when_idle: bool = True, poll_seconds: float = 1.0) -> int:
+        """
+        Work through tasks until there are none left, or forever, returning how many were finished
+        """
+        finished = 0
+        try:
+            while True:
+                tasks = self.work_queue.claim(self.owner, self.fetch_engine.max_workers * 2)
+                if not tasks:
+                    counts = self.work_queue.counts()
+                    # tasks leased by other workers may still add more
+                    if exit_when_idle and not counts['pending'] and not counts['leased']:
+                        return finished
+                    # the next tasks may be for another run, which starts from what this one saved
+                    self.close()
+                    time.sleep(poll_seconds)
+                    continue
+
+                for task, outcome in zip(tasks, self.fetch_engine.map(self.run_task, tasks)):
+                    ok, result, follow_ups = outcome
+                    if ok:
+                        finished += self.work_queue.complete(task, self.owner, result, follow_ups)
+                    else:
+                        self.work_queue.fail(task, self.owner, result)
+                print(f"{self.owner} finished {finished} tasks", end='\r')
+        finally:
+            self.close()
+
+
+    def run_task(self, task: Task) -> Tuple[bool, Any, List[NewTask]]:
+        """
+        Run a task's handler, returning whether it worked and its result and follow-up tasks, or the error
+        """
+        try:
+            with run_recorder.span(TASK_SPANS[task.kind], level=task.level, lesson_type=task.lesson_type):
+                result, follow_ups = self.handlers[task.kind](task)
+        except Exception as e:
+            print(f"{task.kind} {task.key!r} failed: {e!r}")
+            return False, repr(e), []
+        return True, result, follow_ups
+
+
+    def list_page(self, task: Task) -> Tuple[Any, List[NewTask]]:
+        base_url, page = task.payload['base_url'], task.payload['page']
+        scraper = self.scraper(task.level, task.lesson_type, base_url)
+        list_url = scraper.list_url()
+
+        # a missing page is past the end of the list, any other failure is raised and retried
+        rows = scraper.fetch_list_page(list_url, page)
+        if rows is None:
+            return {'rows': None}, []
+
+        follow_ups = []
+        if page == 1:
+            page_count = scraper.journal.get('page_count', list_url)
+            if page_count is not None:
+                follow_ups += [list_page_task(base_url, task.level, task.lesson_type, n) for n in range(2, page_count+1)]
+            else:
+                # no pagination links to go by, so each page found adds the one after it
+                follow_ups.append(list_page_task(base_url, task.level, task.lesson_type, 2, probe=True))
+        elif task.payload['probe']:
+            follow_ups.append(list_page_task(base_url, task.level, task.lesson_type, page + 1, probe=True))
+
+        for row in rows:
+            df_row = dict(zip(scraper.COLUMN_NAMES, row))
+            if task.lesson_type == 'vocabulary':
+                key = f"{task.level}\t{df_row['Vocabulary']}\t{df_row['Reading'] or ''}"
+                follow_ups.append(('sentence', key, task.level, task.lesson_type, {'base_url': base_url, 'row': df_row}))
+            else:
+                follow_ups.append(('lesson', f"{task.level}\t{df_row['#']}", task.level, task.lesson_type, {'base_url': base_url, 'row': df_row}))
+
+        return {'rows': rows}, follow_ups
+
+
+    def sentence(self, task: Task) -> Tuple[Any, List[NewTask]]:
+        scraper = self.scraper(task.level, task.lesson_type, task.payload['base_url'])
+        return {'sentence': scraper.row_sentence(task.payload['row'])}, []
+
+
+    def lesson(self, task: Task) -> Tuple[Any, List[NewTask]]:
+        scraper = self.scraper(task.level, task.lesson_type, task.payload['base_url'])
+        df_row = task.payload['row']
+        if not scraper.needs_image(df_row):
+            return {'image_url': None}, []
+
+        image_url = scraper.find_image(df_row)
+        if image_url is None:
+            return {'image_url': None}, []
+
+        return {'image_url': image_url}, [('image', scraper.image_path(df_row), task.level, task.lesson_type, {
+            'base_url': task.payload['base_url'], 'row': df_row, 'url': image_url,
+        })]
+
+
+    def image(self, task: Task) -> Tuple[Any, List[NewTask]]:
+        scraper = self.scraper(task.level, task.lesson_type, task.payload['base_url'])
+        if not scraper.save_image(task.payload['row'], task.payload['url']):
+            raise RuntimeError(f"couldn't download {task.payload['url']}")
+        return {'saved': True}, []
+
+
+    def scraper(self, level: str, lesson_type: str, base_url: str) -> JLPTSenseiScraper:
+        with self._lock:
+            if (level, lesson_type, base_url) not in self.scrapers:
+                scraper = SCRAPERS[lesson_type](level, self.fetch_engine, base_url)
+                if isinstance(scraper, VocabularyScraper):
+                    scraper.load_known_sentences()
+                self.scrapers[(level, lesson_type, base_url)] = scraper
+            return self.scrapers[(level, lesson_type, base_url)]
+
+
+    def close(self) -> None:
+        # workers sharing a data directory each save what they learned, the last one to save wins
+        with self._lock:
+            scrapers, self.scrapers = list(self.scrapers.values()), {}
+        for scraper in scrapers:
+            scraper.close()
+
+
+class QueueCoordinator:
+    """
+    Seeds the queue with each list's first page, waits for it to drain and saves the lists from the results
+    """
+    def __init__(self, work_queue: WorkQueue, levels: List[str], lesson_types: List[str], base_url: str = None) -> None:
+        self.work_queue = work_queue
+        self.levels = levels
+        self.lesson_types = lesson_types
+        self.base_url = (base_url or JLPTSenseiScraper.BASE_URL).rstrip('/')
+
+
+    def seed(self, resume: bool = False) -> None:
+        for level in self.levels:
+            for lesson_type in self.lesson_types:
+                if not resume:
+                    self.work_queue.reset(level, lesson_type)
+                self.work_queue.add([list_page_task(self.base_url, level, lesson_type, 1)])
+
+
+    def wait(self, poll_seconds: float = 1.0, workers: Sequence[subprocess.Popen] = ()) -> Counter:
+        """
+        Wait until none of the lists' tasks are waiting or leased, returning the final counts
+        """
+        while True:
+            counts = self.work_queue.counts(self.levels, self.lesson_types)
+            print(f"Tasks: {counts['done']} done, {counts['pending']} waiting, {counts['leased']} leased, {counts['failed']} failed", end='\r')
+            if not counts['pending'] and not counts['leased']:
+                print()
+                return counts
+            if workers and all(worker.poll() is not None for worker in workers):
+                # nobody is left to drain the queue, tasks with a backoff would only be picked up by new workers
+                print("\nEvery worker has exited with tasks left")
+                return counts
+            time.sleep(poll_seconds)
+
+
+    def assemble(self) -> bool:
+        """
+        Save every list all of whose tasks finished, returning whether they all did
+        """
+        complete = True
+        for level in self.levels:
+            for lesson_type in self.lesson_types:
+                # the rows all come from list pages, a sentence, lesson or image that couldn't be fetched only
+                # leaves a gap in its row or deck, as in a batch scrape
+                pages = self.work_queue.counts([level], [lesson_type], ['list_page'])
+                rows = self.work_queue.counts([level], [lesson_type], ['list_page', *ROW_TASK_KINDS[lesson_type]])
+                if pages['failed'] or rows['pending'] or rows['leased']:
+                    print(f"{level.capitalize()} {lesson_type} has unfinished tasks ({dict(rows)}), its list is left as it was")
+                    complete = False
+                    continue
+
+                failed = self.work_queue.counts([level], [lesson_type])['failed']
+                if failed:
+                    print(f"{level.capitalize()} {lesson_type}: {failed} sentence, lesson or image tasks failed")
+                save_list(level, lesson_type, self.list_rows(level, lesson_type))
+                # as when a batch scrape finishes, the next run starts from the saved list
+                CheckpointJournal(level, lesson_type).clear()
+        return complete
+
+
+    def list_rows(self, level: str, lesson_type: str) -> RowAccumulator:
+        pages = sorted(
+            (payload['page'], result['rows']) for _, payload, _, result in self.work_queue.results('list_page', level, lesson_type)
+        )
+        scraped_rows = RowAccumulator(SCRAPERS[lesson_type].COLUMN_NAMES)
+        # pages up to the first one past the end of the list
+        for _, rows in pages:
+            if rows is None:
+                break
+            for row in rows:
+                scraped_rows.append(row)
+
+        if lesson_type == 'vocabulary':
+            sentences = {
+                key: result['sentence'] for key, _, state, result in self.work_queue.results('sentence', level, lesson_type) if state == 'done'
+            }
+            for i, df_row in enumerate(scraped_rows.records()):
+                sentence = sentences.get(f"{level}\t{df_row['Vocabulary']}\t{df_row['Reading'] or ''}")
+                if sentence is not None:
+                    scraped_rows.set(i, 'Sentence JP', sentence[0])
+                    scraped_rows.set(i, 'Sentence EN', sentence[1])
+
+        return scraped_rows
+
+
+def worker_command(args: argparse.Namespace) -> List[str]:
+    return [
+        sys.executable, '-m', 'src.work_queue', 'work', '--db', args.db,
+        '--concurrency', str(args.concurrency), '--rate', str(args.rate), '--lease', str(args.lease),
+    ]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Scrape through a work queue shared by any number of worker processes.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    coordinate = subparsers.add_parser('coordinate', help="seed the queue, wait for it to drain and save the lists")
+    coordinate.add_argument('--levels', nargs='+', choices=LEVELS, default=['n5', 'n4'])
+    coordinate.add_argument('--types', nargs='+', choices=LESSON_TYPES, default=LESSON_TYPES)
+    coordinate.add_argument('--base-url', default=None, help="site to scrape (default: https://jlptsensei.com)")
+    coordinate.add_argument('--workers', type=int, default=0, help="worker processes to start on this host")
+    coordinate.add_argument('--resume', action='store_true', help="carry on with the lists' tasks from an interrupted run")
+
+    work = subparsers.add_parser('work', help="claim and run tasks until the queue is empty")
+    work.add_argument('--forever', action='store_true', help="keep waiting for new tasks instead of exiting once there are none")
+
+    for subparser in (coordinate, work):
+        subparser.add_argument('--db', default='./data/work_queue.sqlite3', help="queue database, shared by every worker")
+        subparser.add_argument('--concurrency', type=int, default=8, help="concurrent requests per worker")
+        subparser.add_argument('--rate', type=float, default=10.0, help="maximum requests per second per worker")
+        subparser.add_argument('--lease', type=float, default=120.0, help="seconds a worker holds a task before others may claim it")
+    args = parser.parse_args(argv)
+
+    work_queue = WorkQueue(args.db, lease_seconds=args.lease)
+
+    if args.command == 'work':
+        fetch_engine = FetchEngine(args.concurrency, args.rate, cache=HTTPCache())
+        finished = QueueWorker(work_queue, fetch_engine).run(exit_when_idle=not args.forever)
+        fetch_engine.close()
+        print(f"\nFinished {finished} tasks")
+        return 0
+
+    coordinator = QueueCoordinator(work_queue, args.levels, args.types, args.base_url)
+    coordinator.seed(args.resume)
+    workers = [subprocess.Popen(worker_command(args), stdout=subprocess.DEVNULL) for _ in range(args.workers)]
+    try:
+        coordinator.wait(workers=workers)
+    finally:
+        for worker in workers:
+            worker.wait()
+
+    return 0 if coordinator.assemble() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
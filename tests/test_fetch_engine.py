@@ -0,0 +1,152 @@
+"""
+Retries, Retry-After and the adaptive concurrency cap of src/fetch_engine.py, against the local mock site
+"""
+from email.utils import formatdate
+from urllib.error import HTTPError
+import time
+
+import pytest
+
+from benchmarks.mock_site import MockSite
+from src.fetch_engine import MAX_RETRY_AFTER, FetchEngine
+
+
+PAGE = '/jlpt-n5-grammar-list/page/1'
+
+
+@pytest.fixture
+def engines():
+    engines = []
+    def make(*args, **kwargs) -> FetchEngine:
+        engines.append(FetchEngine(*args, **kwargs))
+        return engines[-1]
+    yield make
+    for engine in engines:
+        engine.close()
+
+
+def serve(**faults) -> MockSite:
+    return MockSite(port=0, pages={'n5': 2}, **faults).start()
+
+
+def test_failing_requests_are_retried_until_they_give_up(engines):
+    site = serve(error_rate=1.0)
+    engine = engines(4, 1000.0, max_retries=2, backoff_seconds=0.01)
+    try:
+        with pytest.raises(HTTPError) as error:
+            engine.fetch(site.base_url + PAGE)
+    finally:
+        site.stop()
+
+    assert error.value.code == 503
+    assert site.stats['requests'] == 3
+    summary = engine.metrics.summary()
+    assert (summary['requests'], summary['attempts'], summary['retries']) == (1, 3, 2)
+    assert summary['statuses'] == {'503': 1}
+
+
+def test_retries_see_intermittent_errors_through(engines):
+    site = serve(error_rate=0.5, seed=3)
+    engine = engines(4, 1000.0, max_retries=10, backoff_seconds=0.01)
+    try:
+        for _ in range(10):
+            assert engine.fetch(site.base_url + PAGE)
+    finally:
+        site.stop()
+
+    summary = engine.metrics.summary()
+    assert site.stats['error'] > 0
+    # every 503 the site sent was retried, and every fetch ended with the page
+    assert summary['retries'] == site.stats['error']
+    assert summary['statuses'] == {'200': 10}
+
+
+def test_missing_page_is_not_retried(engines):
+    site = serve(error_rate=0.0)
+    engine = engines(4, 1000.0, max_retries=4, backoff_seconds=0.01)
+    try:
+        with pytest.raises(HTTPError) as error:
+            engine.fetch(site.base_url + '/jlpt-n5-grammar-list/page/3')
+    finally:
+        site.stop()
+
+    assert error.value.code == 404
+    assert site.stats['requests'] == 1
+    assert engine.metrics.summary()['attempts'] == 1
+
+
+@pytest.mark.parametrize('form', ['seconds', 'http date'])
+def test_retry_after_is_waited_out(engines, form):
+    # whole seconds either way, an http date has no finer precision
+    retry_after = 1 if form == 'seconds' else formatdate(time.time() + 2, usegmt=True)
+    # two requests a second, the third is throttled until the window has passed
+    site = serve(rate_limit=2, retry_after=retry_after)
+    engine = engines(1, 1000.0, max_retries=4, backoff_seconds=0.01)
+    try:
+        for _ in range(2):
+            engine.fetch(site.base_url + PAGE)
+        start = time.monotonic()
+        assert engine.fetch(site.base_url + PAGE)
+        waited = time.monotonic() - start
+    finally:
+        site.stop()
+
+    assert site.stats['throttle'] == 1
+    assert waited >= 0.9
+    summary = engine.metrics.summary()
+    assert summary['retries'] == 1 and summary['statuses'] == {'200': 3}
+    # throttling also cuts the host's request rate
+    assert engine.rate_limiter.rate(f'127.0.0.1:{site.port}') < 1000.0
+
+
+def test_retry_after_past_the_limit_gives_up(engines):
+    site = serve(rate_limit=1, retry_after=int(MAX_RETRY_AFTER) + 1)
+    engine = engines(1, 1000.0, max_retries=4, backoff_seconds=0.01)
+    try:
+        engine.fetch(site.base_url + PAGE)
+        start = time.monotonic()
+        with pytest.raises(HTTPError) as error:
+            engine.fetch(site.base_url + PAGE)
+        waited = time.monotonic() - start
+    finally:
+        site.stop()
+
+    assert error.value.code == 429
+    assert waited < 1.0
+    assert site.stats['requests'] == 2
+    assert engine.metrics.summary()['attempts'] == 2
+
+
+def test_concurrency_limit_halves_once_per_round_trip_and_recovers(engines):
+    # slow enough that every request of the batch is still in flight when the first fails
+    site = serve(error_rate=1.0, latency=0.2)
+    engine = engines(8, 1000.0, max_retries=0)
+    try:
+        outcomes = engine.map(lambda _: pytest.raises(HTTPError, engine.fetch, site.base_url + PAGE), range(8))
+        assert all(outcome.value.code == 503 for outcome in outcomes)
+        assert engine.concurrency.limit == 4
+
+        site.error_rate, site.latency = 0.0, 0.0
+        limits = []
+        for _ in range(30):
+            engine.fetch(site.base_url + PAGE)
+            limits.append(engine.concurrency.limit)
+    finally:
+        site.stop()
+
+    # each good response adds one over the current limit, up to the engine's worker count
+    assert limits == sorted(limits)
+    assert limits[0] == 4.25
+    assert limits[-1] == 8
+
+
+def test_fixed_concurrency_limit_without_adaptive(engines):
+    site = serve(error_rate=1.0)
+    engine = engines(8, 1000.0, max_retries=0, adaptive=False)
+    try:
+        with pytest.raises(HTTPError):
+            engine.fetch(site.base_url + PAGE)
+    finally:
+        site.stop()
+
+    assert engine.concurrency.limit == 8
@@ -0,0 +1,105 @@
+"""
+Leases, reclaiming and finishing tasks at most once in src/work_queue.py, against the local mock site
+"""
+import os
+import threading
+import time
+
+import pytest
+
+from benchmarks.mock_site import MockSite
+from benchmarks.record_fixtures import REPO_DIR
+from src.fetch_engine import FetchEngine
+from src.work_queue import QueueCoordinator, QueueWorker, WorkQueue, list_page_task
+
+
+LEASE_SECONDS = 0.2
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # the scrapers read their rules from ./src and write to ./data
+    os.symlink(os.path.join(REPO_DIR, 'src'), tmp_path / 'src')
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def site():
+    site = MockSite(port=0, pages={'n5': 2}).start()
+    yield site
+    site.stop()
+
+
+def test_expired_lease_is_reclaimed_and_finished_once(workdir):
+    work_queue = WorkQueue('./data/work_queue.sqlite3', lease_seconds=LEASE_SECONDS)
+    work_queue.add([list_page_task('http://127.0.0.1', 'n5', 'grammar', 1)])
+
+    task, = work_queue.claim('first', 10)
+    # leased tasks aren't handed out again until their lease runs out
+    assert work_queue.claim('second', 10) == []
+
+    time.sleep(LEASE_SECONDS * 1.5)
+    reclaimed, = work_queue.claim('second', 10)
+    assert reclaimed.id == task.id
+    assert reclaimed.attempts == 2
+
+    follow_up = list_page_task('http://127.0.0.1', 'n5', 'grammar', 2)
+    # the first worker lost its lease, so its late result is dropped
+    assert not work_queue.complete(task, 'first', {'rows': []}, [follow_up])
+    assert work_queue.complete(reclaimed, 'second', {'rows': []}, [follow_up])
+    assert not work_queue.complete(reclaimed, 'second', {'rows': []}, [follow_up])
+
+    assert work_queue.counts() == {'done': 1, 'pending': 1}
+    work_queue.close()
+
+
+def test_expired_lease_on_last_attempt_fails(workdir):
+    work_queue = WorkQueue('./data/work_queue.sqlite3', lease_seconds=LEASE_SECONDS, max_attempts=2)
+    work_queue.add([('image', 'flashcard1.jpg', 'n5', 'grammar', {})])
+
+    for _ in range(2):
+        assert len(work_queue.claim('crashing', 10)) == 1
+        time.sleep(LEASE_SECONDS * 1.5)
+
+    assert work_queue.claim('next', 10) == []
+    assert work_queue.counts() == {'failed': 1}
+    work_queue.close()
+
+
+def test_workers_drain_queue_after_a_worker_dies(workdir, site):
+    db_path = './data/work_queue.sqlite3'
+    coordinator = QueueCoordinator(WorkQueue(db_path, lease_seconds=LEASE_SECONDS), ['n5'], ['vocabulary', 'grammar'], site.base_url)
+    coordinator.seed()
+
+    # a worker that claims the first pages and dies without finishing them
+    abandoned = WorkQueue(db_path, lease_seconds=LEASE_SECONDS).claim('dead', 10)
+    assert len(abandoned) == 2
+
+    finished = []
+    def work() -> None:
+        fetch_engine = FetchEngine(4, 500.0)
+        finished.append(QueueWorker(WorkQueue(db_path, lease_seconds=LEASE_SECONDS), fetch_engine).run(poll_seconds=0.05))
+        fetch_engine.close()
+
+    workers = [threading.Thread(target=work) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+
+    counts = coordinator.work_queue.counts()
+    assert counts['pending'] == counts['leased'] == counts['failed'] == 0
+    # every task was finished exactly once, the abandoned ones by whichever worker reclaimed them
+    assert sum(finished) == counts['done']
+    for task in abandoned:
+        _, _, state, result = next(
+            result for result in coordinator.work_queue.results('list_page', task.level, task.lesson_type) if result[0] == task.key
+        )
+        assert state == 'done' and result['rows']
+
+    assert coordinator.assemble()
+    for lesson_type in ('vocabulary', 'grammar'):
+        with open(f'./data/{lesson_type}/n5_{lesson_type}_list.csv', encoding='utf8') as f:
+            # a header and 10 rows per page
+            assert len(f.readlines()) == 1 + 2 * 10